@@ -1,12 +1,11 @@
-from math import floor
-
 from flask import request
 from flask_restful import Resource
 from pydantic import ValidationError
+from pylon.core.tools import log
 
 from tools import session_project, api_tools
-from ...models.integration_pd import IntegrationModel
-from ...utils import get_core_api, get_cluster_capacity
+from ...models.integration_pd import IntegrationModel, capacity_in_cores
+from ...utils import get_core_api, capacity_collector, autoscaling_planner
 
 
 class ProjectAPI(api_tools.APIModeHandler):
@@ -40,9 +39,14 @@ class API(api_tools.APIBase):
             settings.secure_connection
         )
         try:
-            capacity = get_cluster_capacity(core_api, settings.namespace)
+            capacity = capacity_collector.collect(core_api, settings.namespace)
         except Exception as e:
             return str(e), 400
-        capacity["cpu"] = floor(capacity["cpu"] / 1000)
-        capacity["memory"] = floor(capacity["memory"] / 1024)
+        capacity = capacity_in_cores(capacity)
+        if settings.scaling_cluster and autoscaling_planner.enabled:
+            try:
+                capacity["autoscaling"] = {"node_groups": settings.get_node_groups()}
+            except Exception as e:
+                log.warning("Failed to read the node groups of %s: %s", settings.hostname, e)
+                capacity["autoscaling"] = None
         return capacity, 200
@@ -0,0 +1,62 @@
+import json
+from typing import Iterator
+
+from flask import Response, request, stream_with_context
+from pydantic import ValidationError
+
+from tools import session_project, api_tools
+from ...models.integration_pd import CapacityBatchModel
+
+
+class ProjectAPI(api_tools.APIModeHandler):
+    ...
+
+
+class AdminAPI(api_tools.APIModeHandler):
+    ...
+
+
+class API(api_tools.APIBase):
+    url_params = [
+        '<string:mode>',
+        ''
+    ]
+
+    mode_handlers = {
+        'default': ProjectAPI,
+        'administration': AdminAPI,
+    }
+
+    def post(self, mode):
+        try:
+            batch = CapacityBatchModel.parse_obj(request.json)
+        except ValidationError as e:
+            return e.errors(), 400
+
+        project_id = session_project.get()
+
+        def get_integration(integration_id: int) -> dict:
+            return self.module.context.rpc_manager.call.integrations_get_by_id(
+                project_id, integration_id
+            ).settings
+
+        try:
+            # resolved before streaming, so a bad integration is still a 400
+            targets = batch.targets(get_integration)
+            if request.args.get('stream', '').lower() in ('1', 'true'):
+                return Response(
+                    stream_with_context(self._stream(batch, targets)),
+                    mimetype='application/x-ndjson'
+                )
+            return {"clusters": list(batch.iter_clusters(targets))}, 200
+        except Exception as e:
+            return str(e), 400
+
+    @staticmethod
+    def _stream(batch: CapacityBatchModel, targets: list) -> Iterator[str]:
+        """ One NDJSON line per cluster; the 200 is already sent, so errors are lines too """
+        try:
+            for cluster in batch.iter_clusters(targets):
+                yield json.dumps(cluster) + "\n"
+        except Exception as e:  # pylint: disable=W0703
+            yield json.dumps({"error": str(e)}) + "\n"
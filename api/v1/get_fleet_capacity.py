@@ -0,0 +1,38 @@
+from flask import request
+from pydantic import ValidationError
+
+from tools import session_project, api_tools
+from ...models.integration_pd import FleetCapacityModel
+
+
+class ProjectAPI(api_tools.APIModeHandler):
+    ...
+
+
+class AdminAPI(api_tools.APIModeHandler):
+    ...
+
+
+class API(api_tools.APIBase):
+    url_params = [
+        '<string:mode>',
+        ''
+    ]
+
+    mode_handlers = {
+        'default': ProjectAPI,
+        'administration': AdminAPI,
+    }
+
+    def post(self, mode):
+        try:
+            fleet = FleetCapacityModel.parse_obj(request.json)
+        except ValidationError as e:
+            return e.errors(), 400
+
+        integrations = self.module.context.rpc_manager.call.\
+            integrations_get_all_integrations_by_name(session_project.get(), 'kubernetes')
+        try:
+            return fleet.rank(integrations), 200
+        except Exception as e:
+            return str(e), 400
@@ -0,0 +1,36 @@
+from flask import request
+from pydantic import ValidationError
+from tools import api_tools
+
+from ...models.integration_pd import IntegrationModel
+
+
+class ProjectAPI(api_tools.APIModeHandler):
+    ...
+
+
+class AdminAPI(api_tools.APIModeHandler):
+    ...
+
+
+class API(api_tools.APIBase):
+    url_params = [
+        '<string:mode>',
+        ''
+    ]
+
+    mode_handlers = {
+        'default': ProjectAPI,
+        'administration': AdminAPI,
+    }
+
+    def post(self, mode):
+        try:
+            settings = IntegrationModel.parse_obj(request.json)
+        except ValidationError as e:
+            return e.errors(), 400
+
+        try:
+            return settings.get_health(), 200
+        except Exception as e:
+            return str(e), 400
@@ -4,6 +4,7 @@ from pydantic import ValidationError
 from tools import api_tools
 
 from ...models.integration_pd import IntegrationModel
+from ...utils import DEFAULT_NAMESPACES_LIMIT
 
 
 class ProjectAPI(api_tools.APIModeHandler):
@@ -31,5 +32,17 @@ class API(api_tools.APIBase):
         except ValidationError as e:
             return e.errors(), 400
 
-        namespaces: list = settings.get_namespaces()
-        return namespaces, 200
+        try:
+            limit = int(request.args.get('limit', DEFAULT_NAMESPACES_LIMIT))
+        except ValueError:
+            return "limit must be an integer", 400
+        page: dict = settings.get_namespaces_page(
+            search=request.args.get('search'),
+            prefix=request.args.get('prefix'),
+            limit=limit,
+            continue_token=request.args.get('continue'),
+        )
+        etag = page.pop('etag')
+        if etag in request.if_none_match:
+            return None, 304, {'ETag': f'"{etag}"'}
+        return page, 200, {'ETag': f'"{etag}"'}
@@ -0,0 +1,191 @@
+""" Capacity benchmarks against a local fake Kubernetes API
+
+Run from the pylon root, where the plugin is importable:
+
+    python -m plugins.kubernetes.benchmarks.bench_capacity --scenario medium
+
+Every target is timed with a cold capacity cache and an empty reservation ledger, and
+reports wall time, API round trips, response bytes and peak Python allocations.
+No baseline is shipped: save one with `--save-baseline` (to `baselines.json` next to
+this file by default) on a reference run, and later runs compare against it and exit
+with status 1 if any target regressed.
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict
+
+from flask import Flask
+
+from .fake_apiserver import FakeApiServer, SyntheticCluster
+from ..models.integration_pd import IntegrationModel, PerformanceBackendTestModel, \
+    PerformanceUiTestModel
+from ..utils import capacity_cache, client_pool, get_cluster_capacity, get_core_api, \
+    reservations, resource_metrics
+
+SCENARIOS = {
+    "small": {"nodes": 3, "namespaces": 1, "pods": 10},
+    "medium": {"nodes": 50, "namespaces": 100, "pods": 1000},
+    "large": {"nodes": 500, "namespaces": 2000, "pods": 50000},
+}
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+TOKEN = "benchmark-token"
+
+
+def _settings(url: str) -> dict:
+    return {
+        "k8s_token": {"value": TOKEN, "from_secrets": False},
+        "hostname": url,
+        "namespace": "ns-0",
+        "secure_connection": False,
+        "scaling_cluster": False,
+    }
+
+
+def _test_settings(url: str) -> dict:
+    return {
+        **_settings(url),
+        "id": 1,
+        "project_id": 1,
+        "cpu_cores_limit": 1,
+        "memory_limit": 1,
+        "concurrency": 10,
+    }
+
+
+def _with_metrics(target: Callable[[], object]) -> object:
+    resource_metrics.configure(enabled=True)
+    try:
+        return target()
+    finally:
+        resource_metrics.configure(enabled=False)
+
+
+def targets(url: str) -> Dict[str, Callable[[], object]]:
+    return {
+        "get_cluster_capacity": lambda: get_cluster_capacity(
+            get_core_api(TOKEN, url), "ns-0"
+        ),
+        "get_cluster_capacity_metrics": lambda: _with_metrics(lambda: get_cluster_capacity(
+            get_core_api(TOKEN, url), "ns-0"
+        )),
+        "get_namespaces": lambda: IntegrationModel.parse_obj(_settings(url)).get_namespaces(),
+        "check_connection": lambda: IntegrationModel.parse_obj(
+            _settings(url)
+        ).check_connection(),
+        "backend_check_capacity": lambda: PerformanceBackendTestModel.parse_obj(
+            _test_settings(url)
+        ),
+        "ui_check_capacity": lambda: PerformanceUiTestModel.parse_obj(_test_settings(url)),
+    }
+
+
+def _reset() -> None:
+    """ Start a run cold, and without reservations left over by an earlier one """
+    capacity_cache.invalidate()
+    reservations.clear()
+
+
+def measure(server: FakeApiServer, target: Callable[[], object], repeat: int) -> dict:
+    wall_times = []
+    for _ in range(repeat):
+        _reset()
+        server.reset_stats()
+        start = time.perf_counter()
+        target()
+        wall_times.append(time.perf_counter() - start)
+    round_trips = sum(server.requests.values())
+    bytes_sent = server.bytes_sent
+
+    _reset()
+    tracemalloc.start()
+    target()
+    _, peak_alloc = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "wall_time": min(wall_times),
+        "round_trips": round_trips,
+        "bytes": bytes_sent,
+        "peak_alloc": peak_alloc,
+    }
+
+
+def find_regressions(results: dict, baselines: dict, tolerance: float,
+                     time_tolerance: float) -> list:
+    regressions = []
+    for scenario, scenario_results in results.items():
+        for target, result in scenario_results.items():
+            baseline = baselines.get(scenario, {}).get(target)
+            if not baseline or "error" in result:
+                continue
+            for metric, allowed in (("round_trips", tolerance), ("bytes", tolerance),
+                                    ("peak_alloc", tolerance), ("wall_time", time_tolerance)):
+                if metric in baseline and result[metric] > baseline[metric] * (1 + allowed):
+                    regressions.append(
+                        f"{scenario}/{target}: {metric} {result[metric]} > "
+                        f"baseline {baseline[metric]}"
+                    )
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="cluster size to benchmark, may be repeated (default: all)")
+    parser.add_argument("--target", action="append",
+                        help="benchmark only these targets, may be repeated")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds the fake API server waits before every response")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=BASELINES_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="allowed relative growth of round trips, bytes and memory")
+    parser.add_argument("--time-tolerance", type=float, default=0.5,
+                        help="allowed relative growth of wall time")
+    args = parser.parse_args(argv)
+
+    results = {}
+    app = Flask(__name__)
+    for scenario in args.scenario or SCENARIOS:
+        server = FakeApiServer(SyntheticCluster(**SCENARIOS[scenario]), latency=args.latency)
+        server.start()
+        try:
+            with app.test_request_context():
+                results[scenario] = {}
+                for name, target in targets(server.url).items():
+                    if args.target and name not in args.target:
+                        continue
+                    try:
+                        results[scenario][name] = measure(server, target, args.repeat)
+                    except Exception as exc:  # pylint: disable=W0703
+                        results[scenario][name] = {"error": str(exc)}
+                    print(scenario, name, json.dumps(results[scenario][name]), flush=True)
+        finally:
+            server.stop()
+            client_pool.close_all()
+    print("peak RSS (KiB):", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+        return 0
+    if not os.path.exists(args.baseline):
+        print("no baseline at", args.baseline, "- nothing to compare against")
+        return 0
+    with open(args.baseline) as file:
+        baselines = json.load(file)
+    regressions = find_regressions(results, baselines, args.tolerance, args.time_tolerance)
+    for regression in regressions:
+        print("REGRESSION", regression)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+""" Plugin startup benchmark: import time and resident memory
+
+Run from the pylon root, where the plugin is importable:
+
+    python -m plugins.kubernetes.benchmarks.bench_startup --repeat 5
+
+Every measurement runs in a fresh interpreter. "import" loads the plugin package as
+pylon does before calling `Module.init`; "first_client" additionally creates a
+Kubernetes client, which is when the Kubernetes client library is loaded now.
+Reports the best wall time, the RSS growth and whether `kubernetes` got imported.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+PLUGIN_PACKAGE = __package__.rsplit(".", 1)[0]
+
+_MEASURE = """
+import json, resource, sys, time
+start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+import {package}
+if {first_client}:
+    from {package}.utils import get_core_api
+    get_core_api("benchmark-token", "http://127.0.0.1:1")
+print(json.dumps({{
+    "wall_time": time.perf_counter() - start,
+    "rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss,
+    "kubernetes_loaded": "kubernetes" in sys.modules,
+}}))
+"""
+
+
+def measure(first_client: bool, repeat: int) -> dict:
+    results = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", _MEASURE.format(
+                package=PLUGIN_PACKAGE, first_client=first_client
+            )],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results.append(json.loads(output.splitlines()[-1]))
+    return {
+        "wall_time": min(result["wall_time"] for result in results),
+        "rss_kib": min(result["rss_kib"] for result in results),
+        "kubernetes_loaded": results[-1]["kubernetes_loaded"],
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    for name, first_client in (("import", False), ("first_client", True)):
+        print(name, json.dumps(measure(first_client, args.repeat)), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+""" Multi-worker capacity benchmark against a local fake Kubernetes API
+
+Run from the pylon root, where the plugin is importable:
+
+    python -m plugins.kubernetes.benchmarks.bench_workers --workers 8 --duration 10
+
+Starts several worker processes that keep asking for the cluster capacity, as the
+workers of one host serving the UI do, once with a capacity cache per process and
+once with the cache shared through `FileSharedCache`, and reports the requests the
+API server received in both runs.
+"""
+
+import argparse
+import json
+import multiprocessing
+import sys
+import tempfile
+import time
+from typing import Optional
+
+from .fake_apiserver import FakeApiServer, SyntheticCluster
+from ..utils import capacity_cache, get_cached_cluster_capacity, get_core_api, \
+    FileSharedCache
+
+TOKEN = "benchmark-token"
+
+
+def _worker(url: str, duration: float, ttl: float, interval: float,
+            shared_directory: Optional[str]) -> None:
+    capacity_cache.configure(ttl=ttl)
+    if shared_directory is not None:
+        capacity_cache.configure(shared=FileSharedCache(shared_directory))
+    core_api = get_core_api(TOKEN, url)
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        get_cached_cluster_capacity(core_api, "ns-0")
+        time.sleep(interval)
+
+
+def run(server: FakeApiServer, workers: int, duration: float, ttl: float, interval: float,
+        shared_directory: Optional[str]) -> dict:
+    server.reset_stats()
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=_worker, args=(
+            server.url, duration, ttl, interval, shared_directory
+        ))
+        for _ in range(workers)
+    ]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+    requests = sum(server.requests.values())
+    return {
+        "requests": requests,
+        "requests_per_second": round(requests / elapsed, 2),
+        "bytes": server.bytes_sent,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="seconds every worker keeps asking for the capacity")
+    parser.add_argument("--ttl", type=float, default=2.0, help="capacity cache TTL")
+    parser.add_argument("--interval", type=float, default=0.05,
+                        help="seconds a worker waits between two requests")
+    parser.add_argument("--nodes", type=int, default=50)
+    parser.add_argument("--namespaces", type=int, default=100)
+    parser.add_argument("--pods", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    server = FakeApiServer(SyntheticCluster(
+        nodes=args.nodes, namespaces=args.namespaces, pods=args.pods
+    ))
+    server.start()
+    try:
+        per_process = run(server, args.workers, args.duration, args.ttl, args.interval,
+                          None)
+        print("per-process", json.dumps(per_process), flush=True)
+        with tempfile.TemporaryDirectory() as directory:
+            shared = run(server, args.workers, args.duration, args.ttl, args.interval,
+                         directory)
+        print("shared", json.dumps(shared), flush=True)
+    finally:
+        server.stop()
+    if per_process["requests"]:
+        print("request reduction: {:.1%}".format(
+            1 - shared["requests"] / per_process["requests"]
+        ))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+""" Local stand-in for the Kubernetes API serving a synthetic cluster """
+
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlsplit, parse_qs
+
+POD_SHAPES = (
+    ({"cpu": "100m", "memory": "128Mi"}, {"cpu": "200m", "memory": "256Mi"}),
+    ({"cpu": "500m", "memory": "512Mi"}, {"cpu": "1", "memory": "1Gi"}),
+    ({"cpu": "1", "memory": "2Gi"}, {"cpu": "2", "memory": "4Gi"}),
+    ({}, {}),
+)
+MEBIBYTES = {"Mi": 1, "Gi": 1024}
+POD_PHASES = ("Running",) * 8 + ("Pending", "Succeeded", "Failed")
+
+
+class SyntheticCluster:
+    """ Deterministically generated nodes, namespaces, pods and resource quotas """
+
+    def __init__(self, nodes: int = 3, namespaces: int = 1, pods: int = 10,
+                 quotas: bool = True, seed: int = 0, node_groups: int = 0):
+        rnd = random.Random(seed)
+        self.resource_version = "1"
+        self.nodes = [
+            self._node(f"node-{i}", f"group-{i % node_groups}" if node_groups else None)
+            for i in range(nodes)
+        ]
+        self.namespaces = [self._namespace(f"ns-{i}") for i in range(namespaces)]
+        self.pods = [
+            self._pod(
+                f"pod-{i}", self.namespaces[i % namespaces]["metadata"]["name"],
+                self.nodes[rnd.randrange(nodes)]["metadata"]["name"],
+                rnd.choice(POD_SHAPES), rnd.choice(POD_PHASES)
+            )
+            for i in range(pods)
+        ]
+        self.pod_metrics = [
+            self._pod_metrics(pod, rnd) for pod in self.pods
+            if pod["status"]["phase"] in ("Running", "Pending")
+        ]
+        self.quotas = [
+            self._quota(namespace["metadata"]["name"])
+            for namespace in self.namespaces
+        ] if quotas else []
+
+    @staticmethod
+    def _metadata(name: str, namespace: Optional[str] = None) -> dict:
+        metadata = {"name": name, "uid": f"uid-{namespace or ''}-{name}",
+                    "resourceVersion": "1"}
+        if namespace:
+            metadata["namespace"] = namespace
+        return metadata
+
+    def _node(self, name: str, node_group: Optional[str] = None) -> dict:
+        labels = {"kubernetes.io/hostname": name}
+        if node_group:
+            labels["eks.amazonaws.com/nodegroup"] = node_group
+        return {
+            "kind": "Node", "apiVersion": "v1",
+            "metadata": {**self._metadata(name), "labels": labels},
+            "spec": {},
+            "status": {
+                "capacity": {"cpu": "16", "memory": "65865116Ki", "pods": "110"},
+                "allocatable": {"cpu": "15890m", "memory": "63206812Ki", "pods": "110"},
+            },
+        }
+
+    def _namespace(self, name: str) -> dict:
+        return {
+            "kind": "Namespace", "apiVersion": "v1",
+            "metadata": self._metadata(name),
+            "spec": {"finalizers": ["kubernetes"]},
+            "status": {"phase": "Active"},
+        }
+
+    def _pod(self, name: str, namespace: str, node: str, shape: tuple, phase: str) -> dict:
+        requests, limits = shape
+        return {
+            "kind": "Pod", "apiVersion": "v1",
+            "metadata": {**self._metadata(name, namespace), "labels": {"app": name}},
+            "spec": {
+                "nodeName": node,
+                "containers": [{
+                    "name": "main", "image": "getcarrier/perfmeter:latest",
+                    "resources": {"requests": requests, "limits": limits},
+                }],
+            },
+            "status": {"phase": phase},
+        }
+
+    def _pod_metrics(self, pod: dict, rnd: random.Random) -> dict:
+        """ Actual usage of a pod, a random share of its limits (or of 1 core and 1Gi) """
+        metadata = pod["metadata"]
+        containers = []
+        for container in pod["spec"]["containers"]:
+            limits = container["resources"]["limits"]
+            cpu = limits.get("cpu", "1")
+            cpu = int(cpu[:-1]) if cpu.endswith("m") else int(cpu) * 1000
+            memory = limits.get("memory", "1Gi")
+            memory = int(memory[:-2]) * MEBIBYTES[memory[-2:]]
+            containers.append({
+                "name": container["name"],
+                "usage": {"cpu": f"{int(cpu * rnd.uniform(0.05, 0.9))}m",
+                          "memory": f"{int(memory * rnd.uniform(0.05, 0.9))}Mi"},
+            })
+        return {
+            "kind": "PodMetrics", "apiVersion": "metrics.k8s.io/v1beta1",
+            "metadata": self._metadata(metadata["name"], metadata["namespace"]),
+            "timestamp": "2024-01-01T00:00:00Z", "window": "30s",
+            "containers": containers,
+        }
+
+    def _quota(self, namespace: str) -> dict:
+        return {
+            "kind": "ResourceQuota", "apiVersion": "v1",
+            "metadata": self._metadata("quota", namespace),
+            "spec": {"hard": {"cpu": "64", "memory": "128Gi", "pods": "500"}},
+            "status": {
+                "hard": {"cpu": "64", "memory": "128Gi", "pods": "500"},
+                "used": {"cpu": "4", "memory": "8Gi", "pods": "10"},
+            },
+        }
+
+
+def _field_selector_matches(item: dict, field_selector: Optional[str]) -> bool:
+    """ Supports the `status.phase!=X` / `status.phase=X` selectors the plugin uses """
+    for requirement in filter(None, (field_selector or "").split(",")):
+        if "!=" in requirement:
+            field, value = requirement.split("!=", 1)
+            negate = True
+        else:
+            field, value = requirement.split("=", 1)
+            negate = False
+        current = item
+        for part in field.split("."):
+            current = (current or {}).get(part)
+        if (current == value) == negate:
+            return False
+    return True
+
+
+def _label_selector_matches(item: dict, label_selector: Optional[str]) -> bool:
+    """ Supports the `key` and `key=value` selectors the plugin uses """
+    labels = item["metadata"].get("labels") or {}
+    for requirement in filter(None, (label_selector or "").split(",")):
+        key, _, value = requirement.partition("=")
+        if key not in labels or (value and labels[key] != value):
+            return False
+    return True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "FakeApiServer"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # pylint: disable=W0622
+        pass
+
+    def do_GET(self):  # pylint: disable=C0103
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        parts = [part for part in url.path.split("/") if part]
+        self.server.record_request(url.path)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        cluster = self.server.cluster
+        body = None
+        if parts[:2] == ["api", "v1"]:
+            resource = parts[2:]
+            if resource == ["nodes"]:
+                body = self._list("NodeList", lambda: cluster.nodes, url.path, query)
+            elif resource == ["pods"]:
+                body = self._list("PodList", lambda: cluster.pods, url.path, query)
+            elif resource == ["resourcequotas"]:
+                body = self._list("ResourceQuotaList", lambda: cluster.quotas, url.path, query)
+            elif resource == ["namespaces"]:
+                body = self._list("NamespaceList", lambda: cluster.namespaces, url.path, query)
+            elif len(resource) >= 2 and resource[0] == "namespaces":
+                namespace = resource[1]
+                if resource[2:] in ([], ["status"]):
+                    body = next(
+                        (item for item in cluster.namespaces
+                         if item["metadata"]["name"] == namespace), None
+                    )
+                elif resource[2:] == ["pods"]:
+                    body = self._list("PodList", lambda: [
+                        pod for pod in cluster.pods if pod["metadata"]["namespace"] == namespace
+                    ], url.path, query)
+                elif resource[2:] == ["resourcequotas"]:
+                    body = self._list("ResourceQuotaList", lambda: [
+                        quota for quota in cluster.quotas
+                        if quota["metadata"]["namespace"] == namespace
+                    ], url.path, query)
+        elif parts == ["apis", "metrics.k8s.io", "v1beta1", "pods"]:
+            body = self._list("PodMetricsList", lambda: cluster.pod_metrics, url.path, query)
+        if body is None:
+            self._send(404, {"kind": "Status", "apiVersion": "v1", "status": "Failure",
+                             "reason": "NotFound", "code": 404})
+        else:
+            self._send(200, body)
+
+    def _list(self, kind: str, get_items: Callable[[], List[dict]], path: str,
+              query: Dict[str, str]) -> dict:
+        field_selector = query.get("fieldSelector")
+        label_selector = query.get("labelSelector")
+        items = self.server.filtered(path, field_selector, label_selector, lambda: [
+            item for item in get_items()
+            if _field_selector_matches(item, field_selector)
+            and _label_selector_matches(item, label_selector)
+        ])
+        start = int(query.get("continue") or 0)
+        limit = int(query.get("limit") or 0) or len(items) or 1
+        page = items[start:start + limit]
+        metadata = {"resourceVersion": self.server.cluster.resource_version}
+        if start + limit < len(items):
+            metadata["continue"] = str(start + limit)
+        return {"kind": kind, "apiVersion": "v1", "metadata": metadata, "items": page}
+
+    def _send(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode()
+        self.server.record_bytes(len(data))
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeApiServer(ThreadingHTTPServer):
+    """
+    HTTP server answering the Kubernetes API calls the plugin makes.
+
+    Requests are counted per path and the response bytes are summed, so a benchmark
+    can report API round trips and transfer size. `latency` seconds are slept before
+    every response.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, cluster: SyntheticCluster, latency: float = 0.0,
+                 host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _Handler)
+        self.cluster = cluster
+        self.latency = latency
+        self.requests = Counter()
+        self.bytes_sent = 0
+        self._stats_lock = threading.Lock()
+        self._filtered = {}
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def record_request(self, path: str) -> None:
+        with self._stats_lock:
+            self.requests[path] += 1
+
+    def record_bytes(self, count: int) -> None:
+        with self._stats_lock:
+            self.bytes_sent += count
+
+    def filtered(self, path: str, field_selector: Optional[str],
+                 label_selector: Optional[str],
+                 build: Callable[[], List[dict]]) -> List[dict]:
+        """ Memoize the items matching a list request, so paging does not refilter """
+        key = (path, field_selector, label_selector)
+        if key not in self._filtered:
+            self._filtered[key] = build()
+        return self._filtered[key]
+
+    def reset_stats(self) -> None:
+        with self._stats_lock:
+            self.requests.clear()
+            self.bytes_sent = 0
+
+    def start(self) -> "FakeApiServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
@@ -1,15 +1,21 @@
 from json import JSONDecodeError
 from math import floor
-from typing import Union, Optional
+from typing import TYPE_CHECKING, Callable, Iterator, Union, Optional, List
 
-from kubernetes import client
 from pydantic import BaseModel, root_validator
 from pylon.core.tools import log
 
 from tools import session_project
-from ..utils import get_cluster_capacity, get_core_api
+from ..utils import get_core_api, \
+    get_cached_nodes_free_resources, get_cached_namespace_names, page_namespace_names, \
+    DEFAULT_NAMESPACES_LIMIT, reservations, get_cluster_key, FleetMember, rank_clusters, \
+    split_runners, plan_placement, CapacityTarget, iter_batch_capacity, cluster_health, \
+    autoscaling_planner, capacity_collector
 from ...integrations.models.pd.integration import SecretField
 
+if TYPE_CHECKING:
+    from kubernetes import client
+
 
 class IntegrationModel(BaseModel):
     k8s_token: Union[SecretField, str]
@@ -18,7 +24,7 @@ class IntegrationModel(BaseModel):
     secure_connection: bool = False
     scaling_cluster: bool = True
 
-    def _prepare_configuration(self) -> client.CoreV1Api:
+    def _prepare_configuration(self) -> "client.CoreV1Api":
         unsecret = self.k8s_token.unsecret(session_project.get())
         core_api = get_core_api(
             unsecret,
@@ -38,10 +44,118 @@ class IntegrationModel(BaseModel):
             return str(exc)
         return True
 
+    def get_health(self) -> dict:
+        """ The health of the cluster, as recorded from the requests made to it """
+        core_api = self._prepare_configuration()
+        return cluster_health.health(get_cluster_key(core_api.api_client))
+
+    def get_node_groups(self) -> List[dict]:
+        """ The node groups of the cluster, new node resources in cores and Gb """
+        core_api = self._prepare_configuration()
+        return node_groups_in_cores({
+            "node_groups": autoscaling_planner.describe(
+                autoscaling_planner.get_node_groups(core_api)
+            )
+        })["node_groups"]
+
     def get_namespaces(self):
         core_api = self._prepare_configuration()
-        namespaces = core_api.list_namespace()
-        return [item.metadata.name for item in namespaces.items]
+        return get_cached_namespace_names(core_api)
+
+    def get_namespaces_page(self, search: Optional[str] = None, prefix: Optional[str] = None,
+                            limit: int = DEFAULT_NAMESPACES_LIMIT,
+                            continue_token: Optional[str] = None) -> dict:
+        return page_namespace_names(
+            self.get_namespaces(), search=search, prefix=prefix,
+            limit=limit, continue_token=continue_token
+        )
+
+
+def check_runners_placement(core_api: "client.CoreV1Api", values: dict,
+                            post_processor: bool = True) -> None:
+    """
+    Check that the runners (and post-processor) of a test can be scheduled on the nodes
+    left free by the reservations of launching tests.
+
+    Nothing is reserved: tests are validated long before they run, if ever; capacity is
+    reserved when a test is launched.
+
+    :raises ValueError: If the nodes can't fit every pod of the test.
+    """
+    post_processor_cpu, post_processor_memory = 0, 0
+    if post_processor:
+        post_processor_cpu = values["post_processor_cpu_cores_limit"] * 1000
+        post_processor_memory = values["post_processor_memory_limit"] * 1024
+    plan = plan_placement(
+        reservations.adjust_nodes(
+            get_cluster_key(core_api.api_client),
+            get_cached_nodes_free_resources(core_api, capacity_collector.timeout)
+        ),
+        runners=values["concurrency"],
+        runner_cpu=values["cpu_cores_limit"] * 1000,
+        runner_memory=values["memory_limit"] * 1024,
+        post_processor_cpu=post_processor_cpu,
+        post_processor_memory=post_processor_memory,
+    )
+    if plan.unplaced:
+        raise ValueError(
+            f"Not enough capacity. {plan.unplaced} of {values['concurrency']} runners "
+            f"with {values['cpu_cores_limit']} cores and {values['memory_limit']}Gb memory "
+            f"can't be scheduled"
+        )
+    if not plan.feasible:
+        raise ValueError("Not enough capacity. No node can fit the post processor")
+
+
+def plan_autoscaling(values: dict, post_processor: bool = True) -> Optional[dict]:
+    """
+    Estimate the nodes an autoscaled cluster has to add for a test, as
+    `AutoscalingPlanner.plan` with the node resources in cores and Gb.
+
+    The estimate is advisory: the autoscaler decides, so it never fails validation,
+    even when fields it needs failed their own validation.
+
+    :return: the estimate, or None if autoscaling planning is disabled or failed.
+    """
+    if not autoscaling_planner.enabled:
+        return None
+    try:
+        post_processor_cpu, post_processor_memory = 0, 0
+        if post_processor:
+            post_processor_cpu = values["post_processor_cpu_cores_limit"] * 1000
+            post_processor_memory = values["post_processor_memory_limit"] * 1024
+        token = SecretField.parse_obj(values["k8s_token"])
+        core_api = get_core_api(
+            token.unsecret(session_project.get()),
+            values["hostname"],
+            values["secure_connection"]
+        )
+        plan = autoscaling_planner.plan(
+            core_api,
+            runners=values["concurrency"],
+            runner_cpu=values["cpu_cores_limit"] * 1000,
+            runner_memory=values["memory_limit"] * 1024,
+            post_processor_cpu=post_processor_cpu,
+            post_processor_memory=post_processor_memory,
+        )
+    except Exception as exc:
+        log.warning("Failed to plan the autoscaling of %s: %s", values.get("hostname"), exc)
+        return None
+    if plan["unplaceable"]:
+        log.warning("%s pods of the test can't be scheduled on %s even at max node group sizes",
+                    plan["unplaceable"], values["hostname"])
+    return node_groups_in_cores(plan)
+
+
+def node_groups_in_cores(plan: dict) -> dict:
+    """ Convert the new node resources of an autoscaling plan to whole cores and Gb """
+    return {
+        **plan,
+        "node_groups": [
+            {**group, "new_node": group["new_node"] and capacity_in_cores(group["new_node"])}
+            for group in plan["node_groups"]
+        ],
+    }
 
 
 class PerformanceBackendTestModel(IntegrationModel):
@@ -52,15 +166,23 @@ class PerformanceBackendTestModel(IntegrationModel):
     concurrency: int
     post_processor_cpu_cores_limit: int = 1
     post_processor_memory_limit: int = 4
+    autoscaling: Optional[dict] = None
+
+    def dict(self, **kwargs) -> dict:
+        """ The test settings, without the advisory `autoscaling` estimate """
+        exclude = kwargs.get("exclude") or set()
+        if isinstance(exclude, dict):
+            kwargs["exclude"] = {**exclude, "autoscaling": ...}
+        else:
+            kwargs["exclude"] = {*exclude, "autoscaling"}
+        return super().dict(**kwargs)
 
     @root_validator
     def check_capacity(cls, values):
         if values["scaling_cluster"]:
+            values["autoscaling"] = plan_autoscaling(values)
             return values
 
-        log.info("KAREN BACKEND VALUES")
-        log.info(values)
-
         token = SecretField.parse_obj(values["k8s_token"])
         core_api = get_core_api(
             token.unsecret(session_project.get()),
@@ -69,20 +191,7 @@ class PerformanceBackendTestModel(IntegrationModel):
         )
         if core_api is None:
             raise ValueError("Failed to prepare Kubernetes API configuration")
-        capacity = get_cluster_capacity(core_api, values["namespace"])
-        required_cpu = values["cpu_cores_limit"] * values["concurrency"] + values[
-            "post_processor_cpu_cores_limit"]
-        required_memory = values["memory_limit"] * values["concurrency"] + values[
-            "post_processor_memory_limit"]
-
-        available_cpu_cores = capacity["cpu"] #floor(capacity["cpu"] / 1000)
-        available_memory = capacity["memory"] # floor(capacity["memory"] / 1024)
-        #assert values["concurrency"] <= capacity["pods"], "Not enough runners"
-        msg = f"Not enough capacity. " \
-              f"Test requires {required_cpu} cores and {required_memory}Gb memory"
-        # assert (
-        #         required_cpu <= available_cpu_cores and required_memory <= available_memory), msg
-
+        check_runners_placement(core_api, values)
         return values
 
 
@@ -91,33 +200,126 @@ class PerformanceUiTestModel(PerformanceBackendTestModel):
     @root_validator
     def check_capacity(cls, values):
         if values["scaling_cluster"]:
+            values["autoscaling"] = plan_autoscaling(values, post_processor=False)
             return values
         token = SecretField.parse_obj(values["k8s_token"])
-        log.info("KAREN VALUES")
-        log.info(values)
 
         core_api = get_core_api(
             token.unsecret(session_project.get()),
             values["hostname"],
             values["secure_connection"]
         )
-        capacity = get_cluster_capacity(core_api, values["namespace"])
-        log.info("KAREN CAPACITY")
-        log.info(capacity)
+        check_runners_placement(core_api, values, post_processor=False)
+        return values
+
+
+class FleetCapacityModel(BaseModel):
+    integrations: Optional[List[int]]
+    cpu_cores_limit: int
+    memory_limit: int
+    concurrency: int
+    post_processor_cpu_cores_limit: int = 1
+    post_processor_memory_limit: int = 4
+    split: bool = False
+
+    def rank(self, integrations: list) -> dict:
+        """
+        Rank the kubernetes integrations of a project by fit for the test shape.
+
+        :param integrations: the kubernetes integrations of the project; only those
+                             listed in `self.integrations` are considered, if set.
+
+        :return: a dictionary with the ranked 'clusters', free resources in cores and Gb,
+                 and the runners 'split' across clusters (None unless requested,
+                 or if the fleet can't fit the test).
+        """
+        members = []
+        for integration in integrations:
+            if self.integrations is not None and integration.id not in self.integrations:
+                continue
+            settings = IntegrationModel.parse_obj(integration.settings)
+            members.append(FleetMember(
+                integration.id, settings._prepare_configuration(), settings.namespace
+            ))
+        fits = rank_clusters(
+            members,
+            runners=self.concurrency,
+            runner_cpu=self.cpu_cores_limit * 1000,
+            runner_memory=self.memory_limit * 1024,
+            post_processor_cpu=self.post_processor_cpu_cores_limit * 1000,
+            post_processor_memory=self.post_processor_memory_limit * 1024,
+        )
+        for fit in fits:
+            fit["free_cpu"] = floor(fit["free_cpu"] / 1000)
+            fit["free_memory"] = floor(fit["free_memory"] / 1024)
+        return {
+            "clusters": fits,
+            "split": split_runners(fits, self.concurrency) if self.split else None,
+        }
 
-        required_cpu = values["cpu_cores_limit"] * values["concurrency"]
-        required_memory = values["memory_limit"] * values["concurrency"]
-        available_cpu_cores = capacity["cpu"]  #floor(capacity["cpu"] / 1000)
-        available_memory = capacity["memory"]  #floor(capacity["memory"] / 1024)
 
-        log.info("KAREN available_cpu_cores : %s\n" % str(available_cpu_cores))
-        log.info("KAREN available_memory : %s\n" % str(available_memory))
+def capacity_in_cores(capacity: dict) -> dict:
+    """ Convert a collected capacity from millicores and MiB to whole cores and Gb """
+    capacity = {
+        **capacity,
+        "cpu": floor(capacity["cpu"] / 1000),
+        "memory": floor(capacity["memory"] / 1024),
+    }
+    if capacity.get("used") is not None:
+        capacity["used"] = capacity_in_cores(capacity["used"])
+    return capacity
 
 
-        #assert values["concurrency"] <= capacity["pods"], "Not enough runners"
-        msg = f"Not enough capacity. " \
-              f"Test requires {required_cpu} cores and {required_memory}Gb memory"
-        # assert (
-        #         required_cpu <= available_cpu_cores and required_memory <= available_memory), msg
+class CapacityBatchItem(BaseModel):
+    integration_id: Optional[int]
+    settings: Optional[IntegrationModel]
+    namespaces: Optional[List[str]]
 
+    @root_validator
+    def check_integration(cls, values):
+        if (values.get("integration_id") is None) == (values.get("settings") is None):
+            raise ValueError("Either integration_id or settings must be set")
         return values
+
+
+class CapacityBatchModel(BaseModel):
+    items: List[CapacityBatchItem]
+    timeout: Optional[float]
+
+    def targets(self, get_integration: Callable[[int], dict]) -> List[CapacityTarget]:
+        """
+        Resolve the integrations of the batch into (integration, namespace) pairs.
+
+        :param get_integration: returns the settings of an integration by id.
+
+        :raises ValidationError: If the settings of an integration are invalid.
+        """
+        targets = []
+        settings_by_id = {}
+        for item in self.items:
+            settings = item.settings
+            if settings is None:
+                if item.integration_id not in settings_by_id:
+                    settings_by_id[item.integration_id] = IntegrationModel.parse_obj(
+                        get_integration(item.integration_id)
+                    )
+                settings = settings_by_id[item.integration_id]
+            core_api = settings._prepare_configuration()
+            for namespace in item.namespaces or [settings.namespace]:
+                targets.append(CapacityTarget(item.integration_id, core_api, namespace))
+        return targets
+
+    def iter_clusters(self, targets: List[CapacityTarget]) -> Iterator[dict]:
+        """
+        Collect the capacity of every (integration, namespace) pair, one pass per cluster.
+
+        :param targets: the pairs, as `targets`.
+
+        :return: an iterator of one dictionary per cluster, as `iter_batch_capacity`,
+                 as each cluster finishes; capacities are in cores and Gb.
+        """
+        for cluster in iter_batch_capacity(targets, timeout=self.timeout):
+            for result in cluster["results"]:
+                if "capacity" in result:
+                    result["capacity"] = capacity_in_cores(result["capacity"])
+            yield cluster
@@ -22,6 +22,9 @@ from pylon.core.tools import log  # pylint: disable=E0611,E0401
 from pylon.core.tools import module  # pylint: disable=E0611,E0401
 
 from .models.integration_pd import IntegrationModel
+from .utils import client_pool, capacity_cache, capacity_collector, informers, \
+    reservations, admission_queue, resource_metrics, instrumentation, snapshot_store, \
+    FileSharedCache, execution_planner, cluster_health, autoscaling_planner
 
 
 class Module(module.ModuleModel):
@@ -36,6 +39,24 @@ class Module(module.ModuleModel):
         log.info("Initializing module Kubernetes Integration")
         SECTION_NAME = 'clouds'
 
+        instrumentation.configure(**self.descriptor.config.get("instrumentation", {}))
+        client_pool.configure(**self.descriptor.config.get("client_pool", {}))
+        cluster_health.configure(**self.descriptor.config.get("health", {}))
+        capacity_cache.configure(ttl=self.descriptor.config.get("capacity_cache_ttl"))
+        snapshot_store.configure(**self.descriptor.config.get("snapshots", {}))
+        if snapshot_store.enabled:
+            capacity_cache.configure(backing=snapshot_store)
+        shared_cache = self.descriptor.config.get("shared_cache", {})
+        if shared_cache.get("directory"):
+            capacity_cache.configure(shared=FileSharedCache(shared_cache["directory"]))
+        informers.configure(**self.descriptor.config.get("informers", {}))
+        capacity_collector.configure(**self.descriptor.config.get("capacity_collector", {}))
+        reservations.configure(**self.descriptor.config.get("reservations", {}))
+        admission_queue.configure(**self.descriptor.config.get("admission", {}))
+        resource_metrics.configure(**self.descriptor.config.get("resource_metrics", {}))
+        execution_planner.configure(**self.descriptor.config.get("placement", {}))
+        autoscaling_planner.configure(**self.descriptor.config.get("autoscaling", {}))
+
         self.descriptor.init_api()
         self.descriptor.init_blueprint()
         self.descriptor.init_slots()
@@ -58,3 +79,7 @@ class Module(module.ModuleModel):
     def deinit(self):  # pylint: disable=R0201
         """ De-init module """
         log.info("De-initializing Kubernetes Integration")
+        capacity_collector.shutdown()
+        snapshot_store.flush()
+        informers.stop_all()
+        client_pool.close_all()
@@ -1,15 +1,66 @@
-from typing import Optional
+from typing import Optional, Union
 
 from pydantic import ValidationError
 from pylon.core.tools import web, log
 
-from tools import rpc_tools
-from ..models.integration_pd import PerformanceBackendTestModel, PerformanceUiTestModel
+from tools import rpc_tools, session_project
+from ..models.integration_pd import PerformanceBackendTestModel, PerformanceUiTestModel, \
+    FleetCapacityModel, CapacityBatchModel
+from ..utils import reservations, admission_queue, get_core_api, instrumentation, \
+    capacity_cache, client_pool, execution_planner, cluster_health, autoscaling_planner
+from ...integrations.models.pd.integration import SecretField
 
 
 class RPC:
     integration_name = 'kubernetes'
 
+    def _with_placement(self, integration_data: dict, post_processor: bool) -> dict:
+        """
+        The execution JSON of a validated test, with its runners placement plan.
+
+        The plan is a hint: if it can't be made, the execution JSON is returned without
+        it rather than blocking the launch.
+        """
+        try:
+            placement = self._placement(integration_data, post_processor)
+        except Exception as exc:
+            log.warning("Failed to plan the runners placement of test %s: %s",
+                        integration_data.get("id"), exc)
+            return integration_data
+        return {**integration_data, "placement": placement}
+
+    def _placement(self, integration_data: dict, post_processor: bool) -> dict:
+        """ The runners placement plan of a validated test """
+        project_id = integration_data.get('project_id')
+        integration = self.context.rpc_manager.call.integrations_get_by_id(
+            project_id, integration_data["id"]
+        )
+        settings = {**integration.settings, **integration_data}
+        core_api = None
+        if not settings.get("scaling_cluster", True):
+            core_api = get_core_api(
+                SecretField.parse_obj(integration.settings["k8s_token"]).unsecret(
+                    session_project.get()
+                ),
+                settings["hostname"],
+                settings.get("secure_connection", False)
+            )
+        post_processor_cpu, post_processor_memory = 0, 0
+        if post_processor:
+            post_processor_cpu = settings.get("post_processor_cpu_cores_limit", 1) * 1000
+            post_processor_memory = settings.get("post_processor_memory_limit", 4) * 1024
+        with instrumentation.span("rpc.execution_placement"):
+            return execution_planner.plan(
+                core_api,
+                namespace=settings.get("namespace", "default"),
+                runners=settings["concurrency"],
+                runner_cpu=settings["cpu_cores_limit"] * 1000,
+                runner_memory=settings["memory_limit"] * 1024,
+                post_processor_cpu=post_processor_cpu,
+                post_processor_memory=post_processor_memory,
+                reservation_id=settings.get("reservation_id"),
+            )
+
     @web.rpc(f'backend_performance_test_create_integration_validate_{integration_name}')
     @rpc_tools.wrap_exceptions(ValidationError)
     def backend_performance_test_create_integration_validate(self, data: dict,
@@ -19,15 +70,16 @@ class RPC:
             pd_kwargs = {}
         project_id = data.get('project_id')
         integration = self.context.rpc_manager.call.integrations_get_by_id(project_id, data["id"])
-        pd_object = PerformanceBackendTestModel(**{**integration.settings, **data})
+        with instrumentation.span("rpc.backend_validate"):
+            pd_object = PerformanceBackendTestModel(**{**integration.settings, **data})
         pd_object.k8s_token = pd_object.k8s_token.value
         return pd_object.dict(**pd_kwargs)
 
     @web.rpc(f'backend_performance_execution_json_config_{integration_name}')
     @rpc_tools.wrap_exceptions(RuntimeError)
     def backend_make_execution_json_config(self, integration_data: dict) -> dict:
-        """ Prepare execution_json for this integration """
-        return integration_data
+        """ Prepare execution_json for this integration, with the runners placement plan """
+        return self._with_placement(integration_data, True)
 
     @web.rpc(f'ui_performance_test_create_integration_validate_{integration_name}')
     @rpc_tools.wrap_exceptions(ValidationError)
@@ -39,12 +91,170 @@ class RPC:
             pd_kwargs = {}
         project_id = data.get('project_id')
         integration = self.context.rpc_manager.call.integrations_get_by_id(project_id, data["id"])
-        pd_object = PerformanceUiTestModel(**{**integration.settings, **data})
+        with instrumentation.span("rpc.ui_validate"):
+            pd_object = PerformanceUiTestModel(**{**integration.settings, **data})
         pd_object.k8s_token = pd_object.k8s_token.value
         return pd_object.dict(**pd_kwargs)
 
     @web.rpc(f'ui_performance_execution_json_config_{integration_name}')
     @rpc_tools.wrap_exceptions(RuntimeError)
     def ui_make_execution_json_config(self, integration_data: dict) -> dict:
-        """ Prepare execution_json for this integration """
-        return integration_data
+        """ Prepare execution_json for this integration, with the runners placement plan """
+        return self._with_placement(integration_data, False)
+
+    @web.rpc(f'release_capacity_reservation_{integration_name}')
+    def release_capacity_reservation(self, reservation_id: str) -> bool:
+        """ Release the capacity reserved for a launched test, once its runner pods exist """
+        return reservations.release(reservation_id)
+
+    @web.rpc(f'admission_request_{integration_name}')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def admission_request(self, data: dict, ticket: Optional[str] = None,
+                          priority: int = 0, **kwargs) -> dict:
+        """
+        Queue a test launch until the cluster has capacity for it, or poll its ticket.
+
+        `data` carries the test settings as for the validate RPCs.
+        """
+        project_id = data.get('project_id')
+        integration = self.context.rpc_manager.call.integrations_get_by_id(project_id, data["id"])
+        settings = {**integration.settings, **data}
+        if settings.get("scaling_cluster", True):
+            return {"ticket": None, "decision": "admitted", "position": 0, "queue_depth": 0,
+                    "wait_time": 0.0, "reservation_id": None}
+        core_api = get_core_api(
+            SecretField.parse_obj(settings["k8s_token"]).unsecret(session_project.get()),
+            settings["hostname"],
+            settings.get("secure_connection", False)
+        )
+        return admission_queue.request(
+            core_api,
+            project_id=project_id,
+            namespace=settings.get("namespace", "default"),
+            runners=settings["concurrency"],
+            runner_cpu=settings["cpu_cores_limit"] * 1000,
+            runner_memory=settings["memory_limit"] * 1024,
+            post_processor_cpu=settings.get("post_processor_cpu_cores_limit", 1) * 1000,
+            post_processor_memory=settings.get("post_processor_memory_limit", 4) * 1024,
+            priority=priority,
+            test_id=data.get("test_id"),
+            ticket=ticket,
+            reservation_id=data.get("reservation_id"),
+        )
+
+    @web.rpc(f'admission_cancel_{integration_name}')
+    def admission_cancel(self, ticket: str) -> bool:
+        """ Drop a queued or admitted test launch, releasing its reservation """
+        return admission_queue.cancel(ticket)
+
+    @web.rpc(f'admission_stats_{integration_name}')
+    def admission_stats(self) -> dict:
+        """ Queue depth and longest wait per cluster """
+        return admission_queue.stats()
+
+    @web.rpc(f'fleet_capacity_{integration_name}')
+    @rpc_tools.wrap_exceptions(ValidationError)
+    def fleet_capacity(self, project_id: int, data: dict, **kwargs) -> dict:
+        """
+        Rank the project's clusters by fit for a test, optionally splitting its runners.
+
+        `data` carries the test shape as `FleetCapacityModel`.
+        """
+        integrations = self.context.rpc_manager.call.integrations_get_all_integrations_by_name(
+            project_id, self.integration_name
+        )
+        return FleetCapacityModel.parse_obj(data).rank(integrations)
+
+    @web.rpc(f'batch_capacity_{integration_name}')
+    @rpc_tools.wrap_exceptions(ValidationError)
+    def batch_capacity(self, project_id: int, data: dict, **kwargs) -> dict:
+        """
+        Capacity of many (integration, namespace) pairs, collected once per cluster.
+
+        `data` carries the pairs as `CapacityBatchModel`.
+        """
+        def get_integration(integration_id: int) -> dict:
+            return self.context.rpc_manager.call.integrations_get_by_id(
+                project_id, integration_id
+            ).settings
+
+        batch = CapacityBatchModel.parse_obj(data)
+        return {"clusters": list(batch.iter_clusters(batch.targets(get_integration)))}
+
+    def _integration_core_api(self, data: dict) -> tuple:
+        """ The settings of an integration merged with `data`, and a client for its cluster """
+        integration = self.context.rpc_manager.call.integrations_get_by_id(
+            data.get('project_id'), data["id"]
+        )
+        settings = {**integration.settings, **data}
+        core_api = get_core_api(
+            SecretField.parse_obj(integration.settings["k8s_token"]).unsecret(
+                session_project.get()
+            ),
+            settings["hostname"],
+            settings.get("secure_connection", False)
+        )
+        return settings, core_api
+
+    @web.rpc(f'prewarm_capacity_{integration_name}')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def prewarm_capacity(self, data: dict, ttl: Optional[int] = None,
+                         post_processor: bool = True, **kwargs) -> dict:
+        """
+        Make an autoscaled cluster add the nodes a test needs ahead of its launch, with
+        low-priority placeholder pods the test's pods preempt.
+
+        `data` carries the test settings as for the validate RPCs.
+        """
+        if not autoscaling_planner.enabled:
+            raise RuntimeError("Autoscaling planning is disabled")
+        settings, core_api = self._integration_core_api(data)
+        post_processor_cpu, post_processor_memory = 0, 0
+        if post_processor:
+            post_processor_cpu = settings.get("post_processor_cpu_cores_limit", 1) * 1000
+            post_processor_memory = settings.get("post_processor_memory_limit", 4) * 1024
+        with instrumentation.span("rpc.prewarm_capacity"):
+            return autoscaling_planner.prewarm(
+                core_api,
+                namespace=settings.get("namespace", "default"),
+                runners=settings["concurrency"],
+                runner_cpu=settings["cpu_cores_limit"] * 1000,
+                runner_memory=settings["memory_limit"] * 1024,
+                post_processor_cpu=post_processor_cpu,
+                post_processor_memory=post_processor_memory,
+                ttl=ttl,
+            )
+
+    @web.rpc(f'release_prewarm_{integration_name}')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def release_prewarm(self, data: dict, prewarm_id: str, **kwargs) -> bool:
+        """ Delete the placeholder pods of `prewarm_capacity`, e.g. once the test ended """
+        settings, core_api = self._integration_core_api(data)
+        autoscaling_planner.release(core_api, settings.get("namespace", "default"), prewarm_id)
+        return True
+
+    @web.rpc(f'cluster_health_{integration_name}')
+    def get_cluster_health(self) -> list:
+        """ Circuit state, recent latency and errors of every cluster called """
+        return cluster_health.stats()
+
+    @web.rpc(f'metrics_{integration_name}')
+    def metrics(self, text: bool = False) -> Union[dict, str]:
+        """
+        Instrumentation counters and timings, with capacity cache, client pool,
+        reservation, admission and cluster health statistics.
+
+        With `text`, the instrumentation sink is rendered in the Prometheus text format
+        instead, if it supports it.
+        """
+        if text:
+            return instrumentation.sink.render()
+        return {
+            "enabled": instrumentation.enabled,
+            "metrics": instrumentation.sink.snapshot(),
+            "capacity_cache": capacity_cache.stats(),
+            "client_pool": client_pool.stats(),
+            "reservations": reservations.stats(),
+            "admission": admission_queue.stats(),
+            "health": cluster_health.stats(),
+        }
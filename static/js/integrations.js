@@ -28,6 +28,18 @@ const KubernetesIntegration = {
                        class="form-control form-control-alternative"
                        placeholder="Address of kubernetes cluster"
                        :class="{ 'is-invalid': error.aws_access_key }">
+                <p class="font-h6 mt-1 mb-0"
+                   v-if="cluster_health && cluster_health.state !== 'unknown'"
+                   :class="cluster_health.state === 'closed' ? 'text-gray-500' : 'text-danger'"
+                   :title="cluster_health.last_error"
+                >
+                    <template v-if="cluster_health.state === 'closed'">
+                        Cluster reachable, [[ Math.round((cluster_health.average_latency || 0) * 1000) ]] ms average latency
+                    </template>
+                    <template v-else>
+                        Cluster unavailable, retrying in [[ Math.round(cluster_health.retry_in || 0) ]]s
+                    </template>
+                </p>
                 <div class="invalid-feedback">[[ error.hostname ]]</div>
                 <h9>Token</h9>
                  <SecretFieldInput 
@@ -91,6 +103,11 @@ const KubernetesIntegration = {
             </div>
             <div class="form-group w-100-imp mt-2">                
             <h9 class="font-h5 mb-1">Namespace</h9>
+                <input type="text"
+                       v-model="namespace_search"
+                       @keyup.enter="get_namespaces"
+                       class="form-control form-control-alternative mb-2"
+                       placeholder="Filter namespaces">
                 <div class="custom-input">
                 <select class="selectpicker bootstrap-select__b" 
                     v-model="namespace"
@@ -103,6 +120,12 @@ const KubernetesIntegration = {
             >
             Get namespaces
             </button>
+            <button type="button" class="btn btn-secondary btn-sm mr-1 mt-3 d-inline-block"
+                v-if="namespaces_continue"
+                @click="get_namespaces(true)"
+            >
+            Load more
+            </button>
             </div>
             <div class="row">
                 <div class="col">
@@ -184,21 +207,46 @@ const KubernetesIntegration = {
         }
     },
     methods: {
-        async get_namespaces() {
-            const api_url = V.build_api_url('kubernetes', 'get_namespaces')
+        async get_namespaces(load_more = false) {
+            const params = new URLSearchParams({limit: this.namespaces_limit})
+            if (this.namespace_search) {
+                params.set('search', this.namespace_search)
+            }
+            if (load_more === true && this.namespaces_continue) {
+                params.set('continue', this.namespaces_continue)
+            }
+            const headers = {'Content-Type': 'application/json'}
+            if (load_more !== true && this.namespaces_etag) {
+                headers['If-None-Match'] = this.namespaces_etag
+            }
+            const api_url = V.build_api_url('kubernetes', 'get_namespaces') + '?' + params
             const resp = await fetch(api_url,
                 {
                     method: 'POST',
-                    headers: {'Content-Type': 'application/json'},
+                    headers,
                     body: JSON.stringify(this.body_data)
                 })
-            if (resp.ok) {
-                this.namespaces = await resp.json()
+            if (resp.status === 304) {
+                // the page we show is still current
+            } else if (resp.ok) {
+                const page = await resp.json()
+                this.namespaces = load_more === true ? [...this.namespaces, ...page.items] : page.items
+                this.namespaces_continue = page.continue
+                this.namespaces_etag = load_more === true ? null : resp.headers.get('ETag')
             } else {
                 console.warn('Couldn\'t fetch namespaces. Resp code: ', resp.status)
             }
             this.$nextTick(this.refresh_pickers)
             this.$nextTick(this.refresh_pickers)
+            await this.get_health()
+        },
+        async get_health() {
+            const resp = await fetch(V.build_api_url('kubernetes', 'get_health'), {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify(this.body_data)
+            })
+            this.cluster_health = resp.ok ? await resp.json() : null
         },
         clear() {
             Object.assign(this.$data, this.initialState())
@@ -322,6 +370,11 @@ const KubernetesIntegration = {
             k8s_token: '',
             namespace: "default",
             namespaces: ["default"],
+            namespace_search: '',
+            namespaces_limit: 100,
+            namespaces_continue: null,
+            namespaces_etag: null,
+            cluster_health: null,
             hostname: '',
             is_default: false,
             scaling_cluster: false,
@@ -0,0 +1,123 @@
+""" Ordering, fairness and reservations of the admission queue """
+
+import pytest
+from kubernetes.client import ApiClient, Configuration, CoreV1Api
+
+from ..utils import k8s_api
+from ..utils.admission import AdmissionQueue
+from ..utils.client_pool import get_cluster_key
+from ..utils.placement import NodeResources
+from ..utils.reservations import reservations
+
+@pytest.fixture
+def nodes(monkeypatch):
+    """ The free nodes the queue sees, one node with 4 runners of room by default """
+    free = [NodeResources("node", 4000, 8192, 110)]
+    monkeypatch.setattr(
+        k8s_api, "get_cached_nodes_free_resources", lambda core_api, timeout=None: free
+    )
+    reservations.clear()
+    yield free
+    reservations.clear()
+
+
+@pytest.fixture
+def core_api():
+    configuration = Configuration()
+    configuration.host = "https://cluster"
+    configuration.api_key["authorization"] = "token"
+    return CoreV1Api(ApiClient(configuration))
+
+
+def request(queue, core_api, runners, project_id=1, **kwargs):
+    return queue.request(core_api, project_id, "default", runners, 1000, 1024, **kwargs)
+
+
+def test_admits_a_test_that_fits(nodes, core_api):
+    status = request(AdmissionQueue(), core_api, 2)
+    assert status["decision"] == "admitted"
+    assert status["position"] == 0
+    assert status["reservation_id"] is not None
+    assert reservations.stats()["pods"] == 2
+
+
+def test_queues_until_capacity_is_released(nodes, core_api):
+    queue = AdmissionQueue()
+    first = request(queue, core_api, 3)
+    second = request(queue, core_api, 3)
+    assert second["decision"] == "queued"
+    assert second["position"] == 1
+    assert queue.stats()["queue_depth"] == 1
+
+    assert queue.cancel(first["ticket"])
+    assert reservations.stats()["outstanding"] == 0
+    polled = request(queue, core_api, 3, ticket=second["ticket"])
+    assert polled["decision"] == "admitted"
+    assert polled["ticket"] == second["ticket"]
+
+
+def test_head_of_line_is_not_overtaken(nodes, core_api):
+    queue = AdmissionQueue()
+    running = request(queue, core_api, 3)
+    large = request(queue, core_api, 4)
+    small = request(queue, core_api, 1)
+    # the small test would fit, but the large one came first
+    assert large["decision"] == small["decision"] == "queued"
+    assert (large["position"], small["position"]) == (1, 2)
+
+    queue.cancel(running["ticket"])
+    assert request(queue, core_api, 4, ticket=large["ticket"])["decision"] == "admitted"
+    assert request(queue, core_api, 1, ticket=small["ticket"])["decision"] == "queued"
+
+
+def test_priority_goes_first(nodes, core_api):
+    queue = AdmissionQueue()
+    running = request(queue, core_api, 4)
+    low = request(queue, core_api, 4)
+    high = request(queue, core_api, 4, priority=1)
+    low = request(queue, core_api, 4, ticket=low["ticket"])
+    assert (high["position"], low["position"]) == (1, 2)
+
+    queue.cancel(running["ticket"])
+    assert request(queue, core_api, 4, ticket=low["ticket"])["decision"] == "queued"
+    assert request(queue, core_api, 4, ticket=high["ticket"])["decision"] == "admitted"
+
+
+def test_fair_share_between_projects(nodes, core_api):
+    queue = AdmissionQueue()
+    running = request(queue, core_api, 4, project_id=1)
+    busy = request(queue, core_api, 4, project_id=1)
+    other = request(queue, core_api, 4, project_id=2)
+    busy = request(queue, core_api, 4, ticket=busy["ticket"], project_id=1)
+    # project 1 was just admitted a test, so project 2 goes first despite arriving later
+    assert (other["position"], busy["position"]) == (1, 2)
+    queue.cancel(running["ticket"])
+    assert request(queue, core_api, 4, ticket=other["ticket"], project_id=2)["decision"] == \
+        "admitted"
+
+
+def test_adopts_the_reservation_held_by_the_test(nodes, core_api):
+    _, held = reservations.reserve_placement(
+        get_cluster_key(core_api.api_client), "default", nodes, 4, 1000, 1024
+    )
+    status = request(AdmissionQueue(), core_api, 4, reservation_id=held.id)
+    assert status["decision"] == "admitted"
+    assert status["reservation_id"] != held.id
+    assert reservations.stats()["outstanding"] == 1
+    assert not reservations.release(held.id)
+
+
+def test_cancel_releases_the_reservation(nodes, core_api):
+    queue = AdmissionQueue()
+    status = request(queue, core_api, 2)
+    assert queue.cancel(status["ticket"])
+    assert not queue.cancel(status["ticket"])
+    assert not reservations.release(status["reservation_id"])
+
+
+def test_unpolled_tickets_expire(nodes, core_api):
+    queue = AdmissionQueue(ticket_ttl=0)
+    request(queue, core_api, 4)
+    queued = request(queue, core_api, 4)
+    assert queued["decision"] == "queued"
+    assert queue.stats()["queue_depth"] == 0
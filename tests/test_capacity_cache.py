@@ -0,0 +1,151 @@
+""" TTL, single-flight and warm-start behavior of the capacity snapshot cache """
+
+import threading
+import time
+
+import pytest
+
+from ..utils.capacity_cache import CapacityCache
+from ..utils.health import ClusterUnavailable
+
+KEY = ("capacity", "https://cluster", "token", False, "default")
+
+
+class Counter:
+    """ A compute callable counting its calls """
+
+    def __init__(self, value=None):
+        self.calls = 0
+        self.value = value
+
+    def __call__(self):
+        self.calls += 1
+        return self.value if self.value is not None else {"cpu": self.calls}
+
+
+class Backing:
+    """ A snapshot store holding one persisted snapshot """
+
+    def __init__(self, value, age=5.0):
+        self.loaded = (value, age)
+        self.saved = []
+
+    def load(self, key):
+        loaded, self.loaded = self.loaded, None
+        return loaded
+
+    def save(self, key, value):
+        self.saved.append((key, value))
+
+
+def test_hit_within_ttl():
+    cache = CapacityCache(ttl=60)
+    compute = Counter()
+    assert cache.get(KEY, compute) == {"cpu": 1}
+    assert cache.get(KEY, compute) == {"cpu": 1}
+    assert compute.calls == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_returns_copies():
+    cache = CapacityCache(ttl=60)
+    cache.get(KEY, Counter())["cpu"] = 100
+    assert cache.get(KEY, Counter()) == {"cpu": 1}
+
+
+def test_rescans_once_expired():
+    cache = CapacityCache(ttl=0)
+    compute = Counter()
+    cache.get(KEY, compute)
+    cache.get(KEY, compute)
+    assert compute.calls == 2
+
+
+def test_invalidate():
+    cache = CapacityCache(ttl=60)
+    compute = Counter()
+    cache.get(KEY, compute)
+    cache.invalidate(KEY)
+    cache.get(KEY, compute)
+    assert compute.calls == 2
+
+
+def test_concurrent_misses_share_one_scan():
+    cache = CapacityCache(ttl=60)
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"cpu": 1}
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get(KEY, compute)))
+        for _ in range(5)
+    ]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    while cache.stats()["coalesced"] < 4:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 1
+    assert results == [{"cpu": 1}] * 5
+
+
+def test_errors_are_raised_and_not_cached():
+    cache = CapacityCache(ttl=60)
+
+    def fail():
+        raise TimeoutError("scan timed out")
+
+    with pytest.raises(TimeoutError):
+        cache.get(KEY, fail)
+    assert cache.peek(KEY) is None
+    assert cache.get(KEY, Counter()) == {"cpu": 1}
+
+
+def test_serves_expired_snapshot_while_cluster_unavailable():
+    cache = CapacityCache(ttl=0)
+    cache.get(KEY, Counter())
+
+    def unavailable():
+        raise ClusterUnavailable("https://cluster", 30, "connection refused")
+
+    assert cache.get(KEY, unavailable) == {"cpu": 1}
+
+
+def test_unavailable_without_snapshot_raises():
+    cache = CapacityCache(ttl=60)
+
+    def unavailable():
+        raise ClusterUnavailable("https://cluster", 30, "connection refused")
+
+    with pytest.raises(ClusterUnavailable):
+        cache.get(KEY, unavailable)
+
+
+def test_warm_snapshot_served_then_refreshed():
+    cache = CapacityCache(ttl=60)
+    backing = Backing({"cpu": "warm"})
+    cache.configure(backing=backing)
+    refreshed = threading.Event()
+
+    def compute():
+        refreshed.set()
+        return {"cpu": "fresh"}
+
+    assert cache.get(KEY, compute) == {"cpu": "warm"}
+    assert refreshed.wait(5)
+    deadline = time.monotonic() + 5
+    while (cache.stats()["in_flight"] or not backing.saved) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cache.get(KEY, Counter()) == {"cpu": "fresh"}
+    assert cache.stats()["warm_hits"] == 1
+    assert backing.saved == [(KEY, {"cpu": "fresh"})]
@@ -0,0 +1,99 @@
+""" Ranking a project's clusters by fit for a test, and splitting runners across them """
+
+import threading
+
+import pytest
+from kubernetes.client import ApiClient, Configuration, CoreV1Api
+
+from ..utils import k8s_api
+from ..utils.fleet import FleetMember, rank_clusters, split_runners
+from ..utils.placement import NodeResources
+from ..utils.reservations import reservations
+
+CLUSTERS = {
+    "https://large": [NodeResources("a", 8000, 8192, 110), NodeResources("b", 8000, 8192, 110)],
+    "https://small": [NodeResources("a", 2000, 2048, 110)],
+    "https://busy": [NodeResources("a", 8000, 8192, 110), NodeResources("b", 4000, 4096, 110)],
+}
+
+
+def member(integration_id: int, host: str) -> FleetMember:
+    configuration = Configuration()
+    configuration.host = host
+    return FleetMember(integration_id, CoreV1Api(ApiClient(configuration)), "default")
+
+
+@pytest.fixture
+def hung():
+    """ Released at teardown, so the scan of a hung cluster ends """
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+@pytest.fixture(autouse=True)
+def timeouts(monkeypatch, hung):
+    """ The scan timeout every cluster was asked for """
+    asked = {}
+
+    def get_nodes(core_api, timeout=None):
+        host = core_api.api_client.configuration.host
+        asked[host] = timeout
+        if host == "https://hung":
+            hung.wait(5)
+            raise TimeoutError("Deadline exceeded while listing Kubernetes resources")
+        if host == "https://broken":
+            raise ConnectionError("connection refused")
+        return CLUSTERS[host]
+
+    monkeypatch.setattr(k8s_api, "get_cached_nodes_free_resources", get_nodes)
+    reservations.clear()
+    yield asked
+    reservations.clear()
+
+
+def test_feasible_and_least_loaded_first():
+    fits = rank_clusters(
+        [member(1, "https://small"), member(2, "https://busy"), member(3, "https://large")],
+        4, 1000, 1024, 1000, 1024
+    )
+    assert [fit["integration_id"] for fit in fits] == [3, 2, 1]
+    assert [fit["feasible"] for fit in fits] == [True, True, False]
+    assert fits[2]["runners_fit"] == 2
+    assert fits[2]["runners_fit_with_post_processor"] == 1
+    assert fits[0]["free_cpu"] == 16000 - 5000
+
+
+def test_errors_and_timeouts_rank_last(timeouts):
+    fits = rank_clusters(
+        [member(1, "https://hung"), member(2, "https://broken"), member(3, "https://small")],
+        1, 1000, 1024, timeout=0.2
+    )
+    assert fits[0]["integration_id"] == 3
+    errors = {fit["integration_id"]: fit["error"] for fit in fits[1:]}
+    assert errors == {1: "Timed out collecting capacity", 2: "connection refused"}
+    # the scans are bounded by what is left of the deadline
+    assert all(0 < timeout <= 0.2 for timeout in timeouts.values())
+
+
+def test_no_members():
+    assert rank_clusters([], 1, 1000, 1024) == []
+
+
+def test_split_runners_across_clusters():
+    fits = [
+        {"integration_id": 1, "post_processor_fits": False, "runners_fit": 6,
+         "runners_fit_with_post_processor": 0},
+        {"integration_id": 2, "post_processor_fits": True, "runners_fit": 4,
+         "runners_fit_with_post_processor": 3},
+    ]
+    # the post-processor cluster comes first, with the runners that fit along with it
+    assert split_runners(fits, 8) == {2: 3, 1: 5}
+    assert list(split_runners(fits, 8)) == [2, 1]
+    assert split_runners(fits, 10) is None
+
+
+def test_split_without_room_for_the_post_processor():
+    fits = [{"integration_id": 1, "post_processor_fits": False, "runners_fit": 10,
+             "runners_fit_with_post_processor": 0}]
+    assert split_runners(fits, 1) is None
@@ -0,0 +1,117 @@
+""" The per-cluster circuit breaker around Kubernetes API requests """
+
+import pytest
+from kubernetes.client.rest import ApiException
+
+from ..utils.health import CLOSED, OPEN, ClusterUnavailable, HealthTracker
+
+CLUSTER = ("https://cluster", "token", False)
+HOST = "https://cluster"
+
+
+def ok():
+    return "ok"
+
+
+def down():
+    raise ConnectionError("connection refused")
+
+
+def call(tracker, request, probe=ok):
+    return tracker.call(CLUSTER, HOST, request, probe)
+
+
+def fail(tracker, times):
+    for _ in range(times):
+        with pytest.raises(ConnectionError):
+            call(tracker, down)
+
+
+def test_opens_after_consecutive_failures():
+    tracker = HealthTracker(failure_threshold=3)
+    assert tracker.health(CLUSTER) == {"state": "unknown"}
+    fail(tracker, 2)
+    assert call(tracker, ok) == "ok"
+    fail(tracker, 2)
+    assert tracker.health(CLUSTER)["state"] == CLOSED
+    fail(tracker, 1)
+    health = tracker.health(CLUSTER)
+    assert health["state"] == OPEN
+    assert health["consecutive_failures"] == 3
+    assert health["errors"] == 5
+    assert 0 < health["retry_in"] <= tracker.reset_timeout
+
+
+def test_open_circuit_fails_fast():
+    tracker = HealthTracker(failure_threshold=1)
+    fail(tracker, 1)
+    requests = []
+    with pytest.raises(ClusterUnavailable) as raised:
+        call(tracker, lambda: requests.append(1))
+    assert requests == []
+    assert raised.value.host == HOST
+    assert raised.value.retry_in > 0
+
+
+def test_successful_probe_closes_the_circuit():
+    tracker = HealthTracker(failure_threshold=1, reset_timeout=0)
+    fail(tracker, 1)
+    probes = []
+    assert call(tracker, ok, probe=lambda: probes.append(1)) == "ok"
+    assert probes == [1]
+    assert tracker.health(CLUSTER)["state"] == CLOSED
+    assert tracker.health(CLUSTER)["consecutive_failures"] == 0
+
+
+def test_failed_probe_reopens_the_circuit():
+    tracker = HealthTracker(failure_threshold=1, reset_timeout=0)
+    fail(tracker, 1)
+    requests = []
+    with pytest.raises(ClusterUnavailable):
+        call(tracker, lambda: requests.append(1), probe=down)
+    assert requests == []
+    assert tracker.health(CLUSTER)["state"] == OPEN
+    assert tracker.health(CLUSTER)["last_error"] == "connection refused"
+
+
+def test_probe_answered_with_a_client_error_closes_the_circuit():
+    tracker = HealthTracker(failure_threshold=1, reset_timeout=0)
+    fail(tracker, 1)
+
+    def forbidden():
+        raise ApiException(status=403)
+
+    assert call(tracker, ok, probe=forbidden) == "ok"
+    assert tracker.health(CLUSTER)["state"] == CLOSED
+
+
+def test_client_errors_are_not_failures():
+    tracker = HealthTracker(failure_threshold=1)
+
+    def not_found():
+        raise ApiException(status=404)
+
+    for _ in range(3):
+        with pytest.raises(ApiException):
+            call(tracker, not_found)
+    health = tracker.health(CLUSTER)
+    assert health["state"] == CLOSED
+    assert health["errors"] == 0
+    assert health["requests"] == 3
+
+    def unavailable():
+        raise ApiException(status=503)
+
+    with pytest.raises(ApiException):
+        call(tracker, unavailable)
+    assert tracker.health(CLUSTER)["state"] == OPEN
+
+
+def test_disabled_breaker_only_records():
+    tracker = HealthTracker(enabled=False, failure_threshold=1)
+    fail(tracker, 3)
+    assert call(tracker, ok) == "ok"
+    health = tracker.health(CLUSTER)
+    assert health["state"] == CLOSED
+    assert health["errors"] == 3
+    assert health["error_rate"] == 0.75
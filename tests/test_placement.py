@@ -0,0 +1,89 @@
+""" Runner placement simulation of the capacity validators and the execution plan """
+
+from ..utils.placement import NodeResources, plan_placement, spread_placement
+
+
+def test_packs_largest_node_first():
+    nodes = [NodeResources("small", 2000, 2048, 110), NodeResources("large", 8000, 8192, 110)]
+    plan = plan_placement(nodes, 4, 1000, 1024)
+    assert plan.feasible
+    assert plan.runners == {"large": 4}
+    assert plan.unplaced == 0
+
+
+def test_exact_fit():
+    plan = plan_placement([NodeResources("node", 3000, 3072, 3)], 3, 1000, 1024)
+    assert plan.feasible
+    assert plan.runners == {"node": 3}
+
+
+def test_fragmented_capacity_is_not_feasible():
+    # 3 cores free in total, but no node has a whole core left for a runner
+    nodes = [NodeResources(f"node-{index}", 750, 8192, 110) for index in range(4)]
+    plan = plan_placement(nodes, 1, 1000, 1024)
+    assert not plan.feasible
+    assert plan.runners == {}
+    assert plan.unplaced == 1
+
+
+def test_pods_limit():
+    plan = plan_placement([NodeResources("node", 8000, 8192, 2)], 3, 1000, 1024)
+    assert not plan.feasible
+    assert plan.runners == {"node": 2}
+    assert plan.unplaced == 1
+
+
+def test_larger_post_processor_placed_first():
+    nodes = [NodeResources("a", 4000, 4096, 110), NodeResources("b", 2000, 2048, 110)]
+    plan = plan_placement(nodes, 2, 1000, 1024, 3000, 3072)
+    assert plan.feasible
+    assert plan.post_processor == "a"
+    assert plan.runners == {"a": 1, "b": 1}
+
+
+def test_smaller_post_processor_placed_after_runners():
+    nodes = [NodeResources("a", 2500, 8192, 110)]
+    plan = plan_placement(nodes, 2, 1000, 1024, 500, 512)
+    assert plan.feasible
+    assert plan.runners == {"a": 2}
+    assert plan.post_processor == "a"
+
+
+def test_post_processor_that_does_not_fit():
+    plan = plan_placement([NodeResources("a", 2000, 2048, 110)], 2, 1000, 1024, 500, 512)
+    assert not plan.feasible
+    assert plan.runners == {"a": 2}
+    assert plan.post_processor is None
+    assert plan.unplaced == 0
+
+
+def test_spread_evenly():
+    nodes = [NodeResources(f"node-{index}", 8000, 8192, 110) for index in range(3)]
+    plan = spread_placement(nodes, 6, 1000, 1024)
+    assert plan.feasible
+    assert plan.runners == {"node-0": 2, "node-1": 2, "node-2": 2}
+
+
+def test_spread_fills_small_nodes_and_shares_the_rest():
+    nodes = [
+        NodeResources("small", 1000, 8192, 110),
+        NodeResources("a", 8000, 8192, 110),
+        NodeResources("b", 8000, 8192, 110),
+    ]
+    plan = spread_placement(nodes, 7, 1000, 1024)
+    assert plan.feasible
+    assert plan.runners == {"small": 1, "a": 3, "b": 3}
+
+
+def test_spread_post_processor_on_the_largest_node():
+    nodes = [NodeResources("a", 2000, 2048, 110), NodeResources("b", 4000, 4096, 110)]
+    plan = spread_placement(nodes, 2, 1000, 1024, 1000, 1024)
+    assert plan.feasible
+    assert plan.post_processor == "b"
+    assert plan.runners == {"a": 1, "b": 1}
+
+
+def test_spread_not_feasible():
+    plan = spread_placement([NodeResources("a", 2000, 2048, 110)], 3, 1000, 1024)
+    assert not plan.feasible
+    assert plan.unplaced == 1
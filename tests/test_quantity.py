@@ -0,0 +1,87 @@
+""" Quantity parsing checked against the parser of the Kubernetes Python client
+
+Run from the pylon root, where the plugin is importable:
+
+    python -m pytest plugins/kubernetes/tests
+"""
+
+from decimal import Decimal
+
+import pytest
+from kubernetes.utils import parse_quantity as upstream_parse_quantity
+
+from ..utils.quantity import parse_cpu, parse_cpu_many, parse_memory, parse_memory_many, \
+    parse_quantity
+
+MIB = Decimal(2) ** 20
+
+VALID = [
+    # plain numbers, signs and fractions
+    "0", "1", "16", "+1", "-1", "1.5", "0.25", ".5", "5.", "-0.5", 1, 2.5,
+    # decimal SI suffixes
+    "500000n", "10u", "100m", "0.5m", "-100m", "1k", "1K", "1M", "1G", "1T", "1P", "1E",
+    "15890m", "1.5G",
+    # binary SI suffixes
+    "1Ki", "1Mi", "1Gi", "1Ti", "1Pi", "1Ei", "0.1Ki", "1.25Mi", "1.5Gi", "63206812Ki",
+    "-512Mi",
+    # decimal exponents
+    "1e3", "1E3", "1e+3", "1E-3", "2e0", "1.5e6", "-2e-2",
+]
+
+INVALID = [
+    "", "Mi", "1Kii", "1.2.3", "1e", "e3", "1Gb", "--1", "1m5", "1ei", "one",
+]
+
+# accepted by the lenient client parser, rejected by the API server grammar
+INVALID_ONLY_HERE = ["1 Mi", "1mi", "1E3Mi"]
+
+
+@pytest.mark.parametrize("quantity", VALID)
+def test_parse_quantity(quantity):
+    assert parse_quantity(quantity) == upstream_parse_quantity(quantity)
+
+
+@pytest.mark.parametrize("quantity", VALID)
+def test_parse_cpu(quantity):
+    assert parse_cpu(quantity) == float(upstream_parse_quantity(quantity) * 1000)
+
+
+@pytest.mark.parametrize("quantity", VALID)
+def test_parse_memory(quantity):
+    assert parse_memory(quantity) == float(upstream_parse_quantity(quantity) / MIB)
+
+
+def test_parse_cpu_many():
+    quantities = VALID + VALID[::-1]
+    assert parse_cpu_many(quantities) == [
+        float(upstream_parse_quantity(quantity) * 1000) for quantity in quantities
+    ]
+
+
+def test_parse_memory_many():
+    quantities = VALID + VALID[::-1]
+    assert parse_memory_many(quantities) == [
+        float(upstream_parse_quantity(quantity) / MIB) for quantity in quantities
+    ]
+
+
+@pytest.mark.parametrize("quantity", INVALID)
+def test_invalid_quantity(quantity):
+    with pytest.raises(ValueError):
+        upstream_parse_quantity(quantity)
+    with pytest.raises(ValueError):
+        parse_quantity(quantity)
+
+
+@pytest.mark.parametrize("quantity", INVALID_ONLY_HERE)
+def test_invalid_quantity_strict(quantity):
+    with pytest.raises(ValueError):
+        parse_quantity(quantity)
+
+
+@pytest.mark.parametrize("quantity", INVALID + INVALID_ONLY_HERE)
+def test_invalid_quantity_many(quantity):
+    with pytest.raises(ValueError):
+        parse_cpu_many(["1", quantity])
+    with pytest.raises(ValueError):
+        parse_memory_many(["1Mi", quantity])
@@ -0,0 +1,99 @@
+""" The capacity reservation ledger of launching tests """
+
+from ..utils.placement import NodeResources
+from ..utils.reservations import ReservationLedger
+
+CLUSTER = ("https://cluster", "token", False)
+NODES = [NodeResources("a", 4000, 4096, 110), NodeResources("b", 2000, 2048, 110)]
+
+
+def test_reservation_is_subtracted_from_nodes():
+    ledger = ReservationLedger()
+    plan, reservation = ledger.reserve_placement(CLUSTER, "default", NODES, 2, 1000, 1024)
+    assert plan.feasible
+    assert reservation.pods == 2
+    assert ledger.adjust_nodes(CLUSTER, NODES) == [
+        NodeResources("a", 2000, 2048, 108), NodeResources("b", 2000, 2048, 110)
+    ]
+    assert ledger.adjust_nodes(("https://other", "token", False), NODES) == NODES
+    assert ledger.adjust_nodes(CLUSTER, NODES, exclude=reservation.id) == NODES
+
+
+def test_concurrent_launches_do_not_double_book():
+    ledger = ReservationLedger()
+    _, first = ledger.reserve_placement(CLUSTER, "default", NODES, 4, 1000, 1024)
+    plan, second = ledger.reserve_placement(CLUSTER, "default", NODES, 4, 1000, 1024)
+    assert first is not None
+    assert not plan.feasible
+    assert second is None
+    assert ledger.stats()["outstanding"] == 1
+
+
+def test_release():
+    ledger = ReservationLedger()
+    _, reservation = ledger.reserve_placement(CLUSTER, "default", NODES, 2, 1000, 1024)
+    assert ledger.release(reservation.id)
+    assert not ledger.release(reservation.id)
+    assert ledger.adjust_nodes(CLUSTER, NODES) == NODES
+
+
+def test_expiry():
+    ledger = ReservationLedger()
+    ledger.reserve_placement(CLUSTER, "default", NODES, 2, 1000, 1024, ttl=0)
+    assert ledger.stats()["outstanding"] == 0
+    assert ledger.outstanding(CLUSTER) == (0, 0, 0)
+    assert ledger.adjust_nodes(CLUSTER, NODES) == NODES
+
+
+def test_replace_when_the_new_plan_fits():
+    ledger = ReservationLedger()
+    _, held = ledger.reserve_placement(CLUSTER, "default", NODES, 4, 1000, 1024)
+    # the held reservation counts as free, or the same test could never be replanned
+    plan, reservation = ledger.reserve_placement(
+        CLUSTER, "default", NODES, 5, 1000, 1024, replace=held.id
+    )
+    assert plan.feasible
+    assert not ledger.release(held.id)
+    assert ledger.stats() == {"ttl": ledger.ttl, "outstanding": 1, "pods": 5}
+    assert ledger.release(reservation.id)
+
+
+def test_replace_keeps_the_held_reservation_when_the_new_plan_does_not_fit():
+    ledger = ReservationLedger()
+    _, held = ledger.reserve_placement(CLUSTER, "default", NODES, 4, 1000, 1024)
+    plan, reservation = ledger.reserve_placement(
+        CLUSTER, "default", NODES, 10, 1000, 1024, replace=held.id
+    )
+    assert not plan.feasible
+    assert reservation is None
+    assert ledger.release(held.id)
+
+
+def test_clear():
+    ledger = ReservationLedger()
+    ledger.reserve_placement(CLUSTER, "default", NODES, 2, 1000, 1024)
+    ledger.reserve_placement(CLUSTER, "other", NODES, 2, 1000, 1024)
+    ledger.clear()
+    assert ledger.stats()["outstanding"] == 0
+
+
+def test_subtract_from_capacity():
+    ledger = ReservationLedger()
+    ledger.reserve_placement(CLUSTER, "default", NODES, 2, 1000, 1024)
+    capacity = {"cpu": 6000, "memory": 6144, "pods": 220, "used": {
+        "cpu": 5000, "memory": 5120, "pods": 200
+    }}
+    assert ledger.subtract_from_capacity(CLUSTER, capacity) == {
+        "cpu": 4000, "memory": 4096, "pods": 218,
+        "used": {"cpu": 3000, "memory": 3072, "pods": 198},
+    }
+
+
+def test_quota_bound_capacity_only_pays_for_its_namespace():
+    ledger = ReservationLedger()
+    ledger.reserve_placement(CLUSTER, "default", NODES, 1, 1000, 1024)
+    ledger.reserve_placement(CLUSTER, "other", NODES, 2, 1000, 1024)
+    capacity = {"cpu": 2000, "memory": 6144, "pods": 10, "quota_bound": ["cpu", "pods"]}
+    assert ledger.subtract_from_capacity(CLUSTER, capacity, "default") == {
+        "cpu": 1000, "memory": 3072, "pods": 9, "quota_bound": ["cpu", "pods"]
+    }
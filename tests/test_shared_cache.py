@@ -0,0 +1,86 @@
+""" Capacity snapshots and reservations shared by the worker processes of a host """
+
+import fcntl
+
+from ..utils.placement import NodeResources
+from ..utils.reservations import ReservationLedger
+from ..utils.shared_cache import FileSharedCache
+
+KEY = ("capacity", "https://cluster", "token", False, "default")
+CLUSTER = ("https://cluster", "token", False)
+NODES = [NodeResources("a", 4000, 4096, 110)]
+
+
+class Counter:
+    """ A compute callable counting its calls """
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return {"cpu": self.calls}
+
+
+def test_workers_share_one_scan_per_ttl(tmp_path):
+    first, second = FileSharedCache(str(tmp_path)), FileSharedCache(str(tmp_path))
+    compute = Counter()
+    assert first.get(KEY, compute, ttl=60) == ({"cpu": 1}, 0.0)
+    value, age = second.get(KEY, compute, ttl=60)
+    assert value == {"cpu": 1}
+    assert age >= 0
+    assert compute.calls == 1
+
+
+def test_expired_entries_are_rescanned(tmp_path):
+    cache = FileSharedCache(str(tmp_path))
+    compute = Counter()
+    cache.get(KEY, compute, ttl=0)
+    assert cache.get(KEY, compute, ttl=0)[0] == {"cpu": 2}
+
+
+def test_expired_entry_served_while_another_worker_rescans(tmp_path):
+    cache = FileSharedCache(str(tmp_path))
+    cache.put(KEY, {"cpu": "old"})
+    compute = Counter()
+    with open(cache._path(KEY, "lock"), "a+") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        assert cache.get(KEY, compute, ttl=0)[0] == {"cpu": "old"}
+    assert compute.calls == 0
+
+
+def test_unreadable_entries_are_rescanned(tmp_path):
+    cache = FileSharedCache(str(tmp_path))
+    with open(cache._path(KEY, "entry"), "wb") as file:
+        file.write(b"garbage")
+    assert cache.get(KEY, Counter(), ttl=60)[0] == {"cpu": 1}
+
+
+def test_ledger_shared_through_a_file(tmp_path):
+    path = str(tmp_path / "reservations.json")
+    first, second = ReservationLedger(path=path), ReservationLedger(path=path)
+    _, reservation = first.reserve_placement(CLUSTER, "default", NODES, 3, 1000, 1024)
+    # the other worker plans against what is left
+    plan, _ = second.reserve_placement(CLUSTER, "default", NODES, 2, 1000, 1024)
+    assert not plan.feasible
+    assert second.outstanding(CLUSTER) == (3000, 3072, 3)
+
+    assert second.release(reservation.id)
+    assert first.stats()["outstanding"] == 0
+
+
+def test_shared_ledger_replace_and_expiry(tmp_path):
+    path = str(tmp_path / "reservations.json")
+    first, second = ReservationLedger(path=path), ReservationLedger(path=path)
+    _, held = first.reserve_placement(CLUSTER, "default", NODES, 3, 1000, 1024)
+    plan, reservation = second.reserve_placement(
+        CLUSTER, "default", NODES, 4, 1000, 1024, replace=held.id
+    )
+    assert plan.feasible
+    assert first.stats()["pods"] == 4
+    assert not first.release(held.id)
+    assert first.release(reservation.id)
+
+    first.reserve_placement(CLUSTER, "default", NODES, 2, 1000, 1024, ttl=0)
+    assert second.stats()["outstanding"] == 0
+    assert second.outstanding(CLUSTER) == (0, 0, 0)
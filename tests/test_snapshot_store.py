@@ -0,0 +1,134 @@
+""" Binary format and warm loading of persisted capacity snapshots """
+
+import struct
+import time
+
+from ..utils.cluster_state import COLUMNS, ClusterState
+from ..utils.records import NodeRecord
+from ..utils.snapshot_store import MAGIC, SnapshotStore, _ClusterSnapshot, _decode, _encode
+
+CLUSTER = ("https://cluster", "token", False)
+NODES = [
+    NodeRecord("a", {}, {"cpu": "4", "memory": "8Gi", "pods": "110"}, True),
+    NodeRecord("b", {}, {"cpu": "2", "memory": "4Gi", "pods": "110"}, False),
+]
+PODS = [
+    {"metadata": {"name": "p1", "namespace": "default"}, "spec": {"nodeName": "a", "containers": [
+        {"resources": {"requests": {"cpu": "500m", "memory": "512Mi"}}}
+    ]}},
+    {"metadata": {"name": "p2", "namespace": "load"}, "spec": {"containers": [
+        {"resources": {"requests": {"cpu": "1"}, "limits": {"cpu": "2", "memory": "1Gi"}}}
+    ]}},
+]
+
+
+def capacity_key(namespace: str) -> tuple:
+    return ("capacity", *CLUSTER, namespace)
+
+
+def state() -> ClusterState:
+    return ClusterState.from_raw(PODS, NODES)
+
+
+def test_round_trip():
+    snapshot = _ClusterSnapshot()
+    snapshot.capacity = {
+        "default": (1000.0, {"cpu": 1500.0, "memory": 2048.0, "pods": 10}),
+        "load": (2000.0, {"cpu": 1.0, "memory": 2.0, "pods": 3,
+                          "used": {"cpu": 0.5, "memory": 1.5, "pods": 2}}),
+    }
+    snapshot.state = state()
+    snapshot.state_created = 3000.0
+
+    decoded = _decode(_encode(snapshot))
+    assert decoded.capacity == snapshot.capacity
+    assert decoded.state_created == 3000.0
+    for column in COLUMNS:
+        assert getattr(decoded.state, column) == getattr(snapshot.state, column), column
+    assert decoded.state.namespaces.names == ["default", "load"]
+    assert decoded.state.nodes.names == ["a", "b"]
+    assert decoded.state.nodes_free_resources() == snapshot.state.nodes_free_resources()
+
+
+def test_unknown_sections_are_skipped():
+    snapshot = _ClusterSnapshot()
+    snapshot.capacity = {"default": (1000.0, {"cpu": 1.0, "memory": 2.0, "pods": 3})}
+    data = bytearray(_encode(snapshot))
+    magic, version, count = struct.unpack_from("<8sHI", data, 0)
+    struct.pack_into("<8sHI", data, 0, magic, version, count + 1)
+    data += struct.pack("<BQ", 99, 3) + b"new"
+    assert _decode(bytes(data)).capacity == snapshot.capacity
+
+
+def test_load_after_restart(tmp_path):
+    store = SnapshotStore(str(tmp_path), write_interval=0)
+    store.save(capacity_key("default"), {"cpu": 1.0, "memory": 2.0, "pods": 3})
+    store.save_state(CLUSTER, state())
+
+    restarted = SnapshotStore(str(tmp_path))
+    capacity, age = restarted.load(capacity_key("default"))
+    assert capacity == {"cpu": 1.0, "memory": 2.0, "pods": 3}
+    assert 0 <= age < 60
+    nodes, _ = restarted.load(("nodes", *CLUSTER))
+    assert nodes == state().nodes_free_resources()
+    # handed out once: the capacity cache refreshes it from then on
+    assert restarted.load(capacity_key("default")) is None
+    assert restarted.load(("nodes", *CLUSTER)) is None
+
+
+def test_old_snapshots_are_not_served(tmp_path):
+    store = SnapshotStore(str(tmp_path), write_interval=0)
+    store.save(capacity_key("default"), {"cpu": 1.0, "memory": 2.0, "pods": 3})
+    store.save_state(CLUSTER, state())
+    snapshot = store._clusters[CLUSTER]
+    snapshot.state_created = time.time() - 120
+    snapshot.capacity["default"] = (time.time() - 120, snapshot.capacity["default"][1])
+    snapshot.dirty = True
+    store.flush()
+
+    restarted = SnapshotStore(str(tmp_path), max_age=3600, nodes_max_age=30)
+    # node snapshots decide placements: they are only trusted for about the cache TTL
+    assert restarted.load(("nodes", *CLUSTER)) is None
+    assert restarted.load(capacity_key("default")) is not None
+
+
+def test_corrupt_files_are_ignored(tmp_path):
+    store = SnapshotStore(str(tmp_path), write_interval=0)
+    store.save(capacity_key("default"), {"cpu": 1.0, "memory": 2.0, "pods": 3})
+    path = store._path(CLUSTER)
+    with open(path, "r+b") as file:
+        data = file.read()
+        file.seek(0)
+        file.write(data[:len(data) // 2])
+        file.truncate()
+    assert SnapshotStore(str(tmp_path)).load(capacity_key("default")) is None
+
+    with open(path, "wb") as file:
+        file.write(b"not a snapshot")
+    assert SnapshotStore(str(tmp_path)).load(capacity_key("default")) is None
+
+
+def test_other_format_versions_are_ignored(tmp_path):
+    store = SnapshotStore(str(tmp_path), write_interval=0)
+    store.save(capacity_key("default"), {"cpu": 1.0, "memory": 2.0, "pods": 3})
+    path = store._path(CLUSTER)
+    with open(path, "r+b") as file:
+        file.write(struct.pack("<8sH", MAGIC, 0))
+    assert SnapshotStore(str(tmp_path)).load(capacity_key("default")) is None
+
+
+def test_writes_are_throttled(tmp_path):
+    store = SnapshotStore(str(tmp_path), write_interval=3600)
+    store.save(capacity_key("default"), {"cpu": 1.0, "memory": 2.0, "pods": 3})
+    store.save(capacity_key("load"), {"cpu": 4.0, "memory": 5.0, "pods": 6})
+    assert SnapshotStore(str(tmp_path)).load(capacity_key("load")) is None
+    store.flush()
+    assert SnapshotStore(str(tmp_path)).load(capacity_key("load"))[0] == \
+        {"cpu": 4.0, "memory": 5.0, "pods": 6}
+
+
+def test_disabled_without_directory():
+    store = SnapshotStore()
+    store.save(capacity_key("default"), {"cpu": 1.0, "memory": 2.0, "pods": 3})
+    assert not store.enabled
+    assert store.load(capacity_key("default")) is None
@@ -1 +1,20 @@
-from .k8s_api import get_cluster_capacity, get_core_api
+from .k8s_api import get_cluster_capacity, get_core_api, get_nodes_free_resources, \
+    get_cached_nodes_free_resources
+from .capacity_cache import capacity_cache
+from .client_pool import client_pool, get_cluster_key
+from .informer import informers
+from .placement import plan_placement, spread_placement, PlacementPlan, NodeResources
+from .collector import capacity_collector, get_cached_cluster_capacity
+from .namespaces import get_cached_namespace_names, page_namespace_names, \
+    DEFAULT_NAMESPACES_LIMIT
+from .reservations import reservations, Reservation
+from .admission import admission_queue
+from .fleet import FleetMember, rank_clusters, split_runners
+from .resource_metrics import resource_metrics, get_cached_pod_metrics, pods_utilization
+from .instrumentation import instrumentation, InMemorySink
+from .snapshot_store import snapshot_store
+from .shared_cache import FileSharedCache
+from .execution_plan import execution_planner
+from .capacity_batch import CapacityTarget, iter_batch_capacity
+from .health import cluster_health, ClusterUnavailable
+from .autoscaling import autoscaling_planner, parse_autoscaler_status
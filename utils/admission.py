@@ -0,0 +1,198 @@
+import itertools
+import threading
+import time
+import uuid
+from collections import deque
+from typing import TYPE_CHECKING, Deque, Dict, List, Optional
+
+from . import k8s_api
+from .client_pool import get_cluster_key
+from .collector import capacity_collector
+from .placement import NodeResources
+from .reservations import reservations
+
+if TYPE_CHECKING:
+    from kubernetes.client import CoreV1Api
+
+
+class _Ticket:
+    """ A test launch waiting for admission """
+
+    def __init__(self, core_api: "CoreV1Api", project_id: int, test_id: Optional[int],
+                 namespace: str, runners: int, runner_cpu: float, runner_memory: float,
+                 post_processor_cpu: float, post_processor_memory: float, priority: int,
+                 sequence: int, reservation_id: Optional[str]):
+        self.id = str(uuid.uuid4())
+        self.core_api = core_api
+        self.cluster = get_cluster_key(core_api.api_client)
+        self.project_id = project_id
+        self.test_id = test_id
+        self.namespace = namespace
+        self.runners = runners
+        self.runner_cpu = runner_cpu
+        self.runner_memory = runner_memory
+        self.post_processor_cpu = post_processor_cpu
+        self.post_processor_memory = post_processor_memory
+        self.priority = priority
+        self.sequence = sequence
+        self.enqueued = self.seen = time.monotonic()
+        self.admitted: Optional[float] = None
+        # held by the test already, then replaced by the reservation of its admission
+        self.reservation_id = reservation_id
+
+
+class AdmissionQueue:
+    """
+    Holds test launches until the cluster capacity snapshot says they fit.
+
+    Waiting tests of a cluster are ordered by priority, then by how many tests their
+    project had admitted recently (fair sharing), then by arrival. Admission is strict
+    in that order: a test is never admitted ahead of an earlier one that doesn't fit,
+    so large tests are not starved by a stream of small ones.
+
+    Admitting a test reserves its placement in the reservation ledger, replacing any
+    reservation the test already held. Callers poll with their ticket; tickets not
+    polled within `ticket_ttl` seconds are dropped.
+    """
+
+    def __init__(self, ticket_ttl: float = 120.0, fair_share_window: float = 300.0):
+        """
+        :param ticket_ttl: seconds a ticket is kept without being polled.
+        :param fair_share_window: seconds an admission counts against its project's share.
+        """
+        self.ticket_ttl = ticket_ttl
+        self.fair_share_window = fair_share_window
+        self._tickets: Dict[str, _Ticket] = {}
+        self._admissions: Dict[int, Deque[float]] = {}
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def configure(self, ticket_ttl: float = None, fair_share_window: float = None) -> None:
+        if ticket_ttl is not None:
+            self.ticket_ttl = ticket_ttl
+        if fair_share_window is not None:
+            self.fair_share_window = fair_share_window
+
+    def request(self, core_api: "CoreV1Api", project_id: int, namespace: str, runners: int,
+                runner_cpu: float, runner_memory: float, post_processor_cpu: float = 0,
+                post_processor_memory: float = 0, priority: int = 0,
+                test_id: Optional[int] = None, ticket: Optional[str] = None,
+                reservation_id: Optional[str] = None) -> dict:
+        """
+        Ask for a test to be admitted, or poll a ticket returned by an earlier call.
+
+        :param core_api: a `CoreV1Api` object for the cluster the test runs on.
+        :param project_id: the project launching the test.
+        :param namespace: the namespace the test runs in.
+        :param priority: tests with a higher priority are admitted first.
+        :param test_id: the test, for reporting only.
+        :param ticket: the ticket of an earlier request; a new ticket is created
+                       if it is unknown or expired.
+        :param reservation_id: a reservation the test already holds; it is replaced by
+                               the one of its admission, or released if it is cancelled.
+
+        The resource parameters are the ones of `plan_placement`.
+
+        :return: a dictionary with the 'ticket', the 'decision' ('admitted' or
+                 'queued'), the 'position' in the cluster queue (0 once admitted),
+                 the 'queue_depth' of the cluster, the 'wait_time' in seconds and
+                 the 'reservation_id' held for the test.
+        """
+        # scanned before taking the lock, so a slow cluster doesn't hold up the others
+        nodes = k8s_api.get_cached_nodes_free_resources(core_api, capacity_collector.timeout)
+        with self._lock:
+            self._expire()
+            entry = self._tickets.get(ticket) if ticket else None
+            if entry is None:
+                entry = _Ticket(
+                    core_api, project_id, test_id, namespace, runners, runner_cpu,
+                    runner_memory, post_processor_cpu, post_processor_memory, priority,
+                    next(self._sequence), reservation_id
+                )
+                self._tickets[entry.id] = entry
+            entry.seen = time.monotonic()
+            if entry.admitted is None:
+                self._schedule(entry.cluster, nodes)
+            return self._status(entry)
+
+    def cancel(self, ticket: str) -> bool:
+        """
+        Drop a ticket, releasing the reservation held for the test.
+
+        :return: whether the ticket was known.
+        """
+        with self._lock:
+            entry = self._tickets.pop(ticket, None)
+        if entry is None:
+            return False
+        if entry.reservation_id:
+            reservations.release(entry.reservation_id)
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._expire()
+            now = time.monotonic()
+            clusters = {}
+            for entry in self._tickets.values():
+                if entry.admitted is not None:
+                    continue
+                cluster = clusters.setdefault(entry.cluster[0], {"depth": 0, "max_wait": 0.0})
+                cluster["depth"] += 1
+                cluster["max_wait"] = max(cluster["max_wait"], now - entry.enqueued)
+            return {
+                "queue_depth": sum(cluster["depth"] for cluster in clusters.values()),
+                "clusters": clusters,
+            }
+
+    def _waiting(self, cluster: tuple) -> List[_Ticket]:
+        """ The waiting tickets of a cluster, in admission order """
+        now = time.monotonic()
+        for admissions in self._admissions.values():
+            while admissions and now - admissions[0] > self.fair_share_window:
+                admissions.popleft()
+        return sorted(
+            (entry for entry in self._tickets.values()
+             if entry.cluster == cluster and entry.admitted is None),
+            key=lambda entry: (
+                -entry.priority, len(self._admissions.get(entry.project_id, ())),
+                entry.sequence
+            )
+        )
+
+    def _schedule(self, cluster: tuple, nodes: List[NodeResources]) -> None:
+        """ Admit waiting tests of a cluster in order, until one doesn't fit """
+        for entry in self._waiting(cluster):
+            _, reservation = reservations.reserve_placement(
+                cluster, entry.namespace, nodes, entry.runners, entry.runner_cpu,
+                entry.runner_memory, entry.post_processor_cpu, entry.post_processor_memory,
+                replace=entry.reservation_id
+            )
+            if reservation is None:
+                return
+            entry.admitted = time.monotonic()
+            entry.reservation_id = reservation.id
+            self._admissions.setdefault(entry.project_id, deque()).append(entry.admitted)
+
+    def _status(self, entry: _Ticket) -> dict:
+        waiting = self._waiting(entry.cluster)
+        admitted = entry.admitted is not None
+        return {
+            "ticket": entry.id,
+            "decision": "admitted" if admitted else "queued",
+            "position": 0 if admitted else waiting.index(entry) + 1,
+            "queue_depth": len(waiting),
+            "wait_time": (entry.admitted if admitted else time.monotonic()) - entry.enqueued,
+            "reservation_id": entry.reservation_id,
+        }
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for ticket in [
+            entry.id for entry in self._tickets.values()
+            if now - entry.seen > self.ticket_ttl
+        ]:
+            del self._tickets[ticket]
+
+
+admission_queue = AdmissionQueue()
@@ -0,0 +1,404 @@
+import re
+import uuid
+from typing import TYPE_CHECKING, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from pylon.core.tools import log
+
+from . import k8s_api
+from .capacity_cache import capacity_cache
+from .client_pool import get_cluster_key
+from .collector import capacity_collector
+from .placement import NodeResources, plan_placement
+from .records import ACTIVE_PODS_FIELD_SELECTOR, list_raw, node_record_from_raw, \
+    pod_record_from_raw
+from .reservations import reservations
+
+if TYPE_CHECKING:
+    from kubernetes.client import CoreV1Api
+
+# node labels naming the node group (pool) a node belongs to, by cloud provider
+NODE_GROUP_LABELS = (
+    "eks.amazonaws.com/nodegroup",
+    "cloud.google.com/gke-nodepool",
+    "kubernetes.azure.com/agentpool",
+    "agentpool",
+    "karpenter.sh/nodepool",
+)
+AUTOSCALER_STATUS = ("kube-system", "cluster-autoscaler-status")
+PLACEHOLDER_LABEL = "carrier.io/placeholder"
+_STATUS_GROUP = re.compile(r"^\s*-?\s*name:\s*(\S+)", re.IGNORECASE | re.MULTILINE)
+_STATUS_MIN = re.compile(r"minSize[=:]\s*(\d+)")
+_STATUS_MAX = re.compile(r"maxSize[=:]\s*(\d+)")
+
+
+class NodeGroup(NamedTuple):
+    """ A group of identical nodes the cluster autoscaler scales """
+    name: str
+    nodes: int
+    min_size: Optional[int]
+    max_size: Optional[int]
+    # the free resources of a new node of the group, None if unknown
+    new_node: Optional[NodeResources]
+    scale_up_seconds: float
+
+
+def parse_autoscaler_status(status: str) -> Dict[str, Tuple[Optional[int], Optional[int]]]:
+    """
+    Read the min and max size of every node group from the cluster autoscaler status.
+
+    Both the plain text status of older autoscaler versions and the YAML one of newer
+    versions are understood.
+
+    :param status: the 'status' of the `cluster-autoscaler-status` config map.
+
+    :return: the (min size, max size) of every node group by name.
+    """
+    sizes = {}
+    matches = list(_STATUS_GROUP.finditer(status))
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(status)
+        section = status[match.end():end]
+        min_size, max_size = _STATUS_MIN.search(section), _STATUS_MAX.search(section)
+        sizes[match.group(1)] = (
+            int(min_size.group(1)) if min_size else None,
+            int(max_size.group(1)) if max_size else None,
+        )
+    return sizes
+
+
+class AutoscalingPlanner:
+    """
+    Estimates the nodes an autoscaled cluster has to add for a test, and how long that
+    takes, and optionally pre-warms them.
+
+    Nodes are grouped by their node group label. A new node of a group is assumed to
+    offer the largest allocatable resources of the group minus the smallest requests
+    seen on a node of the group, i.e. what daemon sets take. Min and max group sizes
+    come from the `node_groups` setting, else from the cluster autoscaler status.
+
+    Pre-warming creates low-priority placeholder pods shaped like the runners that
+    don't fit on the current nodes: they make the autoscaler add the nodes ahead of
+    the test, and are preempted as soon as the runners need the room. They end by
+    themselves after `placeholder_ttl` seconds.
+
+    Node groups and placeholder pods are read through the capacity snapshot cache.
+    """
+
+    def __init__(self, enabled: bool = False, group_labels: Iterable[str] = NODE_GROUP_LABELS,
+                 node_groups: Optional[Dict[str, dict]] = None,
+                 scale_up_seconds: float = 180.0,
+                 placeholder_priority_class: str = "carrier-placeholder",
+                 placeholder_image: str = "registry.k8s.io/pause:3.9",
+                 placeholder_ttl: int = 900):
+        """
+        :param enabled: whether autoscaled clusters are planned at all; off by default,
+            as it adds cluster requests to validating tests that used to make none.
+        :param group_labels: the node labels naming the node group, by precedence.
+        :param node_groups: settings per node group name: 'min_size', 'max_size',
+            'scale_up_seconds' and the 'cpu' (millicores), 'memory' (MiB) and 'pods'
+            of a new node, for groups currently without nodes.
+        :param scale_up_seconds: how long adding nodes takes, unless set per group.
+        :param placeholder_priority_class: the priority class of placeholder pods,
+            created with a priority of -1 if missing.
+        :param placeholder_image: the image of placeholder pods.
+        :param placeholder_ttl: seconds after which placeholder pods end.
+        """
+        self.enabled = enabled
+        self.group_labels = tuple(group_labels)
+        self.node_groups = node_groups or {}
+        self.scale_up_seconds = scale_up_seconds
+        self.placeholder_priority_class = placeholder_priority_class
+        self.placeholder_image = placeholder_image
+        self.placeholder_ttl = placeholder_ttl
+
+    def configure(self, enabled: bool = None, group_labels: Iterable[str] = None,
+                  node_groups: Dict[str, dict] = None, scale_up_seconds: float = None,
+                  placeholder_priority_class: str = None, placeholder_image: str = None,
+                  placeholder_ttl: int = None) -> None:
+        if enabled is not None:
+            self.enabled = enabled
+        if group_labels is not None:
+            self.group_labels = tuple(group_labels)
+        if node_groups is not None:
+            self.node_groups = node_groups
+        if scale_up_seconds is not None:
+            self.scale_up_seconds = scale_up_seconds
+        if placeholder_priority_class is not None:
+            self.placeholder_priority_class = placeholder_priority_class
+        if placeholder_image is not None:
+            self.placeholder_image = placeholder_image
+        if placeholder_ttl is not None:
+            self.placeholder_ttl = placeholder_ttl
+
+    def get_node_groups(self, v1: "CoreV1Api") -> List[NodeGroup]:
+        """ The node groups of the cluster, served from the capacity snapshot cache """
+        return capacity_cache.get(
+            ("node_groups", *get_cluster_key(v1.api_client)),
+            lambda: self._node_groups(v1)
+        )
+
+    def _node_groups(self, v1: "CoreV1Api") -> List[NodeGroup]:
+        free = {node.name: node for node in self._free_nodes(v1, reserved=False)}
+        groups: Dict[str, List[tuple]] = {}
+        for raw in list_raw(v1.list_node):
+            labels = raw["metadata"].get("labels") or {}
+            name = next((labels[label] for label in self.group_labels if label in labels), "")
+            record = node_record_from_raw(raw)
+            groups.setdefault(name, []).append(
+                (k8s_api.get_node_capacity(record), free.get(record.name))
+            )
+        for name in self.node_groups:
+            groups.setdefault(name, [])
+
+        sizes = self._autoscaler_sizes(v1)
+        node_groups = []
+        for name, nodes in groups.items():
+            settings = self.node_groups.get(name, {})
+            min_size, max_size = sizes.get(name, (None, None))
+            if not name:
+                # nodes without a group label are not scaled
+                min_size = max_size = len(nodes)
+            node_groups.append(NodeGroup(
+                name or None,
+                len(nodes),
+                settings.get("min_size", min_size),
+                settings.get("max_size", max_size),
+                self._new_node(name, nodes, settings),
+                settings.get("scale_up_seconds", self.scale_up_seconds),
+            ))
+        return node_groups
+
+    @staticmethod
+    def _new_node(name: str, nodes: List[tuple], settings: dict) -> Optional[NodeResources]:
+        if all(key in settings for key in ("cpu", "memory")):
+            return NodeResources(f"{name}/new", settings["cpu"], settings["memory"],
+                                 settings.get("pods", 110))
+        allocatable = [capacity for capacity, _ in nodes]
+        taken = [
+            (capacity[0] - node.cpu, capacity[1] - node.memory, capacity[2] - node.pods)
+            for capacity, node in nodes if node is not None
+        ]
+        if not allocatable or not taken:
+            return None
+        return NodeResources(
+            f"{name}/new",
+            max(cpu for cpu, _, _ in allocatable) - min(cpu for cpu, _, _ in taken),
+            max(memory for _, memory, _ in allocatable) - min(memory for _, memory, _ in taken),
+            max(pods for _, _, pods in allocatable) - min(pods for _, _, pods in taken),
+        )
+
+    @staticmethod
+    def _autoscaler_sizes(v1: "CoreV1Api") -> Dict[str, Tuple[Optional[int], Optional[int]]]:
+        from kubernetes.client.rest import ApiException
+
+        namespace, name = AUTOSCALER_STATUS
+        try:
+            config_map = v1.read_namespaced_config_map(name, namespace)
+        except ApiException as exc:
+            if exc.status not in (403, 404):
+                log.warning("Failed to read the cluster autoscaler status: %s", exc.reason)
+            return {}
+        return parse_autoscaler_status((config_map.data or {}).get("status", ""))
+
+    @staticmethod
+    def _placeholder_requests(v1: "CoreV1Api") -> Dict[str, Tuple[float, float, int]]:
+        """ The CPU, memory and pods placeholder pods take on every node """
+        requests = {}
+        for pod in list_raw(v1.list_pod_for_all_namespaces, label_selector=PLACEHOLDER_LABEL,
+                            field_selector=ACTIVE_PODS_FIELD_SELECTOR):
+            node = (pod.get("spec") or {}).get("nodeName")
+            if not node:
+                continue
+            cpu, memory = k8s_api.get_pod_resource_requests(pod_record_from_raw(pod))
+            total_cpu, total_memory, total_pods = requests.get(node, (0.0, 0.0, 0))
+            requests[node] = (total_cpu + cpu, total_memory + memory, total_pods + 1)
+        return requests
+
+    def _free_nodes(self, v1: "CoreV1Api", reserved: bool = True) -> List[NodeResources]:
+        """
+        Free resources of the nodes, counting what placeholder pods take as free.
+
+        :param reserved: whether the outstanding reservations are subtracted.
+        """
+        credit = capacity_cache.get(
+            ("placeholders", *get_cluster_key(v1.api_client)),
+            lambda: self._placeholder_requests(v1)
+        )
+        nodes = k8s_api.get_cached_nodes_free_resources(v1, capacity_collector.timeout)
+        if reserved:
+            nodes = reservations.adjust_nodes(get_cluster_key(v1.api_client), nodes)
+        return [
+            NodeResources(node.name, *(
+                free + extra for free, extra in zip(node[1:], credit.get(node.name, (0, 0, 0)))
+            ))
+            for node in nodes
+        ]
+
+    def plan(self, v1: "CoreV1Api", runners: int, runner_cpu: float, runner_memory: float,
+             post_processor_cpu: float = 0, post_processor_memory: float = 0) -> dict:
+        """
+        Estimate the nodes the autoscaler has to add for a test.
+
+        Runners go to the current nodes first, then to new nodes of the node groups with
+        room left below their max size, largest new nodes first.
+
+        :param v1: a `CoreV1Api` object for interacting with the Kubernetes API.
+
+        The remaining parameters are the ones of `plan_placement`.
+
+        :return: a dictionary with 'fits_now' (no node has to be added), the runners
+                 placed on 'existing_nodes' and on new nodes ('new_node_runners'),
+                 whether the post-processor goes to a new node
+                 ('new_node_post_processor'), the 'new_nodes' to add per group and in
+                 total ('new_nodes_total'), the pods that can't be placed even at max
+                 group sizes ('unplaceable'), the estimated 'scale_up_seconds' and the
+                 'node_groups', as `describe`.
+        """
+        node_groups = self.get_node_groups(v1)
+        current = plan_placement(
+            self._free_nodes(v1), runners, runner_cpu, runner_memory,
+            post_processor_cpu, post_processor_memory
+        )
+        has_post_processor = post_processor_cpu > 0 or post_processor_memory > 0
+        post_processor_missing = has_post_processor and current.post_processor is None
+
+        # as many new nodes per group as could be needed, capped by the group max size
+        needed = current.unplaced + int(post_processor_missing)
+        virtual_nodes, groups_of = [], {}
+        for group in node_groups:
+            if group.new_node is None or not needed:
+                continue
+            room = needed if group.max_size is None else \
+                min(max(group.max_size - group.nodes, 0), needed)
+            for index in range(room):
+                name = f"{group.name}/new-{index}"
+                virtual_nodes.append(group.new_node._replace(name=name))
+                groups_of[name] = group
+        added = plan_placement(
+            virtual_nodes, current.unplaced, runner_cpu, runner_memory,
+            *((post_processor_cpu, post_processor_memory) if post_processor_missing else ())
+        )
+
+        new_nodes: Dict[str, int] = {}
+        for name in {*added.runners, *([added.post_processor] if added.post_processor else [])}:
+            group = groups_of[name].name
+            new_nodes[group] = new_nodes.get(group, 0) + 1
+        return {
+            "fits_now": current.feasible,
+            "existing_nodes": runners - current.unplaced,
+            "new_node_runners": current.unplaced - added.unplaced,
+            "new_node_post_processor": added.post_processor is not None,
+            "new_nodes": new_nodes,
+            "new_nodes_total": sum(new_nodes.values()),
+            "unplaceable": added.unplaced + int(
+                post_processor_missing and added.post_processor is None
+            ),
+            "scale_up_seconds": max(
+                (group.scale_up_seconds for group in node_groups if group.name in new_nodes),
+                default=0.0
+            ),
+            "node_groups": self.describe(node_groups),
+        }
+
+    @staticmethod
+    def describe(node_groups: List[NodeGroup]) -> List[dict]:
+        """ Node groups as dictionaries, new node resources in millicores and MiB """
+        return [
+            {
+                "name": group.name,
+                "nodes": group.nodes,
+                "min_size": group.min_size,
+                "max_size": group.max_size,
+                "new_node": {
+                    "cpu": group.new_node.cpu, "memory": group.new_node.memory,
+                    "pods": group.new_node.pods,
+                } if group.new_node else None,
+                "scale_up_seconds": group.scale_up_seconds,
+            }
+            for group in node_groups
+        ]
+
+    def prewarm(self, v1: "CoreV1Api", namespace: str, runners: int, runner_cpu: float,
+                runner_memory: float, post_processor_cpu: float = 0,
+                post_processor_memory: float = 0, ttl: Optional[int] = None) -> dict:
+        """
+        Create placeholder pods for the pods of a test that the current nodes can't fit,
+        so the autoscaler adds nodes for them ahead of the test.
+
+        :param namespace: the namespace the placeholder pods are created in.
+        :param ttl: seconds after which the placeholders end; defaults to
+            `placeholder_ttl`.
+
+        The remaining parameters are the ones of `plan`.
+
+        :return: the 'id' of the placeholders, for `release`, the number of 'pods'
+                 created, their 'ttl' and the 'plan' they were created from.
+        """
+        plan = self.plan(v1, runners, runner_cpu, runner_memory,
+                         post_processor_cpu, post_processor_memory)
+        shapes = [(runner_cpu, runner_memory)] * plan["new_node_runners"]
+        if plan["new_node_post_processor"]:
+            shapes.append((post_processor_cpu, post_processor_memory))
+        placeholder_id = str(uuid.uuid4())
+        ttl = self.placeholder_ttl if ttl is None else ttl
+        if shapes:
+            self._ensure_priority_class(v1)
+            for cpu, memory in shapes:
+                v1.create_namespaced_pod(
+                    namespace, self._placeholder_pod(placeholder_id, cpu, memory, ttl)
+                )
+            log.info("Pre-warming %s nodes with %s placeholder pods in %s",
+                     plan["new_nodes_total"], len(shapes), namespace)
+        return {"id": placeholder_id, "pods": len(shapes), "ttl": ttl, "plan": plan}
+
+    @staticmethod
+    def release(v1: "CoreV1Api", namespace: str, placeholder_id: str) -> None:
+        """ Delete the placeholder pods created by `prewarm` """
+        v1.delete_collection_namespaced_pod(
+            namespace, label_selector=f"{PLACEHOLDER_LABEL}={placeholder_id}",
+            grace_period_seconds=0
+        )
+
+    def _placeholder_pod(self, placeholder_id: str, cpu: float, memory: float,
+                         ttl: int) -> dict:
+        resources = {"cpu": f"{int(cpu)}m", "memory": f"{int(memory)}Mi"}
+        return {
+            "apiVersion": "v1",
+            "kind": "Pod",
+            "metadata": {
+                "generateName": "carrier-placeholder-",
+                "labels": {PLACEHOLDER_LABEL: placeholder_id},
+            },
+            "spec": {
+                "priorityClassName": self.placeholder_priority_class,
+                "activeDeadlineSeconds": ttl,
+                "terminationGracePeriodSeconds": 0,
+                "restartPolicy": "Never",
+                "containers": [{
+                    "name": "placeholder",
+                    "image": self.placeholder_image,
+                    "resources": {"requests": resources, "limits": resources},
+                }],
+            },
+        }
+
+    def _ensure_priority_class(self, v1: "CoreV1Api") -> None:
+        from kubernetes.client import SchedulingV1Api
+        from kubernetes.client.rest import ApiException
+
+        try:
+            SchedulingV1Api(v1.api_client).create_priority_class({
+                "apiVersion": "scheduling.k8s.io/v1",
+                "kind": "PriorityClass",
+                "metadata": {"name": self.placeholder_priority_class},
+                # the lowest priority the cluster autoscaler still scales up for
+                "value": -1,
+                "globalDefault": False,
+                "description": "Placeholder pods pre-warming nodes for load tests",
+            })
+        except ApiException as exc:
+            if exc.status != 409:
+                raise
+
+
+autoscaling_planner = AutoscalingPlanner()
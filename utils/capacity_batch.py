@@ -0,0 +1,82 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING, Dict, Hashable, Iterable, Iterator, List, NamedTuple, \
+    Optional
+
+from .client_pool import get_cluster_key
+from .collector import capacity_collector
+
+if TYPE_CHECKING:
+    from kubernetes.client import CoreV1Api
+
+
+class CapacityTarget(NamedTuple):
+    """ One (integration, namespace) pair of a batch capacity request """
+    integration_id: Optional[Hashable]
+    core_api: "CoreV1Api"
+    namespace: str
+
+
+def group_by_cluster(targets: Iterable[CapacityTarget]) -> Dict[tuple, List[CapacityTarget]]:
+    """ Group batch targets by cluster identity, as `get_cluster_key` """
+    clusters = {}
+    for target in targets:
+        clusters.setdefault(get_cluster_key(target.core_api.api_client), []).append(target)
+    return clusters
+
+
+def _collect_cluster(targets: List[CapacityTarget], timeout: Optional[float]) -> dict:
+    capacities = capacity_collector.collect_many(
+        targets[0].core_api, (target.namespace for target in targets), timeout=timeout
+    )
+    results = []
+    for target in targets:
+        capacity = capacities[target.namespace]
+        results.append({
+            "integration_id": target.integration_id,
+            "namespace": target.namespace,
+            **({"error": str(capacity)} if isinstance(capacity, BaseException)
+               else {"capacity": capacity}),
+        })
+    return {"hostname": targets[0].core_api.api_client.configuration.host, "results": results}
+
+
+def iter_batch_capacity(targets: Iterable[CapacityTarget],
+                        timeout: Optional[float] = None) -> Iterator[dict]:
+    """
+    Collect the capacity of many (integration, namespace) pairs, one pass per cluster.
+
+    Pairs are deduplicated by cluster identity, so integrations sharing a cluster and
+    credentials share its node and pod scan; clusters are collected concurrently and
+    yielded as each one finishes.
+
+    :param targets: the pairs to collect.
+    :param timeout: seconds the collection of a cluster may take; defaults to the
+        collector timeout.
+
+    :return: an iterator of one dictionary per cluster, with its 'hostname' and the
+             'results' of its pairs: 'integration_id', 'namespace' and either the
+             'capacity', as `CapacityCollector.collect`, or an 'error'.
+    """
+    clusters = list(group_by_cluster(targets).values())
+    if not clusters:
+        return
+    # not the collector executor: every cluster collection waits on that one
+    with ThreadPoolExecutor(max_workers=min(len(clusters), capacity_collector.max_workers),
+                            thread_name_prefix="k8s-capacity-batch") as executor:
+        futures = {
+            executor.submit(_collect_cluster, cluster, timeout): cluster
+            for cluster in clusters
+        }
+        for future in as_completed(futures):
+            cluster = futures[future]
+            if future.exception() is None:
+                yield future.result()
+                continue
+            yield {
+                "hostname": cluster[0].core_api.api_client.configuration.host,
+                "results": [
+                    {"integration_id": target.integration_id, "namespace": target.namespace,
+                     "error": str(future.exception())}
+                    for target in cluster
+                ],
+            }
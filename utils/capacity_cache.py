@@ -0,0 +1,202 @@
+import threading
+import time
+from copy import copy
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from pylon.core.tools import log
+
+from .health import ClusterUnavailable
+
+
+class _Flight:
+    """ A capacity computation in progress that other callers can wait on """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class CapacityCache:
+    """
+    TTL cache of capacity snapshots keyed by (kind, cluster, namespace).
+
+    Concurrent requests for the same missing or expired key are coalesced: only the
+    first caller runs the scan, the others wait for its result (or its exception).
+    """
+
+    def __init__(self, ttl: float = 30.0):
+        """
+        :param ttl: seconds a snapshot is served from the cache before it is rescanned.
+        """
+        self.ttl = ttl
+        self._entries: Dict[Hashable, tuple] = {}
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._warm_hits = 0
+        self.backing = None
+        self.shared = None
+
+    def configure(self, ttl: float = None, backing=None, shared=None) -> None:
+        """
+        Update the cache TTL and set optional backends.
+
+        :param backing: the store snapshots are saved to and warm-loaded from after
+            a restart: any object with `load(key) -> (value, age) | None` and
+            `save(key, value)` methods.
+        :param shared: the cache shared with the other worker processes, consulted
+            instead of scanning on a miss: any object with
+            `get(key, compute, ttl) -> (value, age)` and `put(key, value)` methods,
+            e.g. `FileSharedCache`.
+        """
+        if ttl is not None:
+            self.ttl = ttl
+        if backing is not None:
+            self.backing = backing
+        if shared is not None:
+            self.shared = shared
+
+    def get(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        Return the cached snapshot for `key`, computing it with `compute` if needed.
+
+        If there is no snapshot in memory but the backing store has one, e.g. persisted
+        before a restart, it is served right away while a background scan refreshes it.
+        An expired snapshot is also served when the circuit of its cluster is open.
+
+        :param key: the (kind, cluster, namespace) identity of the snapshot.
+        :param compute: a callable performing the live scan.
+
+        :return: a copy of the snapshot, so callers are free to modify it.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self._hits += 1
+                return copy(entry[0])
+            if entry is None and self.backing is not None:
+                entry = self._load_warm(key)
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            if entry is not None and entry[2]:
+                self._warm_hits += 1
+                if leader:
+                    threading.Thread(
+                        target=self._refresh, args=(key, flight, compute),
+                        name="k8s-capacity-refresh", daemon=True
+                    ).start()
+                return copy(entry[0])
+            self._misses += 1
+            if not leader:
+                self._coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                if isinstance(flight.error, ClusterUnavailable) and entry is not None:
+                    return copy(entry[0])
+                raise flight.error
+            return copy(flight.result)
+
+        try:
+            self._run(key, flight, compute)
+        except ClusterUnavailable:
+            # the cluster is known to be down: the expired snapshot beats an error
+            if entry is None:
+                raise
+            return copy(entry[0])
+        return copy(flight.result)
+
+    def _run(self, key: Hashable, flight: _Flight, compute: Callable[[], Any]) -> None:
+        age = 0.0
+        try:
+            if self.shared is not None:
+                flight.result, age = self.shared.get(key, compute, self.ttl)
+            else:
+                flight.result = compute()
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                if flight.error is None:
+                    self._entries[key] = (flight.result, time.monotonic() - age, False)
+                elif key in self._entries and self._entries[key][2]:
+                    # the warm snapshot could not be refreshed; don't serve it forever
+                    del self._entries[key]
+                self._flights.pop(key, None)
+            flight.done.set()
+        if self.backing is not None:
+            self.backing.save(key, flight.result)
+
+    def _refresh(self, key: Hashable, flight: _Flight, compute: Callable[[], Any]) -> None:
+        try:
+            self._run(key, flight, compute)
+        except Exception as exc:  # pylint: disable=W0703
+            log.warning("Failed to refresh warm capacity snapshot: %s", exc)
+
+    def _load_warm(self, key: Hashable) -> Optional[tuple]:
+        try:
+            loaded = self.backing.load(key)
+        except Exception as exc:  # pylint: disable=W0703
+            log.warning("Failed to load persisted capacity snapshot: %s", exc)
+            return None
+        if loaded is None:
+            return None
+        value, age = loaded
+        entry = self._entries[key] = (value, time.monotonic() - age, True)
+        return entry
+
+    def peek(self, key: Hashable) -> Optional[Tuple[Any, float]]:
+        """
+        Return the last snapshot stored for `key` regardless of its TTL.
+
+        :return: a copy of the snapshot and its age in seconds, or None if there is none.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        return copy(entry[0]), time.monotonic() - entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """ Store a snapshot computed outside of `get` """
+        with self._lock:
+            self._entries[key] = (value, time.monotonic(), False)
+        if self.shared is not None:
+            self.shared.put(key, value)
+        if self.backing is not None:
+            self.backing.save(key, value)
+
+    def invalidate(self, key: Hashable = None) -> None:
+        """ Drop the snapshot for `key`, or every snapshot if no key is given """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        """ Hit/miss counters and the age in seconds of every cached snapshot """
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "ttl": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "coalesced": self._coalesced,
+                "warm_hits": self._warm_hits,
+                "in_flight": len(self._flights),
+                "entries": [
+                    {"key": list(key), "age": now - created, "warm": warm}
+                    for key, (_, created, warm) in self._entries.items()
+                ],
+            }
+
+
+capacity_cache = CapacityCache()
@@ -0,0 +1,161 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Tuple, Dict
+
+from pylon.core.tools import log
+
+if TYPE_CHECKING:
+    from kubernetes.client import ApiClient
+
+
+def token_fingerprint(token: str) -> str:
+    """
+    Build a short, non-reversible fingerprint of a Kubernetes token.
+
+    The fingerprint is used in cache keys so the token itself is never kept around
+    longer than the client that needs it, nor written to logs.
+
+    :param token: the token to authenticate with the Kubernetes API.
+
+    :return: a hex digest identifying the token.
+    """
+    return hashlib.sha256(str(token).encode()).hexdigest()[:16]
+
+
+def get_cluster_key(api_client: "ApiClient") -> Tuple[str, str, bool]:
+    """
+    Identify the cluster and credentials an `ApiClient` talks to.
+
+    :param api_client: the client to identify.
+
+    :return: the same (hostname, token fingerprint, secure_connection) key
+    the client pool uses.
+    """
+    configuration = api_client.configuration
+    return (
+        configuration.host,
+        token_fingerprint(configuration.api_key.get('authorization', '')),
+        bool(configuration.verify_ssl)
+    )
+
+
+class ClientPool:
+    """
+    Bounded pool of reusable `ApiClient` objects.
+
+    Clients are keyed by (hostname, token fingerprint, secure_connection), so every
+    caller talking to the same cluster with the same credentials shares one urllib3
+    connection pool and keeps its keep-alive connections. The least recently used
+    client is closed when the pool is full, and clients unused for `idle_timeout`
+    seconds are closed on the next access.
+    """
+
+    def __init__(self, max_size: int = 32, idle_timeout: float = 300.0,
+                 connections_per_client: int = 16):
+        """
+        :param max_size: the maximum number of clients kept open at once.
+        :param idle_timeout: seconds after which an unused client is closed.
+        :param connections_per_client: the size of the urllib3 connection pool of
+            every client, i.e. how many concurrent callers can share it without
+            opening extra sockets.
+        """
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.connections_per_client = connections_per_client
+        self._clients: "OrderedDict[Tuple[str, str, bool], Tuple[ApiClient, float]]" = \
+            OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, max_size: int = None, idle_timeout: float = None,
+                  connections_per_client: int = None) -> None:
+        """ Update pool limits; new limits apply on the next access """
+        with self._lock:
+            if max_size is not None:
+                self.max_size = max_size
+            if idle_timeout is not None:
+                self.idle_timeout = idle_timeout
+            if connections_per_client is not None:
+                self.connections_per_client = connections_per_client
+
+    def get(self, token: str, hostname: str, secure_connection: bool = False) -> "ApiClient":
+        """
+        Return a pooled `ApiClient` for the cluster, creating it if needed.
+
+        :param token: the token to authenticate with the Kubernetes API.
+        :param hostname: the hostname of the Kubernetes API.
+        :param secure_connection: whether to verify ssl certificate when communicating
+        with the Kubernetes API.
+
+        :return: an `ApiClient` shared by all callers with the same key.
+        """
+        host = hostname.rstrip('/')
+        key = (host, token_fingerprint(token), bool(secure_connection))
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            evicted.extend(self._pop_idle(now))
+            entry = self._clients.pop(key, None)
+            if entry is None:
+                api_client = self._create_client(token, host, secure_connection)
+            else:
+                api_client = entry[0]
+            self._clients[key] = (api_client, now)
+            while len(self._clients) > self.max_size:
+                _, (lru_client, _) = self._clients.popitem(last=False)
+                evicted.append(lru_client)
+        for client in evicted:
+            self._close_client(client)
+        return api_client
+
+    def close_all(self) -> None:
+        """ Close every pooled client """
+        with self._lock:
+            clients = [client for client, _ in self._clients.values()]
+            self._clients.clear()
+        for client in clients:
+            self._close_client(client)
+
+    def stats(self) -> Dict[str, float]:
+        """ Current pool size and limits """
+        with self._lock:
+            return {
+                "size": len(self._clients),
+                "max_size": self.max_size,
+                "idle_timeout": self.idle_timeout,
+                "connections_per_client": self.connections_per_client,
+            }
+
+    def _pop_idle(self, now: float) -> list:
+        idle = []
+        for key, (client, last_used) in list(self._clients.items()):
+            if now - last_used > self.idle_timeout:
+                del self._clients[key]
+                idle.append(client)
+        return idle
+
+    def _create_client(self, token: str, host: str, secure_connection: bool) -> "ApiClient":
+        # the Kubernetes client is imported on first use, it is heavy to load
+        from kubernetes.client import Configuration
+        from .instrumented_client import InstrumentedApiClient
+
+        configuration = Configuration()
+
+        configuration.api_key_prefix['authorization'] = 'Bearer'
+        configuration.api_key['authorization'] = token
+        configuration.host = host
+        configuration.verify_ssl = secure_connection
+        configuration.connection_pool_maxsize = self.connections_per_client
+
+        return InstrumentedApiClient(configuration)
+
+    @staticmethod
+    def _close_client(client: "ApiClient") -> None:
+        try:
+            client.close()
+        except Exception as exc:
+            log.warning("Failed to close Kubernetes API client: %s", exc)
+
+
+client_pool = ClientPool()
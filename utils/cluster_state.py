@@ -0,0 +1,232 @@
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - numpy is optional
+    numpy = None
+
+from . import k8s_api
+from .placement import NodeResources
+from .quantity import parse_cpu, parse_memory
+from .records import NodeRecord
+
+COLUMNS = (
+    "pod_namespace", "pod_node", "pod_cpu", "pod_memory", "pod_cpu_request",
+    "pod_memory_request", "node_id", "node_cpu", "node_memory", "node_pods", "node_schedulable",
+)
+
+
+class _Interner:
+    """ Maps repeated names to small integer ids """
+
+    def __init__(self, names: Iterable[str] = ()):
+        self.names: List[str] = []
+        self._ids: Dict[str, int] = {}
+        for name in names:
+            self.id(name)
+
+    def id(self, name: str) -> int:
+        name_id = self._ids.get(name)
+        if name_id is None:
+            name_id = self._ids[name] = len(self.names)
+            self.names.append(name)
+        return name_id
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+def _group_sum(keys: array, values: array, size: int) -> list:
+    """ Sum `values` per key in `range(size)`, vectorized when NumPy is available """
+    if numpy is not None and len(keys):
+        return numpy.bincount(
+            numpy.frombuffer(keys, dtype=numpy.intc),
+            weights=numpy.frombuffer(values, dtype=numpy.double) if values is not None else None,
+            minlength=size
+        ).tolist()
+    sums = [0.0 if values is not None else 0] * size
+    if values is None:
+        for key in keys:
+            sums[key] += 1
+    else:
+        for key, value in zip(keys, values):
+            sums[key] += value
+    return sums
+
+
+def _raw_container_resources(container: dict) -> Tuple[float, float, float, float]:
+    """ The (cpu, memory) usage then requests of a raw container """
+    resources = container.get("resources") or {}
+    requests = resources.get("requests") or {}
+    limits = resources.get("limits") or {}
+    cpu_request = parse_cpu(requests.get("cpu", "0"))
+    memory_request = parse_memory(requests.get("memory", "0"))
+    return (
+        max(cpu_request, parse_cpu(limits.get("cpu", "0"))),
+        max(memory_request, parse_memory(limits.get("memory", "0"))),
+        cpu_request,
+        memory_request,
+    )
+
+
+def _raw_pod_resources(spec: dict) -> List[float]:
+    """
+    The (cpu, memory) usage then requests of a raw pod spec, with containers combined
+    as `get_pod_resource_usage` and `get_pod_resource_requests` do.
+    """
+    totals = [0.0, 0.0, 0.0, 0.0]
+    for container in spec.get("containers") or ():
+        for index, value in enumerate(_raw_container_resources(container)):
+            totals[index] += value
+    for container in spec.get("initContainers") or ():
+        for index, value in enumerate(_raw_container_resources(container)):
+            totals[index] = max(totals[index], value)
+    overhead = spec.get("overhead")
+    if overhead:
+        cpu, memory = parse_cpu(overhead.get("cpu", "0")), parse_memory(overhead.get("memory", "0"))
+        totals[0] += cpu
+        totals[1] += memory
+        totals[2] += cpu
+        totals[3] += memory
+    return totals
+
+
+class ClusterState:
+    """
+    Columnar snapshot of the pods and nodes of a cluster.
+
+    Namespace and node names are interned; per-pod CPU (millicores), memory (MiB),
+    namespace and node are packed into `array` columns, straight from the raw pods, so
+    a snapshot of 50k pods takes a few MB instead of one Python object graph per pod.
+    Per-namespace and per-node aggregates are group-by sums over the columns,
+    done by NumPy when it is installed.
+
+    Pod usage columns hold max(request, limit), as `get_pod_resource_usage`;
+    request columns hold what the scheduler reserves, as `get_pod_resource_requests`.
+    Pod names are only kept to join the pods with their metrics, and not persisted.
+    """
+
+    def __init__(self):
+        self.namespaces = _Interner()
+        self.nodes = _Interner()
+
+        self.pod_namespace = array("i")
+        # node id + 1, so unscheduled pods group under 0
+        self.pod_node = array("i")
+        self.pod_cpu = array("d")
+        self.pod_memory = array("d")
+        self.pod_cpu_request = array("d")
+        self.pod_memory_request = array("d")
+        self.pod_name: List[str] = []
+
+        self.node_id = array("i")
+        self.node_cpu = array("d")
+        self.node_memory = array("d")
+        self.node_pods = array("i")
+        self.node_schedulable = array("b")
+
+    @classmethod
+    def from_raw(cls, pods: Iterable[dict] = (),
+                 nodes: Iterable[NodeRecord] = ()) -> "ClusterState":
+        """
+        Build a snapshot from raw pods, as `list_raw` yields them, and node records.
+        """
+        state = cls()
+        for node in nodes:
+            state.add_node(node)
+        for pod in pods:
+            state.add_raw_pod(pod)
+        return state
+
+    @property
+    def pod_count(self) -> int:
+        return len(self.pod_cpu)
+
+    @property
+    def node_count(self) -> int:
+        return len(self.node_cpu)
+
+    def add_raw_pod(self, pod: dict) -> None:
+        metadata = pod["metadata"]
+        spec = pod.get("spec") or {}
+        node_name = spec.get("nodeName")
+        cpu, memory, cpu_request, memory_request = _raw_pod_resources(spec)
+        self.pod_namespace.append(self.namespaces.id(metadata.get("namespace")))
+        self.pod_node.append(self.nodes.id(node_name) + 1 if node_name else 0)
+        self.pod_cpu.append(cpu)
+        self.pod_memory.append(memory)
+        self.pod_cpu_request.append(cpu_request)
+        self.pod_memory_request.append(memory_request)
+        self.pod_name.append(metadata["name"])
+
+    def add_node(self, node: NodeRecord) -> None:
+        cpu, memory, pods = k8s_api.get_node_capacity(node)
+        self.node_id.append(self.nodes.id(node.name))
+        self.node_cpu.append(cpu)
+        self.node_memory.append(memory)
+        self.node_pods.append(pods)
+        self.node_schedulable.append(node.schedulable)
+
+    def total_usage(self) -> Tuple[float, float, int]:
+        """ The (cpu, memory, pods) usage of all pods """
+        if numpy is not None and self.pod_count:
+            return (
+                float(numpy.frombuffer(self.pod_cpu, dtype=numpy.double).sum()),
+                float(numpy.frombuffer(self.pod_memory, dtype=numpy.double).sum()),
+                self.pod_count,
+            )
+        return sum(self.pod_cpu), sum(self.pod_memory), self.pod_count
+
+    def namespace_usage(self) -> Dict[str, Tuple[float, float, int]]:
+        """ The (cpu, memory, pods) usage of every namespace with pods """
+        size = len(self.namespaces)
+        cpu = _group_sum(self.pod_namespace, self.pod_cpu, size)
+        memory = _group_sum(self.pod_namespace, self.pod_memory, size)
+        pods = _group_sum(self.pod_namespace, None, size)
+        return {
+            name: (cpu[name_id], memory[name_id], int(pods[name_id]))
+            for name_id, name in enumerate(self.namespaces.names)
+        }
+
+    def pod_requests(self) -> Iterator[Tuple[str, str, float, float]]:
+        """ The (namespace, name, cpu, memory) requests of every pod """
+        namespaces = self.namespaces.names
+        return zip(
+            (namespaces[name_id] for name_id in self.pod_namespace), self.pod_name,
+            self.pod_cpu_request, self.pod_memory_request
+        )
+
+    def node_requests(self) -> Dict[str, Tuple[float, float, int]]:
+        """ The (cpu, memory, pods) requested by the pods scheduled on every node """
+        size = len(self.nodes) + 1
+        cpu = _group_sum(self.pod_node, self.pod_cpu_request, size)
+        memory = _group_sum(self.pod_node, self.pod_memory_request, size)
+        pods = _group_sum(self.pod_node, None, size)
+        return {
+            name: (cpu[name_id + 1], memory[name_id + 1], int(pods[name_id + 1]))
+            for name_id, name in enumerate(self.nodes.names)
+        }
+
+    def max_node_capacity(self) -> Optional[Tuple[float, float, int]]:
+        """ The largest CPU, memory and pods capacity among the nodes, None without nodes """
+        if not self.node_count:
+            return None
+        return max(self.node_cpu), max(self.node_memory), max(self.node_pods)
+
+    def nodes_free_resources(self) -> List[NodeResources]:
+        """ Allocatable resources of every schedulable node minus its pods requests """
+        requests = self.node_requests()
+        free = []
+        for index, name_id in enumerate(self.node_id):
+            if not self.node_schedulable[index]:
+                continue
+            name = self.nodes.names[name_id]
+            cpu, memory, pods = requests[name]
+            free.append(NodeResources(
+                name,
+                self.node_cpu[index] - cpu,
+                self.node_memory[index] - memory,
+                self.node_pods[index] - pods,
+            ))
+        return free
@@ -0,0 +1,256 @@
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from pylon.core.tools import log
+
+from . import k8s_api
+from .capacity_cache import capacity_cache
+from .client_pool import get_cluster_key
+from .health import ClusterUnavailable
+from .informer import informers
+from .instrumentation import instrumentation
+from .reservations import reservations
+from .resource_metrics import get_cached_pod_metrics, pods_utilization
+
+if TYPE_CHECKING:
+    from kubernetes.client import CoreV1Api
+
+
+class CapacityCollector:
+    """
+    Collects cluster capacity with the independent list calls running concurrently.
+
+    Quotas, nodes and pods are listed in parallel on a bounded executor under one
+    shared deadline. If the deadline passes, the last known snapshot is returned
+    instead, flagged with `"stale": True`.
+    """
+
+    def __init__(self, max_workers: int = 8, timeout: float = 10.0):
+        """
+        :param max_workers: the number of threads shared by all concurrent collections.
+        :param timeout: the default deadline of a collection, in seconds.
+        """
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._executor = None
+
+    def configure(self, max_workers: int = None, timeout: float = None) -> None:
+        if max_workers is not None and max_workers != self.max_workers:
+            self.shutdown()
+            self.max_workers = max_workers
+        if timeout is not None:
+            self.timeout = timeout
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="k8s-capacity"
+            )
+        return self._executor
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def collect(self, v1: "CoreV1Api", namespace: str, timeout: float = None) -> Dict[str, float]:
+        """
+        Retrieve the cluster capacity for a namespace within a deadline.
+
+        A fresh result is also stored in the capacity cache, so it becomes the
+        last-known-good snapshot for later calls.
+
+        :param v1: a `CoreV1Api` object for interacting with the Kubernetes API.
+        :param namespace: the name of the namespace.
+        :param timeout: seconds the whole collection may take; defaults to `self.timeout`.
+
+        :return: a dictionary with keys 'cpu', 'memory' and 'pods', as
+                 `get_cluster_capacity` less the outstanding reservations, plus 'stale'
+                 telling whether it is an older snapshot served because the deadline
+                 was exceeded or the cluster is unavailable.
+
+        :raises TimeoutError: If the deadline is exceeded and no snapshot is known.
+        :raises ClusterUnavailable: If the circuit of the cluster is open and no snapshot
+            is known.
+        """
+        with instrumentation.span("capacity.collect"):
+            return self._collect(v1, namespace, timeout)
+
+    def _collect(self, v1: "CoreV1Api", namespace: str, timeout: float = None) -> Dict[str, float]:
+        capacity = self._collect_many(v1, [namespace], timeout)[namespace]
+        if isinstance(capacity, BaseException):
+            raise capacity
+        return capacity
+
+    def collect_many(self, v1: "CoreV1Api", namespaces: Iterable[str],
+                     timeout: float = None) -> Dict[str, Union[dict, BaseException]]:
+        """
+        Retrieve the capacity of several namespaces of a cluster in one collection pass.
+
+        Nodes and pods are listed once for all namespaces; only the resource quotas are
+        listed per namespace, concurrently, under the same deadline.
+
+        :param v1: a `CoreV1Api` object for interacting with the Kubernetes API.
+        :param namespaces: the names of the namespaces.
+        :param timeout: seconds the whole collection may take; defaults to `self.timeout`.
+
+        :return: the capacity of every namespace, as `collect`, or the exception
+                 `collect` would have raised for it.
+        """
+        with instrumentation.span("capacity.collect_many"):
+            return self._collect_many(v1, list(dict.fromkeys(namespaces)), timeout)
+
+    def _collect_many(self, v1: "CoreV1Api", namespaces: List[str],
+                      timeout: float = None) -> Dict[str, Union[dict, BaseException]]:
+        results = {}
+        for namespace, capacity in self._capacities(v1, namespaces, timeout).items():
+            if not isinstance(capacity, BaseException):
+                capacity_cache.put(k8s_api.get_capacity_key(v1, namespace), capacity)
+                results[namespace] = {
+                    **self._unreserved(v1, namespace, capacity), "stale": False
+                }
+            elif _is_unavailable(capacity):
+                results[namespace] = self._last_known(v1, namespace, capacity)
+            else:
+                results[namespace] = capacity
+        return results
+
+    def get_cached(self, v1: "CoreV1Api", namespace: str,
+                   timeout: float = None) -> Dict[str, float]:
+        """
+        Retrieve the cluster capacity for a namespace from the capacity snapshot cache,
+        collecting it within a deadline on a miss.
+
+        Concurrent callers asking for the same cluster and namespace share a single
+        collection. Outstanding capacity reservations are subtracted from the answer.
+
+        :param v1: a `CoreV1Api` object for interacting with the Kubernetes API.
+        :param namespace: the name of the namespace.
+        :param timeout: seconds a collection may take; defaults to `self.timeout`.
+
+        :return: a dictionary with keys 'cpu', 'memory' and 'pods', as
+                 `get_cluster_capacity`.
+
+        :raises TimeoutError: If the deadline is exceeded.
+        """
+        def compute() -> Dict[str, float]:
+            with instrumentation.span("capacity.collect"):
+                capacity = self._capacities(v1, [namespace], timeout)[namespace]
+            if isinstance(capacity, BaseException):
+                raise capacity
+            return capacity
+
+        capacity = capacity_cache.get(k8s_api.get_capacity_key(v1, namespace), compute)
+        return self._unreserved(v1, namespace, capacity)
+
+    def _capacities(self, v1: "CoreV1Api", namespaces: List[str],
+                    timeout: float = None) -> Dict[str, Union[dict, BaseException]]:
+        """ The capacity of every namespace, or the error collecting it """
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        informer = informers.get(v1)
+        if informer is not None and informer.synced:
+            pod_metrics = self.executor.submit(get_cached_pod_metrics, v1, deadline)
+            wait((pod_metrics,), timeout=max(deadline - time.monotonic(), 0))
+            utilization = self._utilization(pod_metrics, informer.pod_requests)
+            return {
+                namespace: k8s_api.calculate_capacity(
+                    *informer.capacity_inputs(namespace), utilization
+                )
+                for namespace in namespaces
+            }
+
+        quotas = {
+            namespace: self.executor.submit(
+                k8s_api.get_namespace_quotas, v1, namespace, deadline
+            )
+            for namespace in namespaces
+        }
+        nodes = self.executor.submit(k8s_api.get_max_cluster_capacity, v1, deadline)
+        pods = self.executor.submit(k8s_api.get_cluster_pods, v1, deadline)
+        pod_metrics = self.executor.submit(get_cached_pod_metrics, v1, deadline)
+        wait((*quotas.values(), nodes, pods, pod_metrics),
+             timeout=max(deadline - time.monotonic(), 0))
+
+        usage, utilization = None, None
+        if pods.done() and pods.exception() is None:
+            usage = pods.result().total_usage()
+            utilization = self._utilization(pod_metrics, pods.result().pod_requests)
+        results = {}
+        for namespace in namespaces:
+            futures = (quotas[namespace], nodes, pods)
+            if not all(future.done() for future in futures):
+                results[namespace] = TimeoutError("Timed out collecting cluster capacity")
+                continue
+            errors = [future.exception() for future in futures if future.exception()]
+            if errors:
+                unavailable = [error for error in errors if _is_unavailable(error)]
+                results[namespace] = (unavailable or errors)[0]
+                continue
+            results[namespace] = k8s_api.calculate_capacity(
+                nodes.result(), usage, quotas[namespace].result(), utilization
+            )
+
+        for future in (*quotas.values(), nodes, pods, pod_metrics):
+            future.cancel()
+        return results
+
+    def _last_known(self, v1: "CoreV1Api", namespace: str,
+                    error: BaseException) -> Union[Dict[str, float], BaseException]:
+        """ The last snapshot of a namespace, or `error` if there is none """
+        last_known = capacity_cache.peek(k8s_api.get_capacity_key(v1, namespace))
+        if last_known is None:
+            return error
+        capacity, age = last_known
+        log.warning("Capacity collection failed (%s), serving a snapshot %.0fs old",
+                    error, age)
+        instrumentation.increment("capacity_stale_total")
+        return {**self._unreserved(v1, namespace, capacity), "stale": True}
+
+    @staticmethod
+    def _utilization(
+            pod_metrics: Future, pod_requests: Callable[[], Iterable[tuple]]
+    ) -> Optional[Tuple[float, float, int]]:
+        """
+        The actual utilization of the pods if their metrics were collected by the
+        deadline, otherwise None.
+
+        :param pod_metrics: the future of `get_cached_pod_metrics`.
+        :param pod_requests: returns the requests of the pods listed for the capacity.
+        """
+        if not pod_metrics.done():
+            return None
+        if pod_metrics.exception() is not None:
+            log.warning("Failed to collect cluster utilization: %s", pod_metrics.exception())
+            return None
+        if pod_metrics.result() is None:
+            return None
+        return pods_utilization(pod_requests(), pod_metrics.result())
+
+    @staticmethod
+    def _unreserved(v1: "CoreV1Api", namespace: str,
+                    capacity: Dict[str, float]) -> Dict[str, float]:
+        return reservations.subtract_from_capacity(
+            get_cluster_key(v1.api_client), capacity, namespace
+        )
+
+
+def _is_unavailable(error: BaseException) -> bool:
+    """ Whether an error means the cluster did not answer, so the last snapshot is served """
+    from urllib3.exceptions import MaxRetryError, TimeoutError as Urllib3TimeoutError
+
+    if isinstance(error, MaxRetryError):
+        error = error.reason
+    return isinstance(error, (TimeoutError, Urllib3TimeoutError, ClusterUnavailable))
+
+
+capacity_collector = CapacityCollector()
+
+
+def get_cached_cluster_capacity(v1: "CoreV1Api", namespace: str) -> Dict[str, float]:
+    """
+    Same as `get_cluster_capacity`, but served from the capacity snapshot cache and
+    collected concurrently within the collector deadline, as `CapacityCollector.get_cached`.
+    """
+    return capacity_collector.get_cached(v1, namespace)
@@ -0,0 +1,122 @@
+from typing import TYPE_CHECKING, List, Optional
+
+from pylon.core.tools import log
+
+from . import k8s_api
+from .client_pool import get_cluster_key
+from .collector import capacity_collector
+from .placement import spread_placement
+from .reservations import reservations
+
+if TYPE_CHECKING:
+    from kubernetes.client import CoreV1Api
+
+
+class ExecutionPlanner:
+    """
+    Precomputes where the runners of a test go, for the execution JSON of the test.
+
+    The plan spreads the runners evenly over the nodes that have room for them, rather
+    than letting the scheduler sort out hundreds of pods at once, and comes with
+    topology spread and anti-affinity hints matching it and the batches the runner
+    pods should be created in.
+    """
+
+    def __init__(self, batch_size: int = 50,
+                 topology_key: str = "kubernetes.io/hostname"):
+        """
+        :param batch_size: the maximum number of runner pods created at once.
+        :param topology_key: the node label runners are spread over.
+        """
+        self.batch_size = batch_size
+        self.topology_key = topology_key
+
+    def configure(self, batch_size: int = None, topology_key: str = None) -> None:
+        if batch_size is not None:
+            self.batch_size = batch_size
+        if topology_key is not None:
+            self.topology_key = topology_key
+
+    def batches(self, runners: int) -> List[int]:
+        """ Split the runner pods of a test into creation batches """
+        batch_size = max(self.batch_size, 1)
+        return [batch_size] * (runners // batch_size) + (
+            [runners % batch_size] if runners % batch_size else []
+        )
+
+    def plan(self, core_api: Optional["CoreV1Api"], namespace: str, runners: int,
+             runner_cpu: float, runner_memory: float, post_processor_cpu: float = 0,
+             post_processor_memory: float = 0,
+             reservation_id: Optional[str] = None) -> dict:
+        """
+        Plan the placement of the runners of a test from the current capacity snapshot,
+        and reserve it until the runner pods exist.
+
+        A reservation the test already holds, e.g. from admission, counts as free for
+        the plan and is replaced by the one of the plan if it is feasible.
+
+        :param core_api: a `CoreV1Api` object for the cluster the test runs on; None for
+            autoscaled clusters, whose nodes are not planned.
+        :param namespace: the namespace the test runs in.
+        :param runners: the number of runner pods.
+        :param runner_cpu: CPU of a single runner, in millicores.
+        :param runner_memory: memory of a single runner, in MiB.
+        :param post_processor_cpu: CPU of the post-processor, in millicores; 0 for none.
+        :param post_processor_memory: memory of the post-processor, in MiB; 0 for none.
+        :param reservation_id: the id of the reservation the test holds, if any.
+
+        :return: the number of runners per node ('nodes', None if not planned), the
+                 'post_processor_node', the runners that did not fit ('unplaced'),
+                 creation 'batches', the 'topology_spread' and 'anti_affinity' hints
+                 and the 'reservation_id' to release once the runner pods exist: the
+                 one of the plan, or the one the test held if no plan was reserved.
+        """
+        placement = {
+            "runners": runners,
+            "nodes": None,
+            "post_processor_node": None,
+            "unplaced": 0,
+            "batches": self.batches(runners),
+            "topology_spread": {
+                "topology_key": self.topology_key,
+                "max_skew": 1,
+                "when_unsatisfiable": "ScheduleAnyway",
+            },
+            "anti_affinity": "preferred",
+            "reservation_id": reservation_id,
+        }
+        if core_api is None:
+            return placement
+        try:
+            free_nodes = k8s_api.get_cached_nodes_free_resources(
+                core_api, capacity_collector.timeout
+            )
+        except Exception as exc:
+            log.warning("Failed to plan runners placement: %s", exc)
+            return placement
+
+        plan, reservation = reservations.reserve_placement(
+            get_cluster_key(core_api.api_client), namespace, free_nodes, runners,
+            runner_cpu, runner_memory, post_processor_cpu, post_processor_memory,
+            replace=reservation_id, place=spread_placement
+        )
+        if not plan.feasible:
+            log.warning("Runners placement plan in %s leaves %s of %s runners unplaced",
+                        namespace, plan.unplaced, runners)
+
+        counts = [plan.runners.get(node.name, 0) for node in free_nodes]
+        placement.update({
+            "nodes": plan.runners,
+            "post_processor_node": plan.post_processor,
+            "unplaced": plan.unplaced,
+            "reservation_id": reservation.id if reservation else reservation_id,
+            "anti_affinity": "required" if counts and max(counts) <= 1 and plan.feasible
+            else "preferred",
+        })
+        placement["topology_spread"]["max_skew"] = max(
+            max(counts) - min(counts) if counts else 1, 1
+        )
+        return placement
+
+
+execution_planner = ExecutionPlanner()
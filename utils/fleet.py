@@ -0,0 +1,168 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional
+
+from pylon.core.tools import log
+
+from . import k8s_api
+from .client_pool import get_cluster_key
+from .collector import capacity_collector
+from .placement import NodeResources, plan_placement
+from .reservations import reservations
+
+if TYPE_CHECKING:
+    from kubernetes.client import CoreV1Api
+
+
+class FleetMember(NamedTuple):
+    """ One Kubernetes integration of a project """
+    integration_id: int
+    core_api: "CoreV1Api"
+    namespace: str
+
+
+def _cluster_fit(member: FleetMember, runners: int, runner_cpu: float, runner_memory: float,
+                 post_processor_cpu: float, post_processor_memory: float,
+                 deadline: float) -> dict:
+    nodes = reservations.adjust_nodes(
+        get_cluster_key(member.core_api.api_client),
+        k8s_api.get_cached_nodes_free_resources(
+            member.core_api, max(deadline - time.monotonic(), 0)
+        )
+    )
+    plan = plan_placement(
+        nodes, runners, runner_cpu, runner_memory, post_processor_cpu, post_processor_memory
+    )
+    runners_only = plan_placement(nodes, runners, runner_cpu, runner_memory)
+    runners_fit = runners - runners_only.unplaced
+    post_processor_fits, runners_with_post_processor = True, runners_fit
+    if post_processor_cpu > 0 or post_processor_memory > 0:
+        post_processor_node = plan_placement(
+            nodes, 0, runner_cpu, runner_memory, post_processor_cpu, post_processor_memory
+        ).post_processor
+        post_processor_fits = post_processor_node is not None
+        runners_with_post_processor = runners - plan_placement(
+            [
+                NodeResources(node.name, node.cpu - post_processor_cpu,
+                              node.memory - post_processor_memory, node.pods - 1)
+                if node.name == post_processor_node else node
+                for node in nodes
+            ],
+            runners, runner_cpu, runner_memory
+        ).unplaced if post_processor_fits else 0
+    placed_cpu = runner_cpu * sum(plan.runners.values())
+    placed_memory = runner_memory * sum(plan.runners.values())
+    if plan.post_processor is not None:
+        placed_cpu += post_processor_cpu
+        placed_memory += post_processor_memory
+    return {
+        "integration_id": member.integration_id,
+        "namespace": member.namespace,
+        "feasible": plan.feasible,
+        "runners_fit": runners_fit,
+        "runners_fit_with_post_processor": runners_with_post_processor,
+        "post_processor_fits": post_processor_fits,
+        "free_cpu": sum(max(node.cpu, 0) for node in nodes) - placed_cpu,
+        "free_memory": sum(max(node.memory, 0) for node in nodes) - placed_memory,
+        "error": None,
+    }
+
+
+def rank_clusters(members: List[FleetMember], runners: int, runner_cpu: float,
+                  runner_memory: float, post_processor_cpu: float = 0,
+                  post_processor_memory: float = 0,
+                  timeout: Optional[float] = None) -> List[dict]:
+    """
+    Collect the capacity of several clusters in parallel and rank them by fit for a test.
+
+    Node snapshots come from the capacity cache, less outstanding reservations. Clusters
+    are scanned on threads of their own, under the deadline, so a hung cluster doesn't
+    hold up the capacity collector.
+    Clusters that can place the whole test come first, then those fitting the most
+    runners; ties go to the least loaded cluster, the one left with the most free CPU
+    and memory after placing the test.
+
+    :param members: the clusters to consider.
+    :param timeout: seconds the whole collection may take; defaults to the
+                    capacity collector timeout.
+
+    The resource parameters are the ones of `plan_placement`.
+
+    :return: one dictionary per cluster, best first, with the 'integration_id',
+             'namespace', whether the test is 'feasible', how many runners fit alone
+             ('runners_fit') and along with the post-processor
+             ('runners_fit_with_post_processor'), whether the post-processor fits
+             ('post_processor_fits'), the 'free_cpu' (millicores) and 'free_memory'
+             (MiB) left after placement, and the 'error' of a cluster that couldn't
+             be collected.
+    """
+    if not members:
+        return []
+    timeout = capacity_collector.timeout if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    # not the collector executor: every capacity collection waits on that one
+    executor = ThreadPoolExecutor(max_workers=min(len(members), capacity_collector.max_workers),
+                                  thread_name_prefix="k8s-fleet")
+    try:
+        futures = {
+            executor.submit(
+                _cluster_fit, member, runners, runner_cpu, runner_memory,
+                post_processor_cpu, post_processor_memory, deadline
+            ): member
+            for member in members
+        }
+        wait(futures, timeout=max(deadline - time.monotonic(), 0))
+    finally:
+        # scans still running end at the deadline on their own
+        executor.shutdown(wait=False)
+
+    fits = []
+    for future, member in futures.items():
+        if future.done() and future.exception() is None:
+            fits.append(future.result())
+            continue
+        error = future.exception() if future.done() else "Timed out collecting capacity"
+        future.cancel()
+        log.warning("Fleet capacity of integration %s failed: %s", member.integration_id, error)
+        fits.append({
+            "integration_id": member.integration_id, "namespace": member.namespace,
+            "feasible": False, "runners_fit": 0, "runners_fit_with_post_processor": 0,
+            "post_processor_fits": False, "free_cpu": 0, "free_memory": 0,
+            "error": str(error),
+        })
+    fits.sort(key=lambda fit: (
+        fit["error"] is None, fit["feasible"], fit["runners_fit"],
+        fit["free_cpu"], fit["free_memory"]
+    ), reverse=True)
+    return fits
+
+
+def split_runners(fits: List[dict], runners: int) -> Optional[Dict[int, int]]:
+    """
+    Split the runners of one test across ranked clusters.
+
+    The best ranked cluster able to run the post-processor takes it and as many runners
+    as fit along with it, the next clusters take the rest in rank order.
+
+    :param fits: the result of `rank_clusters`.
+    :param runners: the number of runners to split.
+
+    :return: the number of runners per integration id, the post-processor cluster
+             first, or None if the fleet can't fit every runner.
+    """
+    leader = next((fit for fit in fits if fit["post_processor_fits"]), None)
+    if leader is None:
+        return None
+    split = {}
+    remaining = runners
+    for fit in [leader] + [fit for fit in fits if fit is not leader]:
+        if remaining <= 0:
+            break
+        count = min(
+            fit["runners_fit_with_post_processor"] if fit is leader else fit["runners_fit"],
+            remaining
+        )
+        if count > 0:
+            split[fit["integration_id"]] = count
+            remaining -= count
+    return split if remaining <= 0 else None
@@ -0,0 +1,244 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from pylon.core.tools import log
+
+from .instrumentation import instrumentation
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ClusterUnavailable(ConnectionError):
+    """ Raised instead of calling a cluster whose circuit is open """
+
+    def __init__(self, host: str, retry_in: float, last_error: Optional[str]):
+        super().__init__(
+            f"Kubernetes API {host} is unavailable ({last_error}), "
+            f"retrying in {retry_in:.0f}s"
+        )
+        self.host = host
+        self.retry_in = retry_in
+
+
+class _ClusterHealth:
+    """ What is known about the requests to one cluster """
+
+    def __init__(self, host: str, window: int):
+        self.host = host
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0.0
+        self.probing = False
+        self.requests = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self.last_failure: Optional[float] = None
+        # (latency, failed) of the most recent requests
+        self.recent: Deque[Tuple[float, bool]] = deque(maxlen=window)
+
+
+def _is_failure(error: BaseException) -> bool:
+    """ Whether an error means the cluster is unhealthy, rather than the request wrong """
+    from kubernetes.client.rest import ApiException
+
+    if isinstance(error, ApiException):
+        return not error.status or error.status >= 500
+    return True
+
+
+def _probe_error(probe: Callable[[], Any]) -> Optional[BaseException]:
+    """ The error of a probe request, None if the API server answered """
+    try:
+        probe()
+    except Exception as exc:
+        # any answer but a server error means the API server is back
+        if _is_failure(exc):
+            return exc
+    return None
+
+
+class HealthTracker:
+    """
+    Per-cluster circuit breaker around the Kubernetes API requests.
+
+    Latency and errors of the recent requests to every cluster are recorded. After
+    `failure_threshold` consecutive failures (connection errors, timeouts, 5xx) the
+    circuit opens: requests to the cluster fail right away with `ClusterUnavailable`,
+    so the capacity cache and collector serve their last snapshot instead of every
+    caller waiting for its own timeout. After `reset_timeout` seconds the circuit is
+    half-open: the next caller probes the cluster with a cheap `/version` request and
+    closes the circuit if it answers, or reopens it.
+
+    Requests also get a connect timeout unless they set their own timeout.
+    """
+
+    def __init__(self, enabled: bool = True, failure_threshold: int = 5,
+                 reset_timeout: float = 30.0, connect_timeout: float = 5.0,
+                 probe_timeout: float = 3.0, window: int = 50):
+        """
+        :param enabled: whether circuits open at all; health is recorded regardless.
+        :param failure_threshold: consecutive failures after which the circuit opens.
+        :param reset_timeout: seconds an open circuit waits before probing the cluster.
+        :param connect_timeout: default connect timeout of requests, in seconds.
+        :param probe_timeout: timeout of the half-open probe, in seconds.
+        :param window: the number of recent requests latency and error rate are over.
+        """
+        self.enabled = enabled
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.connect_timeout = connect_timeout
+        self.probe_timeout = probe_timeout
+        self.window = window
+        self._clusters: Dict[tuple, _ClusterHealth] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, enabled: bool = None, failure_threshold: int = None,
+                  reset_timeout: float = None, connect_timeout: float = None,
+                  probe_timeout: float = None, window: int = None) -> None:
+        if enabled is not None:
+            self.enabled = enabled
+        if failure_threshold is not None:
+            self.failure_threshold = failure_threshold
+        if reset_timeout is not None:
+            self.reset_timeout = reset_timeout
+        if connect_timeout is not None:
+            self.connect_timeout = connect_timeout
+        if probe_timeout is not None:
+            self.probe_timeout = probe_timeout
+        if window is not None:
+            self.window = window
+
+    def call(self, cluster: tuple, host: str, request: Callable[[], Any],
+             probe: Callable[[], Any]) -> Any:
+        """
+        Run a request to a cluster through its circuit.
+
+        :param cluster: the cluster identity, as `get_cluster_key`.
+        :param host: the API server address, for messages.
+        :param request: performs the request.
+        :param probe: performs a cheap request, used while the circuit is half-open.
+
+        :return: what `request` returns.
+
+        :raises ClusterUnavailable: If the circuit of the cluster is open.
+        """
+        self._before(cluster, host, probe)
+        start = time.perf_counter()
+        try:
+            result = request()
+        except Exception as exc:
+            self._record(cluster, host, time.perf_counter() - start, exc)
+            raise
+        self._record(cluster, host, time.perf_counter() - start)
+        return result
+
+    def _health(self, cluster: tuple, host: str) -> _ClusterHealth:
+        health = self._clusters.get(cluster)
+        if health is None:
+            health = self._clusters[cluster] = _ClusterHealth(host, self.window)
+        return health
+
+    def _before(self, cluster: tuple, host: str, probe: Callable[[], Any]) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            health = self._health(cluster, host)
+            if health.state == CLOSED:
+                return
+            retry_in = self.reset_timeout - (time.monotonic() - health.opened)
+            if health.probing or retry_in > 0:
+                instrumentation.increment("k8s_circuit_rejected_total", host=host)
+                raise ClusterUnavailable(host, max(retry_in, 0), health.last_error)
+            health.state = HALF_OPEN
+            health.probing = True
+
+        error = _probe_error(probe)
+        if error is not None:
+            with self._lock:
+                health.state = OPEN
+                health.opened = time.monotonic()
+                health.probing = False
+                health.last_error = str(error)
+                health.last_failure = time.time()
+            log.warning("Kubernetes API %s is still unavailable: %s", host, error)
+            raise ClusterUnavailable(host, self.reset_timeout, str(error)) from error
+        with self._lock:
+            health.state = CLOSED
+            health.failures = 0
+            health.probing = False
+        log.info("Kubernetes API %s is available again", host)
+
+    def _record(self, cluster: tuple, host: str, latency: float,
+                error: Optional[BaseException] = None) -> None:
+        failed = error is not None and _is_failure(error)
+        with self._lock:
+            health = self._health(cluster, host)
+            health.requests += 1
+            health.recent.append((latency, failed))
+            if not failed:
+                health.failures = 0
+                return
+            health.errors += 1
+            health.failures += 1
+            health.last_error = str(error)
+            health.last_failure = time.time()
+            opens = self.enabled and health.state == CLOSED and \
+                health.failures >= self.failure_threshold
+            if opens:
+                health.state = OPEN
+                health.opened = time.monotonic()
+        if opens:
+            log.warning("Kubernetes API %s failed %s times in a row, failing fast for %.0fs: %s",
+                        host, self.failure_threshold, self.reset_timeout, error)
+            instrumentation.increment("k8s_circuit_opened_total", host=host)
+
+    def health(self, cluster: tuple) -> dict:
+        """
+        The health of one cluster.
+
+        :return: the circuit 'state' ('unknown' if the cluster was never called),
+                 the 'average_latency' and 'max_latency' in seconds and 'error_rate' of
+                 the recent requests, the 'requests' and 'errors' counts,
+                 'consecutive_failures', the 'last_error' with its unix time
+                 ('last_failure') and, while open, 'retry_in' seconds.
+        """
+        with self._lock:
+            health = self._clusters.get(tuple(cluster))
+            if health is None:
+                return {"state": "unknown"}
+            return self._describe(health)
+
+    def stats(self) -> list:
+        """ The health of every cluster called, with its 'hostname' """
+        with self._lock:
+            return [
+                {"hostname": health.host, **self._describe(health)}
+                for health in self._clusters.values()
+            ]
+
+    def _describe(self, health: _ClusterHealth) -> dict:
+        latencies = [latency for latency, _ in health.recent]
+        described = {
+            "state": health.state,
+            "average_latency": sum(latencies) / len(latencies) if latencies else None,
+            "max_latency": max(latencies) if latencies else None,
+            "error_rate": sum(failed for _, failed in health.recent) / len(health.recent)
+            if health.recent else 0.0,
+            "requests": health.requests,
+            "errors": health.errors,
+            "consecutive_failures": health.failures,
+            "last_error": health.last_error,
+            "last_failure": health.last_failure,
+        }
+        if health.state != CLOSED:
+            described["retry_in"] = max(
+                self.reset_timeout - (time.monotonic() - health.opened), 0
+            )
+        return described
+
+
+cluster_health = HealthTracker()
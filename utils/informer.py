@@ -0,0 +1,335 @@
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Callable
+
+from pylon.core.tools import log
+
+from . import k8s_api
+from .client_pool import get_cluster_key
+from .records import DEFAULT_PAGE_SIZE, ACTIVE_PODS_FIELD_SELECTOR, QuotaRecord, pod_record, \
+    node_record, quota_record
+
+if TYPE_CHECKING:
+    from kubernetes.client import CoreV1Api
+
+HTTP_GONE = 410
+
+
+class ClusterInformer:
+    """
+    Keeps node, pod and resource quota state of one cluster in memory.
+
+    Every resource is listed once and then followed with a watch stream, resuming from
+    the last seen resourceVersion (bookmarks included) and relisting on 410 Gone.
+    Running CPU/memory/pod totals are maintained per namespace and per node as events
+    arrive, so reading the capacity does not rescan the cluster.
+
+    The informer stops itself when nobody has read from it for `idle_timeout` seconds.
+    """
+
+    def __init__(self, v1: "CoreV1Api", idle_timeout: float = 600.0,
+                 watch_timeout: int = 60):
+        """
+        :param v1: a `CoreV1Api` object for the cluster; the informer opens its own
+            instrumented `ApiClient` with the same configuration for its long-lived
+            watches, so they don't hold pooled connections but still go through the
+            circuit breaker of the cluster.
+        :param idle_timeout: seconds without reads after which the informer stops.
+        :param watch_timeout: server side timeout of a single watch request, which is
+            also how often the idle timeout is checked.
+        """
+        from kubernetes.client import CoreV1Api
+        from .instrumented_client import InstrumentedApiClient
+
+        self.idle_timeout = idle_timeout
+        self.watch_timeout = watch_timeout
+        self._api_client = InstrumentedApiClient(v1.api_client.configuration)
+        self._v1 = CoreV1Api(self._api_client)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._last_read = time.monotonic()
+        self._threads = []
+        self._synced = {"pods": threading.Event(), "nodes": threading.Event(),
+                        "quotas": threading.Event()}
+
+        # uid: (namespace, node, cpu, memory, name, cpu request, memory request)
+        self._pods: Dict[str, Tuple[str, str, float, float, str, float, float]] = {}
+        self._namespaces_usage: Dict[str, list] = {}
+        self._nodes_usage: Dict[str, list] = {}
+        self._cluster_usage = [0.0, 0.0, 0]
+        self._nodes: Dict[str, Tuple[float, float, int]] = {}
+        self._quotas: Dict[str, Dict[str, QuotaRecord]] = {}
+
+    @property
+    def synced(self) -> bool:
+        """ Whether the initial list of every resource has been loaded """
+        return all(event.is_set() for event in self._synced.values())
+
+    @property
+    def running(self) -> bool:
+        return not self._stopped.is_set()
+
+    def start(self) -> None:
+        for name, list_func, list_kwargs, reset, apply in (
+                ("pods", self._v1.list_pod_for_all_namespaces,
+                 {"field_selector": ACTIVE_PODS_FIELD_SELECTOR}, self._reset_pods,
+                 self._apply_pod),
+                ("nodes", self._v1.list_node, {}, self._reset_nodes, self._apply_node),
+                ("quotas", self._v1.list_resource_quota_for_all_namespaces, {},
+                 self._reset_quotas, self._apply_quota),
+        ):
+            thread = threading.Thread(
+                target=self._run, args=(name, list_func, list_kwargs, reset, apply),
+                name=f"k8s-informer-{name}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        try:
+            self._api_client.close()
+        except Exception as exc:
+            log.warning("Failed to close informer API client: %s", exc)
+
+    def touch(self) -> None:
+        """ Mark the informer as in use, postponing its idle stop """
+        self._last_read = time.monotonic()
+
+    def wait_synced(self, timeout: float = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for event in self._synced.values():
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            if not event.wait(remaining):
+                return False
+        return True
+
+    def capacity_inputs(
+            self, namespace: str
+    ) -> Tuple[Tuple[float, float, int], Tuple[float, float, int], List[QuotaRecord]]:
+        """
+        Read the current state in the shape `k8s_api.calculate_capacity` expects.
+
+        :param namespace: the namespace whose resource quotas are returned.
+
+        :return: a tuple of the max node capacity, the cluster-wide usage
+                 and the resource quotas of the namespace.
+        """
+        self.touch()
+        with self._lock:
+            nodes_capacity = list(self._nodes.values())
+            cluster_usage = tuple(self._cluster_usage)
+            quotas = list(self._quotas.get(namespace, {}).values())
+        return (
+            k8s_api.get_max_node_capacity(nodes_capacity),
+            cluster_usage,
+            quotas
+        )
+
+    def pod_requests(self) -> List[Tuple[str, str, float, float]]:
+        """ The (namespace, name, cpu, memory) requests of every pod """
+        self.touch()
+        with self._lock:
+            return [
+                (namespace, name, cpu_request, memory_request)
+                for namespace, _, _, _, name, cpu_request, memory_request in self._pods.values()
+            ]
+
+    def namespace_usage(self, namespace: str) -> Tuple[float, float, int]:
+        self.touch()
+        with self._lock:
+            return tuple(self._namespaces_usage.get(namespace, (0.0, 0.0, 0)))
+
+    def node_usage(self, node: str) -> Tuple[float, float, int]:
+        self.touch()
+        with self._lock:
+            return tuple(self._nodes_usage.get(node, (0.0, 0.0, 0)))
+
+    def _idle(self) -> bool:
+        return time.monotonic() - self._last_read > self.idle_timeout
+
+    def _run(self, name: str, list_func: Callable, list_kwargs: dict, reset: Callable,
+             apply: Callable) -> None:
+        from kubernetes.client.rest import ApiException
+
+        resource_version = None
+        while not self._stopped.is_set():
+            if self._idle():
+                log.info("Stopping idle Kubernetes informer for %s",
+                         self._api_client.configuration.host)
+                self.stop()
+                return
+            try:
+                if resource_version is None:
+                    resource_version = self._relist(list_func, list_kwargs, reset)
+                    self._synced[name].set()
+                resource_version = self._watch(list_func, list_kwargs, apply,
+                                               resource_version)
+            except ApiException as exc:
+                if exc.status == HTTP_GONE:
+                    log.info("Kubernetes informer %s watch expired, relisting", name)
+                else:
+                    log.warning("Kubernetes informer %s failed: %s", name, exc)
+                    self._stopped.wait(5)
+                resource_version = None
+            except Exception as exc:
+                if self._stopped.is_set():
+                    return
+                log.warning("Kubernetes informer %s failed: %s", name, exc)
+                self._stopped.wait(5)
+                resource_version = None
+
+    def _relist(self, list_func: Callable, list_kwargs: dict, reset: Callable) -> str:
+        items = []
+        resource_version = None
+        _continue = None
+        while True:
+            page = list_func(limit=DEFAULT_PAGE_SIZE, _continue=_continue, **list_kwargs)
+            items.extend(page.items)
+            if resource_version is None:
+                resource_version = page.metadata.resource_version
+            _continue = page.metadata._continue
+            if not _continue:
+                break
+        reset(items)
+        return resource_version
+
+    def _watch(self, list_func: Callable, list_kwargs: dict, apply: Callable,
+               resource_version: str) -> str:
+        from kubernetes import watch
+
+        stream = watch.Watch()
+        for event in stream.stream(list_func, resource_version=resource_version,
+                                   allow_watch_bookmarks=True,
+                                   timeout_seconds=self.watch_timeout, **list_kwargs):
+            if self._stopped.is_set():
+                stream.stop()
+                break
+            if event["type"] == "BOOKMARK":
+                resource_version = event["raw_object"]["metadata"]["resourceVersion"]
+                continue
+            apply(event["type"], event["object"])
+            resource_version = event["object"].metadata.resource_version
+        return resource_version
+
+    def _reset_pods(self, pods: list) -> None:
+        with self._lock:
+            self._pods = {}
+            self._namespaces_usage = {}
+            self._nodes_usage = {}
+            self._cluster_usage = [0.0, 0.0, 0]
+            for pod in pods:
+                self._add_pod(pod)
+
+    def _apply_pod(self, event_type: str, pod) -> None:
+        with self._lock:
+            self._remove_pod(pod.metadata.uid)
+            if event_type != "DELETED":
+                self._add_pod(pod)
+
+    def _add_pod(self, pod) -> None:
+        resources = pod_record(pod)
+        cpu, memory = k8s_api.get_pod_resource_usage(resources)
+        cpu_request, memory_request = k8s_api.get_pod_resource_requests(resources)
+        record = (pod.metadata.namespace, pod.spec.node_name, cpu, memory,
+                  pod.metadata.name, cpu_request, memory_request)
+        self._pods[pod.metadata.uid] = record
+        self._account(record, 1)
+
+    def _remove_pod(self, uid: str) -> None:
+        record = self._pods.pop(uid, None)
+        if record is not None:
+            self._account(record, -1)
+
+    def _account(self, record: tuple, sign: int) -> None:
+        namespace, node, cpu, memory = record[:4]
+        totals = [
+            self._cluster_usage, self._namespaces_usage.setdefault(namespace, [0.0, 0.0, 0])
+        ]
+        if node:
+            totals.append(self._nodes_usage.setdefault(node, [0.0, 0.0, 0]))
+        for total in totals:
+            total[0] += sign * cpu
+            total[1] += sign * memory
+            total[2] += sign
+
+    def _reset_nodes(self, nodes: list) -> None:
+        with self._lock:
+            self._nodes = {
+                node.metadata.name: k8s_api.get_node_capacity(node_record(node))
+                for node in nodes
+            }
+
+    def _apply_node(self, event_type: str, node) -> None:
+        with self._lock:
+            if event_type == "DELETED":
+                self._nodes.pop(node.metadata.name, None)
+            else:
+                self._nodes[node.metadata.name] = k8s_api.get_node_capacity(node_record(node))
+
+    def _reset_quotas(self, quotas: list) -> None:
+        with self._lock:
+            self._quotas = {}
+            for quota in quotas:
+                self._quotas.setdefault(quota.metadata.namespace, {})[quota.metadata.name] = \
+                    quota_record(quota)
+
+    def _apply_quota(self, event_type: str, quota) -> None:
+        with self._lock:
+            namespace_quotas = self._quotas.setdefault(quota.metadata.namespace, {})
+            if event_type == "DELETED":
+                namespace_quotas.pop(quota.metadata.name, None)
+            else:
+                namespace_quotas[quota.metadata.name] = quota_record(quota)
+
+
+class InformerRegistry:
+    """
+    Opt-in registry of per-cluster informers.
+
+    While disabled, `get` always returns None and capacity is scanned live.
+    """
+
+    def __init__(self, enabled: bool = False, idle_timeout: float = 600.0):
+        self.enabled = enabled
+        self.idle_timeout = idle_timeout
+        self._informers: Dict[tuple, ClusterInformer] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, enabled: bool = None, idle_timeout: float = None) -> None:
+        if enabled is not None:
+            self.enabled = enabled
+        if idle_timeout is not None:
+            self.idle_timeout = idle_timeout
+
+    def get(self, v1: "CoreV1Api") -> Optional[ClusterInformer]:
+        """
+        Return the informer watching the cluster of `v1`, starting one if needed.
+
+        :param v1: a `CoreV1Api` object for interacting with the Kubernetes API.
+
+        :return: the cluster informer, or None if informers are disabled.
+        """
+        if not self.enabled:
+            return None
+        key = get_cluster_key(v1.api_client)
+        with self._lock:
+            informer = self._informers.get(key)
+            if informer is None or not informer.running:
+                informer = ClusterInformer(v1, idle_timeout=self.idle_timeout)
+                self._informers[key] = informer
+                informer.start()
+        informer.touch()
+        return informer
+
+    def stop_all(self) -> None:
+        with self._lock:
+            informers_ = list(self._informers.values())
+            self._informers.clear()
+        for informer in informers_:
+            informer.stop()
+
+
+informers = InformerRegistry()
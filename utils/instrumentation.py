@@ -0,0 +1,136 @@
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import ContextManager, Dict, Tuple
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_DISABLED_SPAN = nullcontext()
+
+
+class InMemorySink:
+    """
+    Registry of counters and timing summaries kept in memory.
+
+    Timings are summarized as count, sum and max per name and labels, which is enough
+    for rates and averages without keeping every observation.
+    """
+
+    def __init__(self):
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._summaries: Dict[Tuple[str, Labels], list] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: float, labels: Labels) -> None:
+        with self._lock:
+            key = (name, labels)
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: Labels) -> None:
+        with self._lock:
+            summary = self._summaries.get((name, labels))
+            if summary is None:
+                self._summaries[(name, labels)] = [1, value, value]
+            else:
+                summary[0] += 1
+                summary[1] += value
+                summary[2] = max(summary[2], value)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._summaries.clear()
+
+    def snapshot(self) -> dict:
+        """ Every counter and summary, as lists of dictionaries with their labels """
+        with self._lock:
+            return {
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self._counters.items())
+                ],
+                "summaries": [
+                    {"name": name, "labels": dict(labels), "count": count, "sum": total,
+                     "max": maximum}
+                    for (name, labels), (count, total, maximum)
+                    in sorted(self._summaries.items())
+                ],
+            }
+
+    def render(self) -> str:
+        """ The registry in the Prometheus text exposition format """
+        lines = []
+        snapshot = self.snapshot()
+        for counter in snapshot["counters"]:
+            lines.append(f"{counter['name']}{_format_labels(counter['labels'])} "
+                         f"{counter['value']}")
+        for summary in snapshot["summaries"]:
+            labels = _format_labels(summary["labels"])
+            lines.append(f"{summary['name']}_count{labels} {summary['count']}")
+            lines.append(f"{summary['name']}_sum{labels} {summary['sum']}")
+            lines.append(f"{summary['name']}_max{labels} {summary['max']}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+class Instrumentation:
+    """
+    Counters and timers for Kubernetes API calls and capacity computation.
+
+    Everything is recorded into a pluggable sink, an `InMemorySink` by default; any
+    object with `increment(name, value, labels)` and `observe(name, value, labels)`
+    methods can be configured instead. When disabled, every call returns right after
+    checking the flag and spans are a shared no-op context manager.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.sink = InMemorySink()
+
+    def configure(self, enabled: bool = None, sink=None) -> None:
+        if enabled is not None:
+            self.enabled = enabled
+        if sink is not None:
+            self.sink = sink
+
+    def increment(self, name: str, value: float = 1, **labels) -> None:
+        if self.enabled:
+            self.sink.increment(name, value, tuple(sorted(labels.items())))
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        if self.enabled:
+            self.sink.observe(name, value, tuple(sorted(labels.items())))
+
+    def span(self, name: str) -> ContextManager:
+        """ Time a block of code into the `span_seconds` summary """
+        if not self.enabled:
+            return _DISABLED_SPAN
+        return self._span(name)
+
+    @contextmanager
+    def _span(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.sink.observe("span_seconds", time.perf_counter() - start,
+                              (("span", name),))
+
+    def record_page(self, resource: str, size: int) -> None:
+        """ Count one page of a list call and its response bytes """
+        if self.enabled:
+            labels = (("resource", resource),)
+            self.sink.increment("k8s_list_pages_total", 1, labels)
+            self.sink.increment("k8s_response_bytes_total", size, labels)
+
+
+instrumentation = Instrumentation()
@@ -0,0 +1,77 @@
+import time
+
+from kubernetes.client import ApiClient
+from kubernetes.client.rest import ApiException
+from urllib3 import HTTPResponse
+
+from .client_pool import get_cluster_key
+from .health import cluster_health
+from .instrumentation import instrumentation
+
+
+class InstrumentedApiClient(ApiClient):
+    """
+    `ApiClient` counting and timing every request by verb, path template and status,
+    and sending it through the circuit breaker of its cluster (`cluster_health`).
+
+    The path template (e.g. `/api/v1/namespaces/{namespace}/pods`) is used rather than
+    the actual path, so the number of label values stays bounded.
+
+    Kept apart from `instrumentation`, so the Kubernetes client is only imported once
+    the first client is created.
+    """
+
+    _cluster_key = None
+
+    @property
+    def cluster_key(self) -> tuple:
+        if self._cluster_key is None:
+            self._cluster_key = get_cluster_key(self)
+        return self._cluster_key
+
+    def call_api(self, resource_path, method, *args, **kwargs):
+        if kwargs.get("_request_timeout") is None and cluster_health.connect_timeout:
+            # connect timeout only: watches keep their responses open for a long time
+            kwargs["_request_timeout"] = (cluster_health.connect_timeout, None)
+        return cluster_health.call(
+            self.cluster_key, self.configuration.host,
+            lambda: self._call_api(resource_path, method, *args, **kwargs),
+            self._probe
+        )
+
+    def _probe(self) -> None:
+        response = super().call_api(
+            "/version", "GET",
+            auth_settings=["BearerToken"],
+            _preload_content=False,
+            _return_http_data_only=True,
+            # a (connect, read) pair: the client ignores a single float
+            _request_timeout=(cluster_health.probe_timeout, cluster_health.probe_timeout)
+        )
+        response.release_conn()
+
+    def _call_api(self, resource_path, method, *args, **kwargs):
+        if not instrumentation.enabled:
+            return super().call_api(resource_path, method, *args, **kwargs)
+        status = "error"
+        start = time.perf_counter()
+        try:
+            result = super().call_api(resource_path, method, *args, **kwargs)
+            if isinstance(result, tuple):
+                status = str(result[1])
+            elif isinstance(result, HTTPResponse):
+                status = str(result.status)
+            else:
+                status = "200"
+            return result
+        except ApiException as exc:
+            status = str(exc.status)
+            raise
+        finally:
+            instrumentation.increment(
+                "k8s_requests_total", verb=method, path=resource_path, status=status
+            )
+            instrumentation.observe(
+                "k8s_request_seconds", time.perf_counter() - start,
+                verb=method, path=resource_path
+            )
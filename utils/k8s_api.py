@@ -1,89 +1,88 @@
-from typing import Tuple, Dict
-from pylon.core.tools import log
-from kubernetes.client import V1Container, CoreV1Api, V1ResourceQuotaList, Configuration, \
-    ApiClient
-
-
-def _normalize_cpu(cpu: str) -> float:
-    """
-    Normalize a CPU value expressed as a string to a floating point value in millicores.
-
-    :param cpu: The CPU value to normalize, expressed as a string with a unit suffix.
-                Supported units are: m (millicores), mu (microcores), u (microcores),
-                n (nanocores).
-    :return: The normalized CPU value in millicores.
-
-    :raises ValueError: If the provided CPU unit is not recognized.
-    """
-    cpu = str(cpu)
-    if cpu[-1:].isdigit():
-        return float(cpu) * 1000
-    if cpu[-1:] == "m":
-        return float(cpu[:-1])
-    elif cpu[-2:] == "mu":
-        return float(cpu[:-2]) / 1000
-    elif cpu[-1:] == "u":
-        return float(cpu[:-1]) / 1000
-    elif cpu[-2:] == "n":
-        return float(cpu[:-2]) / 1000000
-    raise ValueError(f"Invalid CPU unit {cpu[-2:]}")
-
-
-def _normalize_memory(memory: str) -> float:
-    """
-    Normalize a memory value expressed as a string to a floating point value in MiB.
-
-    :param memory: The memory value to normalize, expressed as a string with a unit suffix.
-                   Supported units are: Ki (kibibytes), K (kilobytes), Mi (mebibytes),
-                   M (megabytes), Gi (gibibytes), G (gigabytes).
-    :return: The normalized memory value in MiB.
-    :raises ValueError: If the provided memory unit is not recognized.
-    """
-    memory = str(memory)
-    if memory[-1:].isdigit():
-        return float(memory)
-    if memory.endswith("Ki"):
-        return float(memory[:-2]) / 1024
-    if memory.endswith("K"):
-        return float(memory[:-1]) / 1024
-    if memory.endswith("Mi"):
-        return float(memory[:-2])
-    if memory.endswith("M"):
-        return float(memory[:-1])
-    if memory.endswith("Gi"):
-        return float(memory[:-2]) * 1024
-    if memory.endswith("G"):
-        return float(memory[:-1]) * 1024
-    raise ValueError(f"Invalid memory unit {memory[-2:]}")
-
-
-def get_cluster_capacity(v1: CoreV1Api, namespace: str) -> Dict[str, float]:
+import time
+from typing import TYPE_CHECKING, Tuple, Dict, Iterable, List, Optional, Callable
+
+from .capacity_cache import capacity_cache
+from .cluster_state import ClusterState
+from .client_pool import client_pool, get_cluster_key
+from .informer import informers
+from .instrumentation import instrumentation
+from .placement import NodeResources
+from .snapshot_store import snapshot_store
+from .resource_metrics import get_cached_pod_metrics, pods_utilization
+from .quantity import parse_cpu, parse_memory, parse_cpu_many, parse_memory_many
+from .records import ContainerRecord, PodRecord, NodeRecord, QuotaRecord, \
+    ACTIVE_PODS_FIELD_SELECTOR, list_raw, iter_node_records, iter_quota_records
+
+if TYPE_CHECKING:
+    from kubernetes.client import V1Container, CoreV1Api
+
+QUOTA_CPU_KEYS = ("cpu", "limits.cpu", "requests.cpu")
+QUOTA_MEMORY_KEYS = ("memory", "limits.memory", "requests.memory")
+
+
+def get_cluster_capacity(v1: "CoreV1Api", namespace: str) -> Dict[str, float]:
     """
     Retrieve the cluster capacity for a given namespace in a Kubernetes cluster.
 
+    When an informer is watching the cluster, the capacity is read from its running
+    totals instead of listing nodes, pods and quotas again.
+
     :param v1: a `CoreV1Api` object for interacting with the Kubernetes API.
     :param namespace: the name of the namespace.
 
     :return: a dictionary with keys 'cpu' and 'memory' representing the maximum capacity
-    for CPU and memory in the namespace, respectively.
+    for CPU and memory in the namespace, respectively. With the metrics mode enabled,
+    'used' holds the same capacity computed from actual pod utilization.
     """
-    quotas = v1.list_namespaced_resource_quota(namespace=namespace)
+    informer = informers.get(v1)
+    if informer is not None and informer.synced:
+        with instrumentation.span("capacity.informer"):
+            pod_metrics = get_cached_pod_metrics(v1)
+            return calculate_capacity(
+                *informer.capacity_inputs(namespace),
+                None if pod_metrics is None
+                else pods_utilization(informer.pod_requests(), pod_metrics)
+            )
+
+    with instrumentation.span("capacity.quotas"):
+        quotas = get_namespace_quotas(v1, namespace)
+    with instrumentation.span("capacity.nodes"):
+        node_capacity = get_max_cluster_capacity(v1)
+    with instrumentation.span("capacity.pods"):
+        pods = get_cluster_pods(v1)
+    with instrumentation.span("capacity.utilization"):
+        pod_metrics = get_cached_pod_metrics(v1)
+    return calculate_capacity(
+        node_capacity, pods.total_usage(), quotas,
+        None if pod_metrics is None else pods_utilization(pods.pod_requests(), pod_metrics)
+    )
+
+
+def calculate_capacity(node_capacity: Tuple[float, float, int],
+                       cluster_usage: Tuple[float, float, int],
+                       quotas: List[QuotaRecord],
+                       utilization: Optional[Tuple[float, float, int]] = None) -> Dict:
+    """
+    Combine node capacity, cluster usage and namespace quotas into the free capacity.
 
-    cluster_cpu_capacity, cluster_memory_capacity, cluster_pods_capacity = \
-        get_max_cluster_capacity(v1)
-    namespaces = v1.list_namespace()
-    cluster_memory_usage = 0.0
-    cluster_cpu_usage = 0.0
-    cluster_pods_usage = 0
-    for namespace in namespaces.items:
-        namespace_cpu_usage, namespace_memory_usage, namespace_pods_usage = \
-            get_namespace_resource_usage(v1, namespace.metadata.name)
+    :param node_capacity: the (cpu, memory, pods) capacity, as `get_max_cluster_capacity`.
+    :param cluster_usage: the (cpu, memory, pods) usage of the whole cluster.
+    :param quotas: the resource quotas of the namespace.
+    :param utilization: the (cpu, memory, pods) actual utilization of the whole cluster,
+        as `pods_utilization`, if known.
 
-        cluster_memory_usage += namespace_memory_usage
-        cluster_cpu_usage += namespace_cpu_usage
-        cluster_pods_usage += namespace_pods_usage
+    :return: a dictionary with keys 'cpu', 'memory' and 'pods', plus 'quota_bound' with
+             the keys the namespace quotas limit more than the nodes do, and 'used' with
+             the same keys computed from `utilization` if given.
+    """
+    if utilization is not None:
+        return {
+            **calculate_capacity(node_capacity, cluster_usage, quotas),
+            "used": calculate_capacity(node_capacity, utilization, quotas),
+        }
+    cluster_cpu_capacity, cluster_memory_capacity, cluster_pods_capacity = node_capacity
+    cluster_cpu_usage, cluster_memory_usage, cluster_pods_usage = cluster_usage
 
-    log.info(f"{cluster_memory_capacity=} {cluster_memory_usage=}")
     cluster_memory_free = cluster_memory_capacity - cluster_memory_usage - 300.0
     cluster_cpu_free = cluster_cpu_capacity - cluster_cpu_usage
     cluster_pods_usage = cluster_pods_capacity - cluster_pods_usage
@@ -94,12 +93,16 @@ def get_cluster_capacity(v1: CoreV1Api, namespace: str) -> Dict[str, float]:
         'cpu': cluster_cpu_free, 'memory': cluster_memory_free, "pods": cluster_pods_usage
     }
 
-    if quotas.items:
+    if quotas:
         max_capacity_quota = get_from_quota(quotas)
         max_capacity = {
             "cpu": min(max_capacity_quota["cpu"], max_capacity_node["cpu"]),
             "memory": min(max_capacity_quota["memory"], max_capacity_node["memory"]),
-            "pods": min(max_capacity_quota["pods"], max_capacity_node["pods"])
+            "pods": min(max_capacity_quota["pods"], max_capacity_node["pods"]),
+            "quota_bound": [
+                key for key in ("cpu", "memory", "pods")
+                if max_capacity_quota[key] < max_capacity_node[key]
+            ],
         }
     else:
         max_capacity = max_capacity_node
@@ -107,7 +110,60 @@ def get_cluster_capacity(v1: CoreV1Api, namespace: str) -> Dict[str, float]:
     return max_capacity
 
 
-def get_namespace_resource_usage(v1: CoreV1Api, namespace: str) -> Tuple[float, float, int]:
+def get_capacity_key(v1: "CoreV1Api", namespace: str) -> tuple:
+    """ The capacity cache key of a cluster and namespace """
+    return ("capacity", *get_cluster_key(v1.api_client), namespace)
+
+
+def get_namespace_quotas(v1: "CoreV1Api", namespace: str,
+                         deadline: Optional[float] = None) -> List[QuotaRecord]:
+    """
+    List the resource quotas of a namespace.
+
+    :param v1: a `CoreV1Api` object for interacting with the Kubernetes API.
+    :param namespace: the name of the namespace.
+    :param deadline: an optional `time.monotonic()` deadline for the whole list.
+
+    :return: the resource quotas of the namespace.
+    """
+    return list(iter_quota_records(
+        v1.list_namespaced_resource_quota, namespace=namespace, deadline=deadline
+    ))
+
+
+def get_cluster_resource_usage(
+        v1: "CoreV1Api", deadline: Optional[float] = None
+) -> Tuple[float, float, int, Dict[str, Tuple[float, float, int]]]:
+    """
+    Calculate the resource usage (CPU and memory) of all pods in the cluster.
+
+    All pods are fetched with a single paginated `list_pod_for_all_namespaces` scan
+    into a columnar `ClusterState`, then aggregated per namespace and cluster-wide.
+
+    :param deadline: an optional `time.monotonic()` deadline for the whole scan.
+
+    :return: A tuple containing the total CPU usage, total memory usage and pods count
+             of the cluster, followed by a dictionary mapping every namespace with pods
+             to its own (cpu, memory, pods) usage tuple.
+    """
+    state = get_cluster_pods(v1, deadline)
+    return (*state.total_usage(), state.namespace_usage())
+
+
+def get_cluster_pods(v1: "CoreV1Api", deadline: Optional[float] = None) -> ClusterState:
+    """
+    List the active pods of the cluster into a columnar `ClusterState`, in one
+    paginated `list_pod_for_all_namespaces` scan.
+
+    :param deadline: an optional `time.monotonic()` deadline for the whole scan.
+    """
+    return ClusterState.from_raw(pods=list_raw(
+        v1.list_pod_for_all_namespaces, deadline=deadline,
+        field_selector=ACTIVE_PODS_FIELD_SELECTOR
+    ))
+
+
+def get_namespace_resource_usage(v1: "CoreV1Api", namespace: str) -> Tuple[float, float, int]:
     """
     Calculate the total resource usage (CPU and memory) of all pods in a namespace.
 
@@ -116,27 +172,101 @@ def get_namespace_resource_usage(v1: CoreV1Api, namespace: str) -> Tuple[float,
              in that order.
     """
 
-    namespace_memory_usage = 0
-    namespace_cpu_usage = 0
-    namespace_pods_usage = 0
-    pods = v1.list_namespaced_pod(namespace)
-    for pod in pods.items:
-        pod_memory_usage = 0
-        pod_cpu_usage = 0
-        namespace_pods_usage += 1
-        for container in pod.spec.containers:
-            container_cpu_usage, container_memory_usage = get_container_resource_usage(
-                container)
+    return ClusterState.from_raw(pods=list_raw(
+        v1.list_namespaced_pod, namespace=namespace, field_selector=ACTIVE_PODS_FIELD_SELECTOR
+    )).total_usage()
 
-            pod_memory_usage += container_memory_usage
-            pod_cpu_usage += container_cpu_usage
 
-        namespace_cpu_usage += pod_cpu_usage
-        namespace_memory_usage += pod_memory_usage
-    return namespace_cpu_usage, namespace_memory_usage, namespace_pods_usage
+def get_pod_resource_usage(pod: PodRecord) -> Tuple[float, float]:
+    """
+    Calculate the resource usage (CPU and memory) of a pod.
+
+    Containers are combined the way the scheduler does it: the larger of the sum of the
+    app containers and the largest init container, plus the pod overhead.
+
+    :param pod: The pod to calculate resource usage for.
+
+    :return: A tuple containing the CPU usage and memory usage of the pod, in that order.
+    """
+    return _get_pod_resources(
+        pod, lambda container: get_resources_usage(container.requests, container.limits)
+    )
 
 
-def get_container_resource_usage(container: V1Container) -> Tuple[float, float]:
+def get_pod_resource_requests(pod: PodRecord) -> Tuple[float, float]:
+    """
+    Calculate the resources (CPU and memory) a pod requests from the scheduler.
+
+    :param pod: The pod to calculate resource requests for.
+
+    :return: A tuple containing the CPU request and memory request of the pod, in that order.
+    """
+    return _get_pod_resources(
+        pod, lambda container: (
+            parse_cpu(container.requests.get('cpu', "0")),
+            parse_memory(container.requests.get('memory', "0"))
+        )
+    )
+
+
+def _get_pod_resources(
+        pod: PodRecord, get_container_resources: Callable[[ContainerRecord], Tuple[float, float]]
+) -> Tuple[float, float]:
+    pod_cpu, pod_memory = 0.0, 0.0
+    for container in pod.containers:
+        container_cpu, container_memory = get_container_resources(container)
+        pod_cpu += container_cpu
+        pod_memory += container_memory
+    for container in pod.init_containers:
+        container_cpu, container_memory = get_container_resources(container)
+        pod_cpu = max(pod_cpu, container_cpu)
+        pod_memory = max(pod_memory, container_memory)
+    if pod.overhead:
+        pod_cpu += parse_cpu(pod.overhead.get('cpu', "0"))
+        pod_memory += parse_memory(pod.overhead.get('memory', "0"))
+    return pod_cpu, pod_memory
+
+
+def get_nodes_free_resources(v1: "CoreV1Api",
+                             deadline: Optional[float] = None) -> List[NodeResources]:
+    """
+    Calculate the free resources of every schedulable node in the cluster.
+
+    The free resources of a node are its allocatable resources
+    minus the requests of the pods scheduled on it.
+
+    :param v1: a `CoreV1Api` object for interacting with the Kubernetes API.
+    :param deadline: an optional `time.monotonic()` deadline for the node and pod lists.
+
+    :return: a list with the free CPU (millicores), memory (MiB) and pods of every node.
+    """
+    state = ClusterState.from_raw(
+        pods=list_raw(
+            v1.list_pod_for_all_namespaces, field_selector=ACTIVE_PODS_FIELD_SELECTOR,
+            deadline=deadline
+        ),
+        nodes=iter_node_records(v1.list_node, deadline=deadline)
+    )
+    snapshot_store.save_state(get_cluster_key(v1.api_client), state)
+    return state.nodes_free_resources()
+
+
+def get_cached_nodes_free_resources(v1: "CoreV1Api",
+                                    timeout: Optional[float] = None) -> List[NodeResources]:
+    """
+    Same as `get_nodes_free_resources`, but served from the capacity snapshot cache.
+
+    :param timeout: seconds the scan may take on a cache miss; no limit if None.
+    """
+    def compute() -> List[NodeResources]:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        return get_nodes_free_resources(v1, deadline)
+
+    key = ("nodes", *get_cluster_key(v1.api_client))
+    return capacity_cache.get(key, compute)
+
+
+def get_container_resource_usage(container: "V1Container") -> Tuple[float, float]:
     """
     Calculate the resource usage (CPU and memory) of a container.
 
@@ -148,18 +278,31 @@ def get_container_resource_usage(container: V1Container) -> Tuple[float, float]:
     :return: A tuple containing the CPU usage and memory usage of the container, in that order.
     """
     resources = container.resources
-    if resources.limits:
-        container_cpu_limit = resources.limits.get('cpu', "0")
-        container_memory_limit = resources.limits.get('memory', "0")
-        container_cpu_limit = _normalize_cpu(container_cpu_limit)
-        container_memory_limit = _normalize_memory(container_memory_limit)
+    return get_resources_usage(resources.requests, resources.limits)
+
+
+def get_resources_usage(requests: Optional[Dict[str, str]],
+                        limits: Optional[Dict[str, str]]) -> Tuple[float, float]:
+    """
+    Calculate the resource usage (CPU and memory) from resource requests and limits.
+
+    :param requests: The resource requests, mapping resource names to quantities.
+    :param limits: The resource limits, mapping resource names to quantities.
+
+    :return: A tuple containing the CPU usage and memory usage, in that order.
+    """
+    if limits:
+        container_cpu_limit = limits.get('cpu', "0")
+        container_memory_limit = limits.get('memory', "0")
+        container_cpu_limit = parse_cpu(container_cpu_limit)
+        container_memory_limit = parse_memory(container_memory_limit)
     else:
         container_cpu_limit, container_memory_limit = 0, 0
-    if resources.requests:
-        container_cpu_request = resources.requests.get('cpu', "0")
-        container_memory_request = resources.requests.get('memory', "0")
-        container_cpu_request = _normalize_cpu(container_cpu_request)
-        container_memory_request = _normalize_memory(container_memory_request)
+    if requests:
+        container_cpu_request = requests.get('cpu', "0")
+        container_memory_request = requests.get('memory', "0")
+        container_cpu_request = parse_cpu(container_cpu_request)
+        container_memory_request = parse_memory(container_memory_request)
     else:
         container_cpu_request, container_memory_request = 0, 0
     container_memory_usage = max(container_memory_request,
@@ -168,34 +311,72 @@ def get_container_resource_usage(container: V1Container) -> Tuple[float, float]:
     return container_cpu_usage, container_memory_usage
 
 
-def get_max_cluster_capacity(v1: CoreV1Api) -> Tuple[float, float, int]:
+def get_max_cluster_capacity(v1: "CoreV1Api",
+                             deadline: Optional[float] = None) -> Tuple[float, float, int]:
     """
     Calculate the maximum capacity for CPU and memory in a namespace.
 
-    The maximum capacity is calculated as the maximum capacity of all nodes in the cluster.
+    The maximum capacity is calculated as the maximum allocatable resources
+    of all nodes in the cluster.
+
+    :param deadline: an optional `time.monotonic()` deadline for listing the nodes.
 
     :return: a tuple containing the maximum CPU capacity and maximum memory
     capacity of the namespace, in that order.
     """
-    max_capacity = {'cpu': "0m", 'memory': "0Mi", "pods": 0}
-    nodes = v1.list_node()
-    if not nodes.items:
+    capacity = ClusterState.from_raw(
+        nodes=iter_node_records(v1.list_node, deadline=deadline)
+    ).max_node_capacity()
+    if capacity is None:
+        raise ValueError("Can't calculate capacity for auto scaling cluster")
+    return capacity
+
+
+def get_max_node_capacity(
+        nodes_capacity: Iterable[Tuple[float, float, int]]
+) -> Tuple[float, float, int]:
+    """
+    Take the largest CPU, memory and pods capacity among the given nodes.
+
+    :param nodes_capacity: (cpu, memory, pods) capacity tuples, as `get_node_capacity`.
+
+    :return: a tuple containing the maximum CPU, memory and pods capacity, in that order.
+
+    :raises ValueError: If there are no nodes.
+    """
+    cluster_cpu_capacity, cluster_memory_capacity, cluster_pods_capacity = 0.0, 0.0, 0
+    has_nodes = False
+    for node_cpu, node_memory, node_pods in nodes_capacity:
+        has_nodes = True
+        cluster_cpu_capacity = max(cluster_cpu_capacity, node_cpu)
+        cluster_memory_capacity = max(cluster_memory_capacity, node_memory)
+        cluster_pods_capacity = max(cluster_pods_capacity, node_pods)
+    if not has_nodes:
         raise ValueError("Can't calculate capacity for auto scaling cluster")
-    for node in nodes.items:
-        node_capacity = node.status.capacity
-        max_capacity['cpu'] = max(_normalize_cpu(max_capacity['cpu']),
-                                  _normalize_cpu(node_capacity['cpu']))
-        max_capacity['memory'] = max(_normalize_memory(max_capacity['memory']),
-                                     _normalize_memory(node_capacity['memory']))
-        max_capacity["pods"] = max(int(node_capacity["pods"]), max_capacity["pods"])
-
-    cluster_memory_capacity = max_capacity["memory"]
-    cluster_cpu_capacity = max_capacity["cpu"]
-    cluster_pods_capacity = max_capacity["pods"]
     return cluster_cpu_capacity, cluster_memory_capacity, cluster_pods_capacity
 
 
-def get_from_quota(quotas: V1ResourceQuotaList) -> Dict[str, float]:
+def get_node_capacity(node: NodeRecord) -> Tuple[float, float, int]:
+    """
+    Read the capacity of a node available to pods.
+
+    Uses the node's allocatable resources, which exclude what is reserved for the system
+    and kubelet, and falls back to its raw capacity if allocatable is not reported.
+
+    :param node: The node to read the capacity of.
+
+    :return: A tuple containing the CPU capacity in millicores, memory capacity in MiB
+             and pods capacity of the node, in that order.
+    """
+    node_capacity = node.allocatable or node.capacity
+    return (
+        parse_cpu(node_capacity['cpu']),
+        parse_memory(node_capacity['memory']),
+        int(node_capacity["pods"])
+    )
+
+
+def get_from_quota(quotas: Iterable[QuotaRecord]) -> Dict[str, float]:
     """
     Calculate the maximum capacity for CPU and memory in a namespace based on resource quotas.
 
@@ -209,47 +390,34 @@ def get_from_quota(quotas: V1ResourceQuotaList) -> Dict[str, float]:
           with keys 'cpu' and 'memory', respectively.
     """
 
-    max_capacity = {'cpu': "0m", 'memory': "0Mi", "pods": 0}
-    for quota in quotas.items:
-        quota_limit = quota.status.hard
-        quota_used = quota.status.used
-        quota_limit_cpu = min(
-            _normalize_cpu(quota_limit.get("cpu", "0")),
-            _normalize_cpu(quota_limit.get("limits.cpu", "0")),
-            _normalize_cpu(quota_limit.get("requests.cpu", "0")),
-        )
+    max_capacity = {'cpu': 0.0, 'memory': 0.0, "pods": 0}
+    for quota in quotas:
+        quota_limit = quota.hard
+        quota_used = quota.used
+        quota_limit_cpu = min(parse_cpu_many(quota_limit.get(key, "0") for key in QUOTA_CPU_KEYS))
         quota_limit_memory = min(
-            _normalize_memory(quota_limit.get("memory", "0")),
-            _normalize_memory(quota_limit.get("limits.memory", "0")),
-            _normalize_memory(quota_limit.get("requests.memory", "0")),
-        )
-        quota_usage_cpu = max(
-            _normalize_cpu(quota_used.get("cpu", "0")),
-            _normalize_cpu(quota_used.get("limits.cpu", "0")),
-            _normalize_cpu(quota_used.get("requests.cpu", "0")),
-        )
+            parse_memory_many(quota_limit.get(key, "0") for key in QUOTA_MEMORY_KEYS))
+        quota_usage_cpu = max(parse_cpu_many(quota_used.get(key, "0") for key in QUOTA_CPU_KEYS))
         quota_usage_memory = max(
-            _normalize_memory(quota_used.get("memory", "0")),
-            _normalize_memory(quota_used.get("limits.memory", "0")),
-            _normalize_memory(quota_used.get("requests.memory", "0")),
-        )
+            parse_memory_many(quota_used.get(key, "0") for key in QUOTA_MEMORY_KEYS))
         free_cpu_in_quota = quota_limit_cpu - quota_usage_cpu
         free_space_in_quota = quota_limit_memory - quota_usage_memory
         free_pods_in_quota = int(quota_limit["pods"]) - int(quota_used["pods"])
 
-        max_capacity['cpu'] = max(_normalize_cpu(max_capacity['cpu']),
-                                  free_cpu_in_quota)
-        max_capacity['memory'] = max(_normalize_memory(max_capacity['memory']),
-                                     free_space_in_quota)
+        max_capacity['cpu'] = max(max_capacity['cpu'], free_cpu_in_quota)
+        max_capacity['memory'] = max(max_capacity['memory'], free_space_in_quota)
         max_capacity["pods"] = max(max_capacity["pods"], free_pods_in_quota)
 
     return max_capacity
 
 
-def get_core_api(token: str, hostname: str, secure_connection: bool = False) -> CoreV1Api:
+def get_core_api(token: str, hostname: str, secure_connection: bool = False) -> "CoreV1Api":
     """
     Create a `CoreV1Api` object for interacting with the Kubernetes API.
 
+    The underlying `ApiClient` is taken from the shared client pool, so repeated calls
+    for the same cluster and token reuse its connections instead of opening new ones.
+
     :param token: the token to authenticate with the Kubernetes API.
     :param hostname: the hostname of the Kubernetes API.
     :param secure_connection: whether to verify ssl certificate when communicating
@@ -257,12 +425,6 @@ def get_core_api(token: str, hostname: str, secure_connection: bool = False) ->
 
     :return: a `CoreV1Api` object for interacting with the Kubernetes API.
     """
-    configuration = Configuration()
-
-    configuration.api_key_prefix['authorization'] = 'Bearer'
-    configuration.api_key['authorization'] = token
-    configuration.host = hostname.rstrip('/')
-    configuration.verify_ssl = secure_connection
+    from kubernetes.client import CoreV1Api
 
-    core_api = CoreV1Api(ApiClient(configuration))
-    return core_api
+    return CoreV1Api(client_pool.get(token, hostname, secure_connection))
@@ -0,0 +1,80 @@
+import hashlib
+import json
+from typing import TYPE_CHECKING, List, Optional
+
+from .capacity_cache import capacity_cache
+from .client_pool import get_cluster_key
+from .records import list_raw_path
+
+if TYPE_CHECKING:
+    from kubernetes.client import CoreV1Api
+
+# Ask for metadata only; servers that can't serve the projection fall back to full objects
+METADATA_ONLY_ACCEPT = "application/json;as=PartialObjectMetadataList;g=meta.k8s.io;v=v1, " \
+                       "application/json"
+DEFAULT_NAMESPACES_LIMIT = 100
+
+
+def list_namespace_names(v1: "CoreV1Api", deadline: Optional[float] = None) -> List[str]:
+    """
+    List the names of all namespaces in the cluster.
+
+    Namespaces are requested as a metadata-only projection, page by page, and decoded
+    without building `V1Namespace` models.
+
+    :param v1: a `CoreV1Api` object for interacting with the Kubernetes API.
+    :param deadline: an optional `time.monotonic()` deadline for the whole list.
+
+    :return: the sorted namespace names.
+    """
+    return sorted(
+        item["metadata"]["name"]
+        for item in list_raw_path(
+            v1.api_client, "/api/v1/namespaces", deadline=deadline,
+            headers={"Accept": METADATA_ONLY_ACCEPT}
+        )
+    )
+
+
+def get_cached_namespace_names(v1: "CoreV1Api") -> List[str]:
+    """
+    Same as `list_namespace_names`, but served from the capacity snapshot cache.
+    """
+    key = ("namespaces", *get_cluster_key(v1.api_client))
+    return capacity_cache.get(key, lambda: list_namespace_names(v1))
+
+
+def page_namespace_names(names: List[str], search: Optional[str] = None,
+                         prefix: Optional[str] = None,
+                         limit: int = DEFAULT_NAMESPACES_LIMIT,
+                         continue_token: Optional[str] = None) -> dict:
+    """
+    Filter namespace names and return one page of them.
+
+    :param names: all namespace names, sorted.
+    :param search: keep only names containing this substring (case-insensitive).
+    :param prefix: keep only names starting with this prefix.
+    :param limit: the maximum number of names returned.
+    :param continue_token: the `continue` value of the previous page.
+
+    :return: a dictionary with the page 'items', the 'continue' token of the next page
+             (None on the last page), the 'total' number of matching names
+             and an 'etag' identifying the page content.
+    """
+    if prefix:
+        names = [name for name in names if name.startswith(prefix)]
+    if search:
+        search = search.lower()
+        names = [name for name in names if search in name.lower()]
+    try:
+        start = max(int(continue_token or 0), 0)
+    except ValueError:
+        start = 0
+    end = start + max(limit, 1)
+    page = {
+        "items": names[start:end],
+        "continue": str(end) if end < len(names) else None,
+        "total": len(names),
+    }
+    page["etag"] = hashlib.sha1(json.dumps(page, sort_keys=True).encode()).hexdigest()
+    return page
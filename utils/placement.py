@@ -0,0 +1,137 @@
+from math import floor
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+_EPSILON = 1e-6
+
+
+class NodeResources(NamedTuple):
+    """ Free resources of a schedulable node: CPU in millicores, memory in MiB """
+    name: str
+    cpu: float
+    memory: float
+    pods: int
+
+
+class PlacementPlan(NamedTuple):
+    """ Where the runners and the post-processor of a test would be scheduled """
+    feasible: bool
+    runners: Dict[str, int]
+    post_processor: Optional[str]
+    unplaced: int
+
+
+def _fits(node: List, cpu: float, memory: float) -> int:
+    """ How many pods of the given size fit into the node's remaining resources """
+    counts = [node[3]]
+    if cpu > 0:
+        counts.append(floor((node[1] + _EPSILON) / cpu))
+    if memory > 0:
+        counts.append(floor((node[2] + _EPSILON) / memory))
+    return max(min(counts), 0)
+
+
+def _take(node: List, count: int, cpu: float, memory: float) -> None:
+    node[1] -= cpu * count
+    node[2] -= memory * count
+    node[3] -= count
+
+
+def plan_placement(nodes: Iterable[NodeResources], runners: int,
+                   runner_cpu: float, runner_memory: float,
+                   post_processor_cpu: float = 0, post_processor_memory: float = 0
+                   ) -> PlacementPlan:
+    """
+    Simulate scheduling `runners` identical runner pods plus an optional post-processor.
+
+    Uses first-fit-decreasing: pods are placed largest first, each on the first node
+    (ordered by free resources, largest first) that still has room for it. Since all
+    runners have the same shape, the runners a node can take are placed in one step,
+    which keeps the simulation linear in the number of nodes.
+
+    :param nodes: the free resources of every schedulable node.
+    :param runners: the number of runner pods.
+    :param runner_cpu: CPU of a single runner, in millicores.
+    :param runner_memory: memory of a single runner, in MiB.
+    :param post_processor_cpu: CPU of the post-processor, in millicores; 0 for none.
+    :param post_processor_memory: memory of the post-processor, in MiB; 0 for none.
+
+    :return: the placement plan; `feasible` is False if any pod could not be placed.
+    """
+    bins = sorted(
+        ([node.name, node.cpu, node.memory, node.pods] for node in nodes),
+        key=lambda node: (node[1], node[2]), reverse=True
+    )
+    has_post_processor = post_processor_cpu > 0 or post_processor_memory > 0
+    post_processor_first = (post_processor_cpu, post_processor_memory) >= \
+        (runner_cpu, runner_memory)
+
+    post_processor_node = None
+    if has_post_processor and post_processor_first:
+        post_processor_node = _place_one(bins, post_processor_cpu, post_processor_memory)
+
+    placed = {}
+    remaining = runners
+    for node in bins:
+        if remaining <= 0:
+            break
+        count = min(_fits(node, runner_cpu, runner_memory), remaining)
+        if count:
+            _take(node, count, runner_cpu, runner_memory)
+            placed[node[0]] = count
+            remaining -= count
+
+    if has_post_processor and not post_processor_first:
+        post_processor_node = _place_one(bins, post_processor_cpu, post_processor_memory)
+
+    feasible = remaining == 0 and (not has_post_processor or post_processor_node is not None)
+    return PlacementPlan(feasible, placed, post_processor_node, remaining)
+
+
+def _place_one(bins: List[List], cpu: float, memory: float) -> Optional[str]:
+    for node in bins:
+        if _fits(node, cpu, memory):
+            _take(node, 1, cpu, memory)
+            return node[0]
+    return None
+
+
+def spread_placement(nodes: Iterable[NodeResources], runners: int,
+                     runner_cpu: float, runner_memory: float,
+                     post_processor_cpu: float = 0, post_processor_memory: float = 0
+                     ) -> PlacementPlan:
+    """
+    Plan the runners of a test spread as evenly as possible over the nodes.
+
+    Unlike `plan_placement`, which packs runners on the largest nodes, every node gets
+    the same share of runners, except nodes that can't take their share: these are
+    filled up and the rest is shared among the others. The post-processor goes first,
+    on the node with the most free resources.
+
+    The parameters are the ones of `plan_placement`.
+
+    :return: the placement plan; `feasible` is False if any pod could not be placed.
+    """
+    bins = sorted(
+        ([node.name, node.cpu, node.memory, node.pods] for node in nodes),
+        key=lambda node: (node[1], node[2]), reverse=True
+    )
+    has_post_processor = post_processor_cpu > 0 or post_processor_memory > 0
+    post_processor_node = None
+    if has_post_processor:
+        post_processor_node = _place_one(bins, post_processor_cpu, post_processor_memory)
+
+    slots = sorted(
+        ((_fits(node, runner_cpu, runner_memory), node) for node in bins),
+        key=lambda slot: slot[0]
+    )
+    placed = {}
+    remaining = runners
+    for index, (free_slots, node) in enumerate(slots):
+        share = -(-remaining // (len(slots) - index))
+        count = min(free_slots, share)
+        if count:
+            placed[node[0]] = count
+            remaining -= count
+
+    feasible = remaining == 0 and (not has_post_processor or post_processor_node is not None)
+    return PlacementPlan(feasible, placed, post_processor_node, remaining)
@@ -0,0 +1,132 @@
+import re
+from decimal import Decimal
+from functools import lru_cache
+from typing import Iterable, List, Union
+
+_BINARY_SUFFIXES = {
+    "Ki": Decimal(2) ** 10,
+    "Mi": Decimal(2) ** 20,
+    "Gi": Decimal(2) ** 30,
+    "Ti": Decimal(2) ** 40,
+    "Pi": Decimal(2) ** 50,
+    "Ei": Decimal(2) ** 60,
+}
+_DECIMAL_SUFFIXES = {
+    "n": Decimal(10) ** -9,
+    "u": Decimal(10) ** -6,
+    "m": Decimal(10) ** -3,
+    "": Decimal(1),
+    "k": Decimal(10) ** 3,
+    "K": Decimal(10) ** 3,
+    "M": Decimal(10) ** 6,
+    "G": Decimal(10) ** 9,
+    "T": Decimal(10) ** 12,
+    "P": Decimal(10) ** 15,
+    "E": Decimal(10) ** 18,
+}
+_QUANTITY_RE = re.compile(
+    r"^(?P<number>[+-]?(?:\d+(?:\.\d*)?|\.\d+))"
+    r"(?:(?P<exponent>[eE][+-]?\d+)|(?P<suffix>[KMGTPE]i|[numkKMGTPE]?))$"
+)
+_MIB = Decimal(2) ** 20
+
+Quantity = Union[str, int, float]
+
+
+@lru_cache(maxsize=4096)
+def _parse(quantity: str) -> Decimal:
+    match = _QUANTITY_RE.match(quantity.strip())
+    if match is None:
+        raise ValueError(f"Invalid quantity {quantity!r}")
+    number = Decimal(match.group("number"))
+    if match.group("exponent"):
+        return number.scaleb(int(match.group("exponent")[1:]))
+    suffix = match.group("suffix")
+    if suffix in _BINARY_SUFFIXES:
+        return number * _BINARY_SUFFIXES[suffix]
+    return number * _DECIMAL_SUFFIXES[suffix]
+
+
+def parse_quantity(quantity: Quantity) -> Decimal:
+    """
+    Parse a Kubernetes resource quantity into its value in base units.
+
+    Supports the full quantity grammar: binary SI suffixes (Ki, Mi, Gi, Ti, Pi, Ei),
+    decimal SI suffixes (n, u, m, k, M, G, T, P, E) and decimal exponents (1e3, 5E-3).
+    Parsed strings are memoized, as real clusters only use a handful of distinct values.
+
+    :param quantity: The quantity to parse, e.g. "100m", "512Mi" or 2.
+
+    :return: The quantity in base units (cores or bytes).
+
+    :raises ValueError: If the quantity does not match the grammar.
+    """
+    return _parse(str(quantity))
+
+
+@lru_cache(maxsize=4096)
+def _parse_cpu(quantity: str) -> float:
+    return float(_parse(quantity) * 1000)
+
+
+@lru_cache(maxsize=4096)
+def _parse_memory(quantity: str) -> float:
+    return float(_parse(quantity) / _MIB)
+
+
+def parse_cpu(quantity: Quantity) -> float:
+    """
+    Parse a CPU quantity into millicores.
+
+    :param quantity: The CPU quantity, e.g. "2", "250m" or "500000n".
+
+    :return: The CPU value in millicores.
+
+    :raises ValueError: If the quantity does not match the grammar.
+    """
+    return _parse_cpu(str(quantity))
+
+
+def parse_memory(quantity: Quantity) -> float:
+    """
+    Parse a memory quantity into MiB.
+
+    :param quantity: The memory quantity, e.g. "512Mi", "1G" or "1048576".
+
+    :return: The memory value in MiB.
+
+    :raises ValueError: If the quantity does not match the grammar.
+    """
+    return _parse_memory(str(quantity))
+
+
+def parse_cpu_many(quantities: Iterable[Quantity]) -> List[float]:
+    """
+    Parse a column of CPU quantities into millicores, parsing each distinct value once.
+
+    :param quantities: The CPU quantities to parse.
+
+    :return: The CPU values in millicores, in the same order.
+    """
+    parsed = {}
+    return [
+        parsed[quantity] if quantity in parsed
+        else parsed.setdefault(quantity, parse_cpu(quantity))
+        for quantity in quantities
+    ]
+
+
+def parse_memory_many(quantities: Iterable[Quantity]) -> List[float]:
+    """
+    Parse a column of memory quantities into MiB, parsing each distinct value once.
+
+    :param quantities: The memory quantities to parse.
+
+    :return: The memory values in MiB, in the same order.
+    """
+    parsed = {}
+    return [
+        parsed[quantity] if quantity in parsed
+        else parsed.setdefault(quantity, parse_memory(quantity))
+        for quantity in quantities
+    ]
@@ -0,0 +1,220 @@
+import json
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, NamedTuple, Optional, Tuple
+
+from .instrumentation import instrumentation
+
+if TYPE_CHECKING:
+    from kubernetes.client import ApiClient, V1Container, V1Node, V1Pod, V1ResourceQuota
+
+DEFAULT_PAGE_SIZE = 500
+# Pods of finished load tests stay around as Succeeded/Failed, but hold no resources
+ACTIVE_PODS_FIELD_SELECTOR = "status.phase!=Succeeded,status.phase!=Failed"
+
+
+class ContainerRecord(NamedTuple):
+    """ Resource requests and limits of a container, as quantity strings """
+    requests: Dict[str, str]
+    limits: Dict[str, str]
+
+
+class PodRecord(NamedTuple):
+    """ The few pod fields capacity accounting needs """
+    namespace: str
+    node_name: Optional[str]
+    containers: Tuple[ContainerRecord, ...]
+    init_containers: Tuple[ContainerRecord, ...] = ()
+    overhead: Dict[str, str] = {}
+
+
+class NodeRecord(NamedTuple):
+    """ The few node fields capacity accounting needs """
+    name: str
+    capacity: Dict[str, str]
+    allocatable: Dict[str, str]
+    schedulable: bool
+
+
+NO_SCHEDULE_EFFECTS = ("NoSchedule", "NoExecute")
+
+
+class QuotaRecord(NamedTuple):
+    """ The hard limits and usage of a resource quota, as quantity strings """
+    namespace: str
+    name: str
+    hard: Dict[str, str]
+    used: Dict[str, str]
+
+
+def list_raw(list_func: Callable, page_size: int = DEFAULT_PAGE_SIZE,
+             deadline: Optional[float] = None, **kwargs) -> Iterator[dict]:
+    """
+    Iterate over all items of a Kubernetes list call as plain JSON dicts.
+
+    The response is requested with `_preload_content=False`, so the generated client
+    does not build an OpenAPI model for every item; each page is decoded with `json`
+    and released before the next one is fetched.
+
+    :param list_func: a `CoreV1Api` list method, e.g. `list_pod_for_all_namespaces`.
+    :param page_size: the maximum number of items requested per page.
+    :param deadline: a `time.monotonic()` timestamp by which the whole list must finish;
+        every page is requested with the remaining time as its connect and read
+        `_request_timeout` (the client ignores a single float).
+    :param kwargs: extra arguments passed to every call of `list_func`.
+
+    :return: an iterator over the raw items of all pages.
+
+    :raises TimeoutError: If the deadline passes before the last page is fetched.
+    """
+    _continue = None
+    while True:
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Deadline exceeded while listing Kubernetes resources")
+            kwargs["_request_timeout"] = (remaining, remaining)
+        response = list_func(
+            limit=page_size, _continue=_continue, _preload_content=False, **kwargs
+        )
+        try:
+            data = response.data
+            page = json.loads(data)
+        finally:
+            response.release_conn()
+        instrumentation.record_page(list_func.__name__, len(data))
+        yield from page.get("items") or ()
+        _continue = (page.get("metadata") or {}).get("continue")
+        if not _continue:
+            return
+
+
+def list_raw_path(api_client: "ApiClient", path: str, page_size: int = DEFAULT_PAGE_SIZE,
+                  deadline: Optional[float] = None,
+                  headers: Optional[Dict[str, str]] = None) -> Iterator[dict]:
+    """
+    Same as `list_raw`, for a list endpoint the generated client has no method for.
+
+    :param api_client: the `ApiClient` of the cluster.
+    :param path: the path of the list endpoint, e.g. `/api/v1/namespaces`.
+    :param headers: extra request headers, e.g. an `Accept` asking for a projection.
+    """
+    _continue = None
+    while True:
+        query_params = [("limit", page_size)]
+        if _continue:
+            query_params.append(("continue", _continue))
+        kwargs = {}
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Deadline exceeded while listing Kubernetes resources")
+            kwargs["_request_timeout"] = (remaining, remaining)
+        response = api_client.call_api(
+            path, "GET",
+            query_params=query_params,
+            header_params={"Accept": "application/json", **(headers or {})},
+            auth_settings=["BearerToken"],
+            _preload_content=False,
+            _return_http_data_only=True,
+            **kwargs
+        )
+        try:
+            data = response.data
+            page = json.loads(data)
+        finally:
+            response.release_conn()
+        instrumentation.record_page(path, len(data))
+        yield from page.get("items") or ()
+        _continue = (page.get("metadata") or {}).get("continue")
+        if not _continue:
+            return
+
+
+def _container_record(container: dict) -> ContainerRecord:
+    resources = container.get("resources") or {}
+    return ContainerRecord(resources.get("requests") or {}, resources.get("limits") or {})
+
+
+def pod_record_from_raw(pod: dict) -> PodRecord:
+    spec = pod.get("spec") or {}
+    return PodRecord(
+        pod["metadata"].get("namespace"),
+        spec.get("nodeName"),
+        tuple(_container_record(container) for container in spec.get("containers") or ()),
+        tuple(
+            _container_record(container) for container in spec.get("initContainers") or ()
+        ),
+        spec.get("overhead") or {},
+    )
+
+
+def node_record_from_raw(node: dict) -> NodeRecord:
+    spec = node.get("spec") or {}
+    status = node.get("status") or {}
+    return NodeRecord(
+        node["metadata"]["name"],
+        status.get("capacity") or {},
+        status.get("allocatable") or {},
+        not spec.get("unschedulable") and not any(
+            taint.get("effect") in NO_SCHEDULE_EFFECTS for taint in spec.get("taints") or ()
+        ),
+    )
+
+
+def quota_record_from_raw(quota: dict) -> QuotaRecord:
+    status = quota.get("status") or {}
+    return QuotaRecord(
+        quota["metadata"].get("namespace"),
+        quota["metadata"]["name"],
+        status.get("hard") or {},
+        status.get("used") or {},
+    )
+
+
+def _container_record_from_model(container: "V1Container") -> ContainerRecord:
+    resources = container.resources
+    return ContainerRecord(
+        (resources and resources.requests) or {}, (resources and resources.limits) or {}
+    )
+
+
+def pod_record(pod: "V1Pod") -> PodRecord:
+    return PodRecord(
+        pod.metadata.namespace,
+        pod.spec.node_name,
+        tuple(_container_record_from_model(container) for container in pod.spec.containers),
+        tuple(
+            _container_record_from_model(container)
+            for container in pod.spec.init_containers or ()
+        ),
+        pod.spec.overhead or {},
+    )
+
+
+def node_record(node: "V1Node") -> NodeRecord:
+    spec = node.spec
+    return NodeRecord(
+        node.metadata.name,
+        node.status.capacity or {},
+        node.status.allocatable or {},
+        not (spec and spec.unschedulable) and not any(
+            taint.effect in NO_SCHEDULE_EFFECTS for taint in (spec and spec.taints) or ()
+        ),
+    )
+
+
+def quota_record(quota: "V1ResourceQuota") -> QuotaRecord:
+    return QuotaRecord(
+        quota.metadata.namespace,
+        quota.metadata.name,
+        (quota.status and quota.status.hard) or {},
+        (quota.status and quota.status.used) or {},
+    )
+
+
+def iter_node_records(list_func: Callable, **kwargs) -> Iterator[NodeRecord]:
+    return (node_record_from_raw(node) for node in list_raw(list_func, **kwargs))
+
+
+def iter_quota_records(list_func: Callable, **kwargs) -> Iterator[QuotaRecord]:
+    return (quota_record_from_raw(quota) for quota in list_raw(list_func, **kwargs))
@@ -0,0 +1,277 @@
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from .placement import NodeResources, PlacementPlan, plan_placement
+
+
+class Reservation(NamedTuple):
+    """ Capacity held for a launching test until it is released or expires """
+    id: str
+    cluster: tuple
+    namespace: str
+    cpu: float
+    memory: float
+    pods: int
+    nodes: Dict[str, Tuple[float, float, int]]
+    expires: float
+
+
+class ReservationLedger:
+    """
+    In-process ledger of capacity reserved by launching tests, per cluster and namespace.
+
+    Every test being launched (admitted, or given its execution plan) reserves its
+    runners and post-processor on the nodes its placement plan picked, so a concurrent
+    launch plans against what is left instead of the same free capacity. Reservations
+    only bridge the launch window: they are released explicitly once the test pods
+    exist, and are counted by the pod scan from then on, or expire after their TTL.
+
+    With a `path`, the ledger is kept in that JSON file instead, so the worker processes
+    of one host share it; every operation holds an `flock` on the file for its duration.
+    """
+
+    def __init__(self, ttl: float = 120.0, path: Optional[str] = None):
+        """
+        :param ttl: seconds a reservation is held unless released earlier; the time
+            a launched test takes to create its pods.
+        :param path: the file shared by all worker processes; None keeps the ledger
+            in memory.
+        """
+        self.ttl = ttl
+        self.path = path
+        self._reservations: Dict[str, Reservation] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, ttl: float = None, path: str = None) -> None:
+        if ttl is not None:
+            self.ttl = ttl
+        if path is not None:
+            self.path = path
+
+    @contextmanager
+    def _transaction(self, write: bool = True):
+        """ Hold the ledger, loading it from and saving it to the shared file if any """
+        with self._lock:
+            if self.path is None:
+                yield
+                return
+            with open(f"{self.path}.lock", "a+") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                self._reservations = self._read()
+                yield
+                if write:
+                    self._write()
+
+    def _read(self) -> Dict[str, Reservation]:
+        try:
+            with open(self.path) as file:
+                items = json.load(file)
+        except FileNotFoundError:
+            return {}
+        return {
+            item["id"]: Reservation(**{
+                **item,
+                "cluster": tuple(item["cluster"]),
+                "nodes": {node: tuple(reserved) for node, reserved in item["nodes"].items()},
+            })
+            for item in items
+        }
+
+    def _write(self) -> None:
+        descriptor, temporary = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.path)), suffix=".tmp"
+        )
+        with os.fdopen(descriptor, "w") as file:
+            json.dump([
+                reservation._asdict() for reservation in self._reservations.values()
+            ], file)
+        os.replace(temporary, self.path)
+
+    def reserve_placement(self, cluster: tuple, namespace: str, nodes: List[NodeResources],
+                          runners: int, runner_cpu: float, runner_memory: float,
+                          post_processor_cpu: float = 0, post_processor_memory: float = 0,
+                          ttl: float = None, replace: Optional[str] = None,
+                          place: Callable[..., PlacementPlan] = plan_placement
+                          ) -> Tuple[PlacementPlan, Optional[Reservation]]:
+        """
+        Plan the placement of a test on what is left after outstanding reservations,
+        and reserve it if it fits. Planning and reserving happen atomically.
+
+        :param cluster: the cluster identity, as `get_cluster_key`.
+        :param namespace: the namespace the test runs in.
+        :param nodes: the free resources of every schedulable node.
+        :param ttl: seconds the reservation is held; defaults to the ledger TTL.
+        :param replace: the id of a reservation the test already holds; its resources
+            count as free for the plan, and it is released if the plan is reserved.
+        :param place: the placement strategy, `plan_placement` or `spread_placement`.
+
+        The remaining parameters are the ones of `plan_placement`.
+
+        :return: the placement plan and the reservation, which is None if the plan
+                 is not feasible.
+        """
+        with self._transaction():
+            self._expire()
+            plan = place(
+                self._adjust_nodes(cluster, nodes, exclude=replace), runners, runner_cpu,
+                runner_memory, post_processor_cpu, post_processor_memory
+            )
+            if not plan.feasible:
+                return plan, None
+            if replace:
+                self._reservations.pop(replace, None)
+
+            reserved_nodes = _reserved_nodes(
+                plan, runner_cpu, runner_memory, post_processor_cpu, post_processor_memory
+            )
+            reservation = Reservation(
+                id=str(uuid.uuid4()),
+                cluster=tuple(cluster),
+                namespace=namespace,
+                cpu=sum(cpu for cpu, _, _ in reserved_nodes.values()),
+                memory=sum(memory for _, memory, _ in reserved_nodes.values()),
+                pods=sum(pods for _, _, pods in reserved_nodes.values()),
+                nodes=reserved_nodes,
+                expires=time.time() + (self.ttl if ttl is None else ttl),
+            )
+            self._reservations[reservation.id] = reservation
+        return plan, reservation
+
+    def release(self, reservation_id: str) -> bool:
+        """
+        Release a reservation.
+
+        :return: whether the reservation was still outstanding.
+        """
+        with self._transaction():
+            return self._reservations.pop(reservation_id, None) is not None
+
+    def clear(self) -> None:
+        """ Release every reservation """
+        with self._transaction():
+            self._reservations.clear()
+
+    def outstanding(self, cluster: tuple,
+                    namespace: Optional[str] = None) -> Tuple[float, float, int]:
+        """
+        Total CPU (millicores), memory (MiB) and pods reserved in a cluster, or only
+        in one of its namespaces.
+        """
+        with self._transaction(write=False):
+            self._expire()
+            reservations = [
+                reservation for reservation in self._reservations.values()
+                if reservation.cluster == tuple(cluster)
+                and namespace in (None, reservation.namespace)
+            ]
+        return (
+            sum(reservation.cpu for reservation in reservations),
+            sum(reservation.memory for reservation in reservations),
+            sum(reservation.pods for reservation in reservations),
+        )
+
+    def subtract_from_capacity(self, cluster: tuple, capacity: dict,
+                               namespace: Optional[str] = None) -> dict:
+        """
+        Subtract outstanding reservations from a capacity answer.
+
+        The resources a namespace quota limits ('quota_bound') are only reduced by the
+        reservations of that namespace, the others by those of the whole cluster.
+
+        :param cluster: the cluster identity, as `get_cluster_key`.
+        :param capacity: a dictionary with keys 'cpu', 'memory' and 'pods',
+                         as `get_cluster_capacity`.
+        :param namespace: the namespace the capacity was collected for.
+
+        :return: a new dictionary with the reserved resources subtracted, from the
+                 'used' capacity as well if present.
+        """
+        cluster_reserved = self.outstanding(cluster)
+        if not cluster_reserved[2]:
+            return capacity
+        quota_bound = capacity.get("quota_bound") or ()
+        namespace_reserved = self.outstanding(cluster, namespace) \
+            if quota_bound and namespace is not None else cluster_reserved
+        unreserved = {**capacity}
+        for index, key in enumerate(("cpu", "memory", "pods")):
+            reserved = namespace_reserved if key in quota_bound else cluster_reserved
+            unreserved[key] = capacity[key] - reserved[index]
+        if capacity.get("used") is not None:
+            unreserved["used"] = self.subtract_from_capacity(
+                cluster, capacity["used"], namespace
+            )
+        return unreserved
+
+    def adjust_nodes(self, cluster: tuple, nodes: List[NodeResources],
+                     exclude: Optional[str] = None) -> List[NodeResources]:
+        """
+        Subtract the per-node outstanding reservations from node free resources.
+
+        :param exclude: the id of a reservation to leave out, e.g. the one of the test
+            the nodes are looked at for.
+        """
+        with self._transaction(write=False):
+            self._expire()
+            return self._adjust_nodes(cluster, nodes, exclude)
+
+    def stats(self) -> dict:
+        with self._transaction(write=False):
+            self._expire()
+            return {
+                "ttl": self.ttl,
+                "outstanding": len(self._reservations),
+                "pods": sum(reservation.pods for reservation in self._reservations.values()),
+            }
+
+    def _adjust_nodes(self, cluster: tuple, nodes: List[NodeResources],
+                      exclude: Optional[str] = None) -> List[NodeResources]:
+        reserved = {}
+        for reservation in self._reservations.values():
+            if reservation.cluster != tuple(cluster) or reservation.id == exclude:
+                continue
+            for node, (cpu, memory, pods) in reservation.nodes.items():
+                total_cpu, total_memory, total_pods = reserved.get(node, (0.0, 0.0, 0))
+                reserved[node] = (total_cpu + cpu, total_memory + memory, total_pods + pods)
+        if not reserved:
+            return nodes
+        adjusted = []
+        for node in nodes:
+            cpu, memory, pods = reserved.get(node.name, (0.0, 0.0, 0))
+            adjusted.append(
+                NodeResources(node.name, node.cpu - cpu, node.memory - memory, node.pods - pods)
+            )
+        return adjusted
+
+    def _expire(self) -> None:
+        now = time.time()
+        for reservation_id in [
+            reservation.id for reservation in self._reservations.values()
+            if reservation.expires <= now
+        ]:
+            del self._reservations[reservation_id]
+
+
+def _reserved_nodes(plan: PlacementPlan, runner_cpu: float, runner_memory: float,
+                    post_processor_cpu: float, post_processor_memory: float
+                    ) -> Dict[str, Tuple[float, float, int]]:
+    """ The (cpu, memory, pods) a placement plan takes on every node """
+    reserved_nodes = {
+        node: (runner_cpu * count, runner_memory * count, count)
+        for node, count in plan.runners.items()
+    }
+    if plan.post_processor is not None:
+        cpu, memory, pods = reserved_nodes.get(plan.post_processor, (0.0, 0.0, 0))
+        reserved_nodes[plan.post_processor] = (
+            cpu + post_processor_cpu, memory + post_processor_memory, pods + 1
+        )
+    return reserved_nodes
+
+
+reservations = ReservationLedger()
@@ -0,0 +1,104 @@
+from typing import TYPE_CHECKING, Dict, Iterable, Optional, Tuple
+
+from pylon.core.tools import log
+
+from .capacity_cache import capacity_cache
+from .client_pool import get_cluster_key
+from .quantity import parse_cpu, parse_memory
+from .records import list_raw_path
+
+if TYPE_CHECKING:
+    from kubernetes.client import CoreV1Api
+
+POD_METRICS_PATH = "/apis/metrics.k8s.io/v1beta1/pods"
+
+
+class ResourceMetrics:
+    """
+    Optional mode reading actual pod utilization from the metrics API (metrics.k8s.io).
+
+    When enabled, capacity answers carry a 'used' headroom next to the reserved one:
+    every pod counts the larger of its requests and what it actually uses, instead of
+    the larger of its requests and limits.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+
+    def configure(self, enabled: bool = None) -> None:
+        if enabled is not None:
+            self.enabled = enabled
+
+
+def get_pod_metrics(
+        v1: "CoreV1Api", deadline: Optional[float] = None
+) -> Dict[Tuple[str, str], Tuple[float, float]]:
+    """
+    Read the current CPU and memory usage of every pod from the metrics API.
+
+    :param v1: a `CoreV1Api` object for interacting with the Kubernetes API.
+    :param deadline: an optional `time.monotonic()` deadline for the whole list.
+
+    :return: the (cpu, memory) usage in millicores and MiB per (namespace, pod name).
+    """
+    usage = {}
+    for item in list_raw_path(v1.api_client, POD_METRICS_PATH, deadline=deadline):
+        cpu, memory = 0.0, 0.0
+        for container in item.get("containers") or ():
+            container_usage = container.get("usage") or {}
+            cpu += parse_cpu(container_usage.get("cpu", "0"))
+            memory += parse_memory(container_usage.get("memory", "0"))
+        usage[(item["metadata"].get("namespace"), item["metadata"]["name"])] = (cpu, memory)
+    return usage
+
+
+def pods_utilization(
+        pod_requests: Iterable[Tuple[str, str, float, float]],
+        pod_metrics: Dict[Tuple[str, str], Tuple[float, float]]
+) -> Tuple[float, float, int]:
+    """
+    Calculate the resources held by pods from their actual usage.
+
+    A pod holds the larger of its requests, which the scheduler reserves whatever
+    the pod uses, and its actual usage. Pods without metrics yet hold their requests.
+
+    :param pod_requests: the (namespace, name, cpu, memory) requests of every pod, as
+        `ClusterState.pod_requests`, so the pods listed for the capacity are reused.
+    :param pod_metrics: the usage of the pods, as `get_pod_metrics`.
+
+    :return: the total CPU (millicores), memory (MiB) and number of pods.
+    """
+    cpu, memory, pods = 0.0, 0.0, 0
+    for namespace, name, request_cpu, request_memory in pod_requests:
+        used_cpu, used_memory = pod_metrics.get((namespace, name), (0.0, 0.0))
+        cpu += max(request_cpu, used_cpu)
+        memory += max(request_memory, used_memory)
+        pods += 1
+    return cpu, memory, pods
+
+
+def get_cached_pod_metrics(
+        v1: "CoreV1Api", deadline: Optional[float] = None
+) -> Optional[Dict[Tuple[str, str], Tuple[float, float]]]:
+    """
+    Same as `get_pod_metrics`, but served from the capacity snapshot cache, so the
+    metrics are fetched once per snapshot for all namespaces of the cluster.
+
+    :return: None if the metrics mode is disabled or the metrics API is not available.
+    """
+    if not resource_metrics.enabled:
+        return None
+
+    from kubernetes.client.rest import ApiException
+
+    def compute() -> Optional[Dict[Tuple[str, str], Tuple[float, float]]]:
+        try:
+            return get_pod_metrics(v1, deadline)
+        except ApiException as exc:
+            log.warning("Metrics API is not available: %s", exc.reason)
+            return None
+
+    return capacity_cache.get(("pod_metrics", *get_cluster_key(v1.api_client)), compute)
+
+
+resource_metrics = ResourceMetrics()
@@ -0,0 +1,81 @@
+import fcntl
+import hashlib
+import os
+import pickle
+import tempfile
+import time
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+from pylon.core.tools import log
+
+
+class FileSharedCache:
+    """
+    Capacity snapshots shared by the worker processes of one host through local files.
+
+    Every key has an entry file holding the snapshot and its creation time, and a lock
+    file. A worker finding the entry expired takes the lock with `flock` and rescans;
+    the other workers meanwhile keep reading the expired entry, or wait on the lock if
+    there is none yet. So a cluster is scanned once per TTL however many workers ask.
+
+    The entries are pickled, so the directory must only be writable by the service.
+    """
+
+    def __init__(self, directory: str):
+        """
+        :param directory: where entry and lock files are kept; created private.
+        """
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self.directory = directory
+
+    def get(self, key: Hashable, compute: Callable[[], Any],
+            ttl: float) -> Tuple[Any, float]:
+        """
+        Return the shared snapshot for `key`, computing it with `compute` if it expired
+        and no other worker is already doing so.
+
+        :return: the snapshot and its age in seconds.
+        """
+        entry = self._read(key)
+        if entry is not None and time.time() - entry[0] < ttl:
+            return entry[1], time.time() - entry[0]
+        with open(self._path(key, "lock"), "a+") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                if entry is not None:
+                    return entry[1], time.time() - entry[0]
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            entry = self._read(key)
+            if entry is not None and time.time() - entry[0] < ttl:
+                return entry[1], time.time() - entry[0]
+            value = compute()
+            self._write(key, value)
+        return value, 0.0
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """ Share a snapshot computed outside of `get` """
+        self._write(key, value)
+
+    def _path(self, key: Hashable, suffix: str) -> str:
+        digest = hashlib.sha256(repr(key).encode()).hexdigest()[:32]
+        return os.path.join(self.directory, f"{digest}.{suffix}")
+
+    def _read(self, key: Hashable) -> Optional[Tuple[float, Any]]:
+        try:
+            with open(self._path(key, "entry"), "rb") as file:
+                return pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, pickle.UnpicklingError) as exc:
+            log.warning("Ignoring unreadable shared capacity entry: %s", exc)
+            return None
+
+    def _write(self, key: Hashable, value: Any) -> None:
+        try:
+            descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(descriptor, "wb") as file:
+                pickle.dump((time.time(), value), file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self._path(key, "entry"))
+        except OSError as exc:
+            log.warning("Failed to share capacity entry: %s", exc)
@@ -0,0 +1,270 @@
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from array import array
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from pylon.core.tools import log
+
+from .cluster_state import COLUMNS, ClusterState, _Interner
+
+MAGIC = b"K8SSNAP\x00"
+FORMAT_VERSION = 3
+
+# magic, format version, number of sections
+_HEADER = struct.Struct("<8sHI")
+# section kind, payload length
+_SECTION = struct.Struct("<BQ")
+# created (unix time), cpu, memory, pods, has used capacity, used cpu, memory, pods
+_CAPACITY = struct.Struct("<dddqBddq")
+_STRING_LENGTH = struct.Struct("<H")
+_COLUMN = struct.Struct("<cQ")
+_FLOAT = struct.Struct("<d")
+
+SECTION_CAPACITY = 1
+SECTION_STATE = 2
+
+
+def _pack_string(value: str) -> bytes:
+    data = value.encode()
+    return _STRING_LENGTH.pack(len(data)) + data
+
+
+def _unpack_string(buffer, offset: int) -> Tuple[str, int]:
+    (length,) = _STRING_LENGTH.unpack_from(buffer, offset)
+    offset += _STRING_LENGTH.size
+    return bytes(buffer[offset:offset + length]).decode(), offset + length
+
+
+class _ClusterSnapshot:
+    """ What is persisted for one cluster """
+
+    def __init__(self):
+        self.capacity: Dict[str, Tuple[float, dict]] = {}
+        self.state: Optional[ClusterState] = None
+        self.state_created = 0.0
+        self.dirty = False
+        self.written = 0.0
+
+
+def _encode(snapshot: _ClusterSnapshot) -> bytes:
+    sections = []
+    for namespace, (created, capacity) in snapshot.capacity.items():
+        used = capacity.get("used")
+        sections.append((SECTION_CAPACITY, _pack_string(namespace) + _CAPACITY.pack(
+            created, capacity["cpu"], capacity["memory"], int(capacity["pods"]),
+            used is not None, *(
+                (used["cpu"], used["memory"], int(used["pods"])) if used else (0.0, 0.0, 0)
+            )
+        )))
+    state = snapshot.state
+    if state is not None:
+        parts = [_FLOAT.pack(snapshot.state_created)]
+        for names in (state.namespaces.names, state.nodes.names):
+            parts.append(struct.pack("<I", len(names)))
+            parts.extend(_pack_string(name) for name in names)
+        for column in COLUMNS:
+            values = getattr(state, column)
+            data = values.tobytes()
+            parts.append(_COLUMN.pack(values.typecode.encode(), len(data)))
+            parts.append(data)
+        sections.append((SECTION_STATE, b"".join(parts)))
+    return b"".join(
+        [_HEADER.pack(MAGIC, FORMAT_VERSION, len(sections))] +
+        [_SECTION.pack(kind, len(payload)) + payload for kind, payload in sections]
+    )
+
+
+def _decode(buffer) -> _ClusterSnapshot:
+    magic, version, count = _HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format {magic!r} v{version}")
+    snapshot = _ClusterSnapshot()
+    offset = _HEADER.size
+    for _ in range(count):
+        kind, length = _SECTION.unpack_from(buffer, offset)
+        offset += _SECTION.size
+        end = offset + length
+        if kind == SECTION_CAPACITY:
+            namespace, position = _unpack_string(buffer, offset)
+            created, cpu, memory, pods, has_used, used_cpu, used_memory, used_pods = \
+                _CAPACITY.unpack_from(buffer, position)
+            capacity = {"cpu": cpu, "memory": memory, "pods": pods}
+            if has_used:
+                capacity["used"] = {"cpu": used_cpu, "memory": used_memory, "pods": used_pods}
+            snapshot.capacity[namespace] = (created, capacity)
+        elif kind == SECTION_STATE:
+            (snapshot.state_created,) = _FLOAT.unpack_from(buffer, offset)
+            position = offset + _FLOAT.size
+            state = ClusterState()
+            for attribute in ("namespaces", "nodes"):
+                (names_count,) = struct.unpack_from("<I", buffer, position)
+                position += 4
+                names = []
+                for _ in range(names_count):
+                    name, position = _unpack_string(buffer, position)
+                    names.append(name)
+                setattr(state, attribute, _Interner(names))
+            for column in COLUMNS:
+                typecode, size = _COLUMN.unpack_from(buffer, position)
+                position += _COLUMN.size
+                values = array(typecode.decode())
+                values.frombytes(buffer[position:position + size])
+                position += size
+                setattr(state, column, values)
+            snapshot.state = state
+        # unknown sections are skipped, so newer writers stay readable
+        offset = end
+    return snapshot
+
+
+class SnapshotStore:
+    """
+    Persists capacity snapshots to local files, so a restarted worker starts warm.
+
+    There is one file per cluster identity (hostname, token fingerprint,
+    secure_connection), in a versioned binary format read through `mmap`. A file holds
+    the capacity answer of every namespace checked and the columnar pod/node state the
+    node free resources are computed from. Files are only read when a cluster is first
+    asked for, and every snapshot is handed out once: the capacity cache serves it while
+    a fresh scan runs. A snapshot is never resumed from: it is only a stand-in until
+    that scan replaces it.
+
+    Node free resources decide placements and admissions, so their snapshots are only
+    served for `nodes_max_age` seconds, about the capacity cache TTL; older ones are
+    rescanned rather than trusted.
+
+    Writes are throttled to one per cluster every `write_interval` seconds; `flush`
+    writes what is left.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_age: float = 3600.0,
+                 nodes_max_age: float = 30.0, write_interval: float = 30.0):
+        """
+        :param directory: where snapshot files are kept; None disables persistence.
+        :param max_age: seconds after which a persisted snapshot is no longer served.
+        :param nodes_max_age: the same for node free resources snapshots.
+        :param write_interval: the minimum seconds between two writes of a cluster file.
+        """
+        self.directory = directory
+        self.max_age = max_age
+        self.nodes_max_age = nodes_max_age
+        self.write_interval = write_interval
+        self._clusters: Dict[tuple, _ClusterSnapshot] = {}
+        self._loaded: Dict[tuple, _ClusterSnapshot] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    def configure(self, directory: str = None, max_age: float = None,
+                  nodes_max_age: float = None, write_interval: float = None) -> None:
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self.directory = directory
+        if max_age is not None:
+            self.max_age = max_age
+        if nodes_max_age is not None:
+            self.nodes_max_age = nodes_max_age
+        if write_interval is not None:
+            self.write_interval = write_interval
+
+    def load(self, key: Hashable) -> Optional[Tuple[Any, float]]:
+        """
+        Hand out the persisted snapshot for a capacity cache key, once.
+
+        :return: the snapshot and its age in seconds, or None if there is none.
+        """
+        kind, cluster = key[0], tuple(key[1:4])
+        if not self.enabled or kind not in ("capacity", "nodes"):
+            return None
+        with self._lock:
+            loaded = self._loaded.get(cluster)
+            if loaded is None:
+                loaded = self._loaded[cluster] = self._read(cluster) or _ClusterSnapshot()
+            if kind == "capacity":
+                created, value = loaded.capacity.pop(key[4], (0.0, None))
+            else:
+                created, value = loaded.state_created, loaded.state
+                loaded.state = None
+                value = value.nodes_free_resources() if value is not None else None
+        age = time.time() - created
+        if value is None or age > (self.max_age if kind == "capacity" else self.nodes_max_age):
+            return None
+        return value, age
+
+    def save(self, key: Hashable, value: Any) -> None:
+        """ Record a fresh capacity snapshot, writing the cluster file if it is due """
+        if not self.enabled or key[0] != "capacity":
+            return
+        cluster = tuple(key[1:4])
+        with self._lock:
+            snapshot = self._clusters.setdefault(cluster, _ClusterSnapshot())
+            snapshot.capacity[key[4]] = (time.time(), value)
+            snapshot.dirty = True
+        self._write_if_due(cluster)
+
+    def save_state(self, cluster: tuple, state: ClusterState) -> None:
+        """ Record the columnar pod/node state of a cluster """
+        if not self.enabled:
+            return
+        cluster = tuple(cluster)
+        with self._lock:
+            snapshot = self._clusters.setdefault(cluster, _ClusterSnapshot())
+            snapshot.state = state
+            snapshot.state_created = time.time()
+            snapshot.dirty = True
+        self._write_if_due(cluster)
+
+    def flush(self) -> None:
+        """ Write every cluster file with unsaved snapshots """
+        with self._lock:
+            clusters = [
+                cluster for cluster, snapshot in self._clusters.items() if snapshot.dirty
+            ]
+        for cluster in clusters:
+            self._write(cluster)
+
+    def _path(self, cluster: tuple) -> str:
+        digest = hashlib.sha256(repr(cluster).encode()).hexdigest()[:32]
+        return os.path.join(self.directory, f"{digest}.snap")
+
+    def _read(self, cluster: tuple) -> Optional[_ClusterSnapshot]:
+        path = self._path(cluster)
+        try:
+            with open(path, "rb") as file:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    return _decode(buffer)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, struct.error) as exc:
+            log.warning("Ignoring unreadable capacity snapshot %s: %s", path, exc)
+            return None
+
+    def _write_if_due(self, cluster: tuple) -> None:
+        with self._lock:
+            due = time.monotonic() - self._clusters[cluster].written >= self.write_interval
+        if due:
+            self._write(cluster)
+
+    def _write(self, cluster: tuple) -> None:
+        with self._lock:
+            snapshot = self._clusters[cluster]
+            data = _encode(snapshot)
+            snapshot.dirty = False
+            snapshot.written = time.monotonic()
+        try:
+            descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(data)
+            os.replace(temporary, self._path(cluster))
+        except OSError as exc:
+            log.warning("Failed to persist capacity snapshot: %s", exc)
+
+
+snapshot_store = SnapshotStore()